@@ -1,3 +1,12 @@
 from django.contrib import admin
+from .models import CustomField, BaseRate
 
 # Register your models here.
+@admin.register(CustomField)
+class CustomFieldAdmin(admin.ModelAdmin):
+    list_display = ('name', 'field_type', 'required', 'default_value')
+
+@admin.register(BaseRate)
+class BaseRateAdmin(admin.ModelAdmin):
+    list_display = ('base_rate', 'effective_date', 'rate')
+    list_filter = ('base_rate',)
@@ -0,0 +1,350 @@
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+import math
+
+import numpy as np
+
+
+# Payments per year for each supported Loan.REPAYMENT_FREQUENCY_CHOICES value.
+# 'CUSTOM' frequencies are free text and cannot be scheduled automatically.
+PAYMENTS_PER_YEAR = {
+    'WEEKLY': 52,
+    'BI_WEEKLY': 26,
+    'MONTHLY': 12,
+    'SEMI_MONTHLY': 24,
+    'QUARTERLY': 4,
+    'SEMI_ANNUAL': 2,
+    'ANNUAL': 1,
+}
+
+# Rates are stored as percentages with four decimal places (e.g. 7.2500), so a rate
+# unit is one millionth of the annual rate. Balances are carried in whole cents,
+# which keeps every interest and principal calculation in exact integer arithmetic.
+RATE_UNITS = 1000000
+CENT = Decimal('0.01')
+
+# Columns required to build a schedule; used with .values() so batch runs never
+# instantiate Loan objects.
+LOAN_TERM_FIELDS = (
+    'loan_number',
+    'loan_amount',
+    'loan_term',
+    'loan_amortization',
+    'repayment_frequency',
+    'repayment_type',
+    'period_1_interest_rate_type',
+    'period_1_full_rate',
+    'period_2_interest_rate_type',
+    'period_2_full_rate',
+    'floor_rate',
+    'ceiling_rate',
+    'first_interest_rate_adjustment_date',
+)
+
+
+def _value(loan, name):
+    if isinstance(loan, dict):
+        return loan.get(name)
+    return getattr(loan, name)
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def to_rate_units(rate):
+    return int((Decimal(rate) * (RATE_UNITS // 100)).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (Decimal(int(cents)) * CENT).quantize(CENT)
+
+
+def clamp_rate(rate, rate_type, floor_rate, ceiling_rate):
+    # Floors and ceilings only constrain variable pricing; a ceiling of zero means none was set.
+    rate = Decimal(rate)
+    if rate_type == 'VARIABLE':
+        if floor_rate is not None:
+            rate = max(rate, Decimal(floor_rate))
+        if ceiling_rate is not None and Decimal(ceiling_rate) > 0:
+            rate = min(rate, Decimal(ceiling_rate))
+    return rate
+
+
+def _payments_in_months(months, payments_per_year):
+    return (months * payments_per_year + 6) // 12
+
+
+def payments_before(first_payment_date, adjustment_date, repayment_frequency):
+    # Number of scheduled payments falling before the given date.
+    if adjustment_date <= first_payment_date:
+        return 0
+    payments_per_year = PAYMENTS_PER_YEAR[repayment_frequency]
+    if repayment_frequency in ('WEEKLY', 'BI_WEEKLY'):
+        interval = 7 if repayment_frequency == 'WEEKLY' else 14
+        return math.ceil((adjustment_date - first_payment_date).days / interval)
+    if repayment_frequency == 'SEMI_MONTHLY':
+        return math.ceil((adjustment_date - first_payment_date).days * 24 / 365)
+    months = (adjustment_date.year - first_payment_date.year) * 12 + adjustment_date.month - first_payment_date.month
+    if adjustment_date.day > first_payment_date.day:
+        months += 1
+    return math.ceil(months * payments_per_year / 12)
+
+
+def loan_terms(loan, first_payment_date=None):
+    # Normalizes a Loan (or a .values() row) into the integer terms used by the schedule engines.
+    # Period 2 pricing starts with the first payment on or after first_interest_rate_adjustment_date;
+    # without a first payment date to anchor the schedule, the whole term uses Period 1 pricing.
+    repayment_frequency = _value(loan, 'repayment_frequency')
+    if repayment_frequency not in PAYMENTS_PER_YEAR:
+        raise ValueError(f'Repayment frequency {repayment_frequency!r} cannot be scheduled.')
+    repayment_type = _value(loan, 'repayment_type')
+    if repayment_type not in ('INTEREST_ONLY', 'PRINCIPAL_AND_INTEREST'):
+        raise ValueError(f'Repayment type {repayment_type!r} cannot be scheduled.')
+
+    payments_per_year = PAYMENTS_PER_YEAR[repayment_frequency]
+    term_payments = max(_payments_in_months(_value(loan, 'loan_term'), payments_per_year), 1)
+    amortization_payments = max(_payments_in_months(_value(loan, 'loan_amortization'), payments_per_year), 1)
+    floor_rate = _value(loan, 'floor_rate')
+    ceiling_rate = _value(loan, 'ceiling_rate')
+
+    rate_1 = clamp_rate(_value(loan, 'period_1_full_rate'), _value(loan, 'period_1_interest_rate_type'), floor_rate, ceiling_rate)
+    period_2_full_rate = _value(loan, 'period_2_full_rate')
+    adjustment_date = _value(loan, 'first_interest_rate_adjustment_date')
+    if period_2_full_rate is not None and first_payment_date is not None and adjustment_date is not None:
+        rate_2 = clamp_rate(period_2_full_rate, _value(loan, 'period_2_interest_rate_type'), floor_rate, ceiling_rate)
+        rate_switch = payments_before(first_payment_date, adjustment_date, repayment_frequency)
+    else:
+        rate_2 = rate_1
+        rate_switch = term_payments
+
+    return {
+        'principal': to_cents(_value(loan, 'loan_amount')),
+        'rate_1': to_rate_units(rate_1),
+        'rate_2': to_rate_units(rate_2),
+        'rate_switch': rate_switch,
+        'term_payments': term_payments,
+        'amortization_payments': amortization_payments,
+        'payments_per_year': payments_per_year,
+        'interest_only': repayment_type == 'INTEREST_ONLY',
+    }
+
+
+def _round_half_up_div(numerator, denominator):
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def _periodic_interest(balance, rate, payments_per_year):
+    # balance * rate / (RATE_UNITS * payments_per_year), rounded half-up to the cent. Splitting
+    # the balance by the denominator first keeps the products well inside int64 for any
+    # balance a DecimalField(max_digits=15) can hold.
+    denominator = RATE_UNITS * payments_per_year
+    quotient, remainder = divmod(balance, denominator)
+    return quotient * rate + _round_half_up_div(remainder * rate, denominator)
+
+
+def level_payment(balance, rate, payments_per_year, payments):
+    # Level principal and interest payment in cents, computed exactly with Decimal.
+    if payments <= 0:
+        return balance
+    if rate == 0:
+        return _round_half_up_div(balance, payments)
+    with localcontext() as ctx:
+        ctx.prec = 40
+        periodic_rate = Decimal(rate) / (RATE_UNITS * payments_per_year)
+        payment = Decimal(balance) * periodic_rate / (1 - (1 + periodic_rate) ** -payments)
+        return int(payment.to_integral_value(ROUND_HALF_UP))
+
+
+def _level_payments(balance, rate, payments_per_year, payments):
+    # Vectorized level_payment. Float64 is exact to far better than a cent for any realistic
+    # balance, so only results landing within rounding noise of a half cent are handed back
+    # to the Decimal implementation; that keeps the batch engine identical to the reference.
+    balance_f = balance.astype(np.float64)
+    periods = np.maximum(payments, 1).astype(np.float64)
+    periodic_rate = rate / (RATE_UNITS * payments_per_year.astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amortizing = balance_f * periodic_rate / -np.expm1(-periods * np.log1p(periodic_rate))
+    rounded = np.floor(np.nan_to_num(amortizing) + 0.5).astype(np.int64)
+    result = np.where(rate > 0, rounded, _round_half_up_div(balance, np.maximum(payments, 1)))
+    result = np.where(payments <= 0, balance, result)
+
+    tolerance = np.maximum(1e-6, np.abs(amortizing) * 1e-11)
+    ambiguous = (payments > 0) & (rate > 0) & (np.abs(amortizing - np.floor(amortizing) - 0.5) < tolerance)
+    for i in np.flatnonzero(ambiguous):
+        result[i] = level_payment(int(balance[i]), int(rate[i]), int(payments_per_year[i]), int(payments[i]))
+    return result
+
+
+def reference_schedule(terms):
+    # Scalar reference implementation; the batch engine must match it to the cent.
+    balance = terms['principal']
+    payment = 0
+    rows = []
+    for k in range(terms['term_payments']):
+        rate = terms['rate_1'] if k < terms['rate_switch'] else terms['rate_2']
+        if not terms['interest_only'] and (k == 0 or k == terms['rate_switch']):
+            payment = level_payment(balance, rate, terms['payments_per_year'], terms['amortization_payments'] - k)
+        interest = _periodic_interest(balance, rate, terms['payments_per_year'])
+        if k == terms['term_payments'] - 1 or (not terms['interest_only'] and k == terms['amortization_payments'] - 1):
+            principal = balance
+        elif terms['interest_only']:
+            principal = 0
+        else:
+            principal = min(max(payment - interest, 0), balance)
+        balance -= principal
+        rows.append((interest + principal, interest, principal, balance))
+    return rows
+
+
+def _schedule(principal, rate_in, recalculate_in, periods, term_payments, amortization_payments, payments_per_year, interest_only):
+    # Shared loop of the batch engines: `rate_in(k)` gives every loan's rate for period k and
+    # `recalculate_in(k)` the loans whose level payment is recalculated at period k.
+    loans = principal.shape[0]
+    payment_out = np.zeros((loans, periods), dtype=np.int64)
+    interest_out = np.zeros((loans, periods), dtype=np.int64)
+    principal_out = np.zeros((loans, periods), dtype=np.int64)
+    balance_out = np.zeros((loans, periods), dtype=np.int64)
+
+    balance = principal.copy()
+    level = np.zeros(loans, dtype=np.int64)
+    for k in range(periods):
+        active = k < term_payments
+        rate = rate_in(k)
+
+        recalculate = active & ~interest_only & recalculate_in(k)
+        if recalculate.any():
+            level[recalculate] = _level_payments(
+                balance[recalculate], rate[recalculate], payments_per_year[recalculate],
+                amortization_payments[recalculate] - k,
+            )
+
+        interest = _periodic_interest(balance, rate, payments_per_year)
+        amortizing = np.minimum(np.maximum(level - interest, 0), balance)
+        paid_off = (k == term_payments - 1) | (~interest_only & (k == amortization_payments - 1))
+        principal_paid = np.where(paid_off, balance, np.where(interest_only, 0, amortizing))
+
+        interest = np.where(active, interest, 0)
+        principal_paid = np.where(active, principal_paid, 0)
+        balance = balance - principal_paid
+
+        payment_out[:, k] = interest + principal_paid
+        interest_out[:, k] = interest
+        principal_out[:, k] = principal_paid
+        balance_out[:, k] = balance
+
+    return payment_out, interest_out, principal_out, balance_out
+
+
+def amortize(principal, rate_1, rate_2, rate_switch, term_payments, amortization_payments, payments_per_year, interest_only):
+    # Batched schedule engine. Every argument is a 1-d array with one entry per loan; the loop
+    # runs over payment periods while each period is computed for all loans at once.
+    # Returns (payment, interest, principal, balance) as int64 cent arrays of shape (loans, periods).
+    principal = np.asarray(principal, dtype=np.int64)
+    rate_1 = np.asarray(rate_1, dtype=np.int64)
+    rate_2 = np.asarray(rate_2, dtype=np.int64)
+    rate_switch = np.asarray(rate_switch, dtype=np.int64)
+    term_payments = np.asarray(term_payments, dtype=np.int64)
+    periods = int(term_payments.max()) if principal.shape[0] else 0
+    return _schedule(
+        principal,
+        lambda k: np.where(k < rate_switch, rate_1, rate_2),
+        lambda k: (k == 0) | (k == rate_switch),
+        periods,
+        term_payments,
+        np.asarray(amortization_payments, dtype=np.int64),
+        np.asarray(payments_per_year, dtype=np.int64),
+        np.asarray(interest_only, dtype=bool),
+    )
+
+
+def amortize_rates(principal, rates, term_payments, amortization_payments, payments_per_year, interest_only):
+    # Batched schedule engine for rates that change from period to period: `rates` is an array of
+    # shape (loans, periods) in rate units and the level payment is recalculated whenever a loan's
+    # rate changes. Only the periods covered by `rates` are scheduled, so a short rate matrix
+    # gives the start of each schedule. Returns the same arrays as amortize.
+    rates = np.asarray(rates, dtype=np.int64)
+    changed = np.ones_like(rates, dtype=bool)
+    changed[:, 1:] = rates[:, 1:] != rates[:, :-1]
+    return _schedule(
+        np.asarray(principal, dtype=np.int64),
+        lambda k: rates[:, k],
+        lambda k: changed[:, k],
+        rates.shape[1],
+        np.asarray(term_payments, dtype=np.int64),
+        np.asarray(amortization_payments, dtype=np.int64),
+        np.asarray(payments_per_year, dtype=np.int64),
+        np.asarray(interest_only, dtype=bool),
+    )
+
+
+class ScheduleBatch:
+    # Payment schedules for many loans held as cent arrays of shape (loans, periods).
+
+    def __init__(self, loan_numbers, terms, payment, interest, principal, balance):
+        self.loan_numbers = loan_numbers
+        self.terms = terms
+        self.payment = payment
+        self.interest = interest
+        self.principal = principal
+        self.balance = balance
+
+    def __len__(self):
+        return len(self.loan_numbers)
+
+    def index(self, loan_number):
+        return self.loan_numbers.index(loan_number)
+
+    def rows(self, index):
+        return _schedule_rows(
+            zip(self.payment[index], self.interest[index], self.principal[index], self.balance[index]),
+            int(self.terms['term_payments'][index]),
+        )
+
+    def total_interest(self):
+        return self.interest.sum(axis=1)
+
+
+def _schedule_rows(rows, periods):
+    return [
+        {
+            'period': k + 1,
+            'payment': from_cents(payment),
+            'interest': from_cents(interest),
+            'principal': from_cents(principal),
+            'balance': from_cents(balance),
+        }
+        for k, (payment, interest, principal, balance) in enumerate(rows)
+        if k < periods
+    ]
+
+
+def payment_schedule(loan, first_payment_date=None):
+    # Full payment schedule for a single Loan, computed with the scalar reference engine.
+    terms = loan_terms(loan, first_payment_date)
+    return _schedule_rows(reference_schedule(terms), terms['term_payments'])
+
+
+def batch_schedules(loans, first_payment_dates=None):
+    # Schedules for every loan in `loans` (a Loan queryset, or an iterable of Loans or .values()
+    # rows) in a single NumPy pass. `first_payment_dates` optionally maps loan_number to the
+    # first payment date used to place Period 2 pricing.
+    if hasattr(loans, 'values') and hasattr(loans, 'model'):
+        loans = loans.values(*LOAN_TERM_FIELDS).iterator(chunk_size=2000)
+    first_payment_dates = first_payment_dates or {}
+
+    loan_numbers = []
+    columns = {}
+    for loan in loans:
+        loan_number = _value(loan, 'loan_number')
+        terms = loan_terms(loan, first_payment_dates.get(loan_number))
+        loan_numbers.append(loan_number)
+        for key, value in terms.items():
+            columns.setdefault(key, []).append(value)
+
+    terms = {
+        key: np.asarray(columns.get(key, []), dtype=bool if key == 'interest_only' else np.int64)
+        for key in ('principal', 'rate_1', 'rate_2', 'rate_switch', 'term_payments',
+                    'amortization_payments', 'payments_per_year', 'interest_only')
+    }
+    arrays = amortize(**terms)
+    return ScheduleBatch(loan_numbers, terms, *arrays)
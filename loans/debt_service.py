@@ -0,0 +1,87 @@
+import numpy as np
+from django.core.cache import cache
+
+from .amortization import LOAN_TERM_FIELDS, PAYMENTS_PER_YEAR, batch_schedules, from_cents
+from .models import Loan
+
+# Annual debt service of each borrower's loans, split into existing and proposed, for DSCR.
+# Computed from the loans' amortization schedules in one batch, cached per borrower and dropped
+# whenever one of the borrower's loans is saved, deleted, imported or repriced.
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Loan statuses carrying debt service, and the key each is reported under.
+DEBT_SERVICE_STATUSES = {'EXISTING': 'existing', 'PROPOSED': 'proposed'}
+
+SCHEDULED_REPAYMENT_TYPES = ('INTEREST_ONLY', 'PRINCIPAL_AND_INTEREST')
+
+
+def cache_key(affiliate_id):
+    return f'loans:debt_service:{affiliate_id}'
+
+
+def invalidate(affiliate_ids):
+    cache.delete_many([cache_key(affiliate_id) for affiliate_id in set(affiliate_ids) if affiliate_id is not None])
+
+
+def schedulable(loan):
+    return loan['repayment_frequency'] in PAYMENTS_PER_YEAR and loan['repayment_type'] in SCHEDULED_REPAYMENT_TYPES
+
+
+def annual_debt_service(schedules):
+    # Annual debt service of every loan in a ScheduleBatch, in cents: the first year's scheduled
+    # payments. Loans maturing within a year have their regular payment annualized instead, so a
+    # balloon at maturity is not counted as a year's debt service.
+    if not len(schedules):
+        return np.zeros(0, dtype=np.int64)
+    terms = schedules.terms
+    payments_per_year = terms['payments_per_year']
+    first_year = np.arange(schedules.payment.shape[1]) < payments_per_year[:, np.newaxis]
+    first_year_payments = (schedules.payment * first_year).sum(axis=1)
+    fully_amortizing = ~terms['interest_only'] & (terms['amortization_payments'] <= terms['term_payments'])
+    regular = np.where(
+        terms['term_payments'] > 1,
+        schedules.payment[:, 0],
+        schedules.interest[:, 0] + np.where(fully_amortizing, schedules.principal[:, 0], 0),
+    )
+    return np.where(terms['term_payments'] > payments_per_year, first_year_payments, regular * payments_per_year)
+
+
+def compute(affiliate_ids):
+    # {borrower id: {'existing': Decimal, 'proposed': Decimal, 'unscheduled': [loan number, ...]}}.
+    # Loans with custom or modified repayment cannot be scheduled and are listed instead.
+    results = {affiliate_id: {'existing': 0, 'proposed': 0, 'unscheduled': []} for affiliate_id in affiliate_ids}
+    loans = (
+        Loan.objects
+        .filter(borrower_id__in=affiliate_ids, loan_status__in=list(DEBT_SERVICE_STATUSES))
+        .order_by('loan_number')
+        .values('borrower_id', 'loan_status', *LOAN_TERM_FIELDS)
+    )
+    scheduled = []
+    for loan in loans:
+        if schedulable(loan):
+            scheduled.append(loan)
+        else:
+            results[loan['borrower_id']]['unscheduled'].append(loan['loan_number'])
+
+    for loan, cents in zip(scheduled, annual_debt_service(batch_schedules(scheduled))):
+        results[loan['borrower_id']][DEBT_SERVICE_STATUSES[loan['loan_status']]] += int(cents)
+    for result in results.values():
+        result['existing'] = from_cents(result['existing'])
+        result['proposed'] = from_cents(result['proposed'])
+    return results
+
+
+def debt_service(affiliate_ids):
+    # Annual debt service by borrower (see compute). Only borrowers missing from the cache are
+    # scheduled, all together in one batch.
+    affiliate_ids = list(dict.fromkeys(affiliate_ids))
+    keys = {affiliate_id: cache_key(affiliate_id) for affiliate_id in affiliate_ids}
+    cached = cache.get_many(keys.values())
+    results = {affiliate_id: cached[key] for affiliate_id, key in keys.items() if key in cached}
+    missing = [affiliate_id for affiliate_id in affiliate_ids if affiliate_id not in results]
+    if missing:
+        computed = compute(missing)
+        cache.set_many({keys[affiliate_id]: result for affiliate_id, result in computed.items()}, CACHE_TIMEOUT)
+        results.update(computed)
+    return results
@@ -0,0 +1,190 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from relationships.models import Business, Individual
+from users.models import User
+from .models import Loan, ExposureSummary
+
+# User types allowed to open the exposure dashboards (besides staff).
+EXECUTIVE_USER_TYPES = ('CHIEF_CREDIT_OFFICER', 'CHIEF_LENDING_OFFICER')
+
+# Loan fields captured when a Loan is loaded so a later save can remove its old contribution.
+SNAPSHOT_FIELDS = ('loan_program', 'loan_type', 'loan_officer_id', 'portfolio_manager_id', 'borrower_id', 'loan_amount')
+
+# Dimensions read straight off the loan row, mapped to the loan attribute holding the key.
+LOAN_DIMENSIONS = {
+    'loan_program': 'loan_program',
+    'loan_type': 'loan_type',
+    'loan_officer': 'loan_officer_id',
+    'portfolio_manager': 'portfolio_manager_id',
+}
+LOCATION_DIMENSIONS = ('borrower_state', 'borrower_county')
+
+
+def _key(value):
+    return '' if value is None else str(value)
+
+
+def location_keys(state, county):
+    return {
+        'borrower_state': state or '',
+        'borrower_county': f'{county}, {state}' if county else '',
+    }
+
+
+def borrower_location(affiliate_id):
+    # A borrower's location is its first business's address, else its first individual's.
+    for model in (Business, Individual):
+        location = model.objects.filter(affiliate_id=affiliate_id).order_by('pk').values_list('state', 'county').first()
+        if location:
+            return location_keys(*location)
+    return location_keys(None, None)
+
+
+def borrower_locations(affiliate_ids):
+    # borrower_location for many affiliates with two queries.
+    locations = {}
+    for model in (Individual, Business):
+        rows = model.objects.filter(affiliate_id__in=affiliate_ids).order_by('affiliate_id', '-pk').values_list('affiliate_id', 'state', 'county')
+        for affiliate_id, state, county in rows:
+            # Later rows win: businesses over individuals, and the lowest pk within each.
+            locations[affiliate_id] = location_keys(state, county)
+    return {affiliate_id: locations.get(affiliate_id, location_keys(None, None)) for affiliate_id in affiliate_ids}
+
+
+def apply_delta(dimension, key, count, amount):
+    if not count and not amount:
+        return
+    updated = ExposureSummary.objects.filter(dimension=dimension, key=key).update(
+        loan_count=F('loan_count') + count, total_amount=F('total_amount') + amount,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            ExposureSummary.objects.create(dimension=dimension, key=key, loan_count=count, total_amount=amount)
+    except IntegrityError:
+        # Another process created the row first; add to it instead.
+        apply_delta(dimension, key, count, amount)
+
+
+def snapshot(loan):
+    # Reads straight from the instance dict so deferred fields are never loaded here.
+    return {field: loan.__dict__[field] for field in SNAPSHOT_FIELDS if field in loan.__dict__}
+
+
+def loan_contribution(values, location=None):
+    contribution = {dimension: _key(values[attribute]) for dimension, attribute in LOAN_DIMENSIONS.items()}
+    contribution.update(location or borrower_location(values['borrower_id']))
+    return contribution
+
+
+def loan_saved(loan, created, previous):
+    # Moves the loan's contribution from the values it was loaded with to the values just saved.
+    current = {field: getattr(loan, field) for field in SNAPSHOT_FIELDS}
+    amount = Decimal(current['loan_amount'])
+    if created or previous is None:
+        for dimension, key in loan_contribution(current).items():
+            apply_delta(dimension, key, 1, amount)
+        return
+
+    old_amount = Decimal(previous['loan_amount'])
+    old = {dimension: _key(previous[attribute]) for dimension, attribute in LOAN_DIMENSIONS.items()}
+    new = {dimension: _key(current[attribute]) for dimension, attribute in LOAN_DIMENSIONS.items()}
+    if previous['borrower_id'] != current['borrower_id'] or old_amount != amount:
+        old.update(borrower_location(previous['borrower_id']))
+        new.update(borrower_location(current['borrower_id']) if previous['borrower_id'] != current['borrower_id'] else {dimension: old[dimension] for dimension in LOCATION_DIMENSIONS})
+
+    for dimension, new_key in new.items():
+        old_key = old[dimension]
+        if old_key == new_key:
+            apply_delta(dimension, new_key, 0, amount - old_amount)
+        else:
+            apply_delta(dimension, old_key, -1, -old_amount)
+            apply_delta(dimension, new_key, 1, amount)
+
+
+def loan_deleted(values):
+    amount = Decimal(values['loan_amount'])
+    for dimension, key in loan_contribution(values).items():
+        apply_delta(dimension, key, -1, -amount)
+
+
+def loans_added(rows):
+    # Adds loans written without Loan.save (e.g. bulk_create) to the summaries; rows are dicts
+    # or Loans carrying the SNAPSHOT_FIELDS. Deltas are combined so each key is written once.
+    rows = [row if isinstance(row, dict) else {field: getattr(row, field) for field in SNAPSHOT_FIELDS} for row in rows]
+    locations = borrower_locations({row['borrower_id'] for row in rows})
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    for row in rows:
+        for dimension, key in loan_contribution(row, locations[row['borrower_id']]).items():
+            totals[dimension, key][0] += 1
+            totals[dimension, key][1] += Decimal(row['loan_amount'])
+    for (dimension, key), (count, amount) in totals.items():
+        apply_delta(dimension, key, count, amount)
+
+
+def borrower_moved(affiliate_id, before, after):
+    # A borrower's address change moves all of its loans between location keys at once.
+    if before == after:
+        return
+    totals = Loan.objects.filter(borrower_id=affiliate_id).aggregate(count=Count('pk'), amount=Sum('loan_amount'))
+    if not totals['count']:
+        return
+    for dimension in LOCATION_DIMENSIONS:
+        if before[dimension] != after[dimension]:
+            apply_delta(dimension, before[dimension], -totals['count'], -totals['amount'])
+            apply_delta(dimension, after[dimension], totals['count'], totals['amount'])
+
+
+def recompute():
+    # Full GROUP BY recompute of every summary, keyed by (dimension, key).
+    totals = {}
+    for dimension, attribute in LOAN_DIMENSIONS.items():
+        for row in Loan.objects.order_by().values(attribute).annotate(count=Count('pk'), amount=Sum('loan_amount')):
+            totals[dimension, _key(row[attribute])] = (row['count'], row['amount'])
+
+    by_borrower = list(Loan.objects.order_by().values('borrower_id').annotate(count=Count('pk'), amount=Sum('loan_amount')))
+    locations = borrower_locations({row['borrower_id'] for row in by_borrower})
+    for row in by_borrower:
+        for dimension, key in locations[row['borrower_id']].items():
+            count, amount = totals.get((dimension, key), (0, Decimal(0)))
+            totals[dimension, key] = (count + row['count'], amount + row['amount'])
+    return totals
+
+
+def compare(totals=None):
+    # Differences between the stored summaries and a full recompute, as
+    # (dimension, key, stored (count, amount), recomputed (count, amount)).
+    totals = recompute() if totals is None else totals
+    stored = {
+        (row.dimension, row.key): (row.loan_count, row.total_amount)
+        for row in ExposureSummary.objects.all()
+    }
+    differences = []
+    for dimension_key in sorted(set(stored) | set(totals)):
+        expected = totals.get(dimension_key, (0, Decimal(0)))
+        actual = stored.get(dimension_key, (0, Decimal(0)))
+        if expected[0] != actual[0] or expected[1] != actual[1]:
+            differences.append((*dimension_key, actual, expected))
+    return differences
+
+
+@transaction.atomic
+def rebuild(totals=None):
+    totals = recompute() if totals is None else totals
+    ExposureSummary.objects.all().delete()
+    ExposureSummary.objects.bulk_create([
+        ExposureSummary(dimension=dimension, key=key, loan_count=count, total_amount=amount)
+        for (dimension, key), (count, amount) in totals.items()
+    ])
+
+
+def can_view_dashboard(user):
+    # request.user is an auth user; user types live on the users.User with the same username.
+    if not user.is_authenticated:
+        return False
+    return user.is_staff or User.objects.filter(username=user.get_username(), user_type__in=EXECUTIVE_USER_TYPES).exists()
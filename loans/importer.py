@@ -0,0 +1,199 @@
+import csv
+import io
+import json
+from itertools import islice
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from relationships.models import Affiliate
+from .models import Loan
+from .relationship_exposure import LENDING_LIMIT_ERROR, batch_lending_limit_breaches
+from . import debt_service, exposure
+
+# Rows validated and written per transaction.
+IMPORT_CHUNK_SIZE = 5000
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Columns accepted in an import file: every Loan column, foreign keys by id (borrower_id, loan_officer_id, ...).
+IMPORT_FIELDS = {field.attname: field for field in Loan._meta.concrete_fields}
+ROLE_FIELDS = ('loan_officer_id', 'credit_analyst_id', 'underwriter_id', 'portfolio_manager_id')
+AFFILIATE_FIELDS = ('borrower_id', 'guarantor_id')
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows_read = 0
+        self.created = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {'rows_read': self.rows_read, 'created': self.created, 'errors': self.errors}
+
+
+def read_rows(stream, import_format):
+    # Yields one dict per input row without reading the whole file; `stream` is a text stream.
+    if import_format == 'csv':
+        yield from csv.DictReader(stream)
+    elif import_format == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f'Unknown import format {import_format!r}.')
+
+
+def _isnull(column):
+    return np.equal(column, None)
+
+
+def _isin(column, values):
+    return np.array([value in values for value in column], dtype=bool)
+
+
+def _convert(rows):
+    # Parses every cell with its model field; returns per-field object arrays, masks of the cells
+    # that failed to parse, and per-row errors.
+    errors = [[] for _ in rows]
+    columns = {}
+    failed = {}
+    for attname, field in IMPORT_FIELDS.items():
+        column = np.empty(len(rows), dtype=object)
+        failed[attname] = np.zeros(len(rows), dtype=bool)
+        for i, row in enumerate(rows):
+            value = row.get(attname)
+            if value is None or value == '':
+                column[i] = None
+                continue
+            try:
+                if isinstance(field, models.JSONField) and isinstance(value, str):
+                    value = json.loads(value)
+                value = field.to_python(value)
+                field.run_validators(value)
+            except json.JSONDecodeError:
+                errors[i].append(f'{attname}: Invalid JSON.')
+                value = None
+                failed[attname][i] = True
+            except ValidationError as exc:
+                errors[i].append(f'{attname}: {"; ".join(exc.messages)}')
+                value = None
+                failed[attname][i] = True
+            except (TypeError, ValueError) as exc:
+                errors[i].append(f'{attname}: {exc}')
+                value = None
+                failed[attname][i] = True
+            column[i] = value
+        columns[attname] = column
+    return columns, failed, errors
+
+
+def validate_batch(rows, first_row=1, seen_loan_numbers=None):
+    # Validates a batch of parsed input rows against the Loan model and Loan.save's rules, applying
+    # each rule to whole columns at once. Returns (loans, errors): Loan objects ready for
+    # bulk_create and one {'row', 'loan_number', 'errors'} entry per rejected row. Loans that pass
+    # are checked against the legal lending limit in file order, as the create view checks one.
+    seen_loan_numbers = set() if seen_loan_numbers is None else seen_loan_numbers
+    columns, failed, row_errors = _convert(rows)
+    size = len(rows)
+    checks = []
+
+    for attname, field in IMPORT_FIELDS.items():
+        if not field.null and not field.has_default():
+            checks.append((_isnull(columns[attname]) & ~failed[attname], f'{attname}: This field is required.'))
+        if field.choices:
+            choices = {value for value, _ in field.flatchoices}
+            column = columns[attname]
+            checks.append((~_isnull(column) & ~_isin(column, choices), f'{attname}: Not a valid choice.'))
+    loan_number = columns['loan_number']
+    checks.append((_isnull(loan_number), 'loan_number: This field is required.'))
+
+    # Loan.save's rules, applied column-wise.
+    sba = columns['loan_program'] == 'SBA'
+    checks.append((sba & _isnull(columns['loan_delivery_method']), Loan.SBA_DELIVERY_METHOD_ERROR))
+    checks.append((sba & (_isnull(columns['jobs_created']) | _isnull(columns['jobs_retained'])), Loan.SBA_JOBS_ERROR))
+    needs_conversion = _isin(columns['loan_type'], Loan.CONVERSION_LOAN_TYPES)
+    checks.append((needs_conversion & _isnull(columns['conversion_type']), Loan.CONVERSION_TYPE_ERROR))
+    for field in Loan.SBA_ONLY_FIELDS:
+        columns[field][~sba] = None
+    columns['conversion_type'][~needs_conversion] = None
+
+    # Duplicates within the file and against loans already on file: one query per batch.
+    numbers = [value for value in loan_number if value is not None]
+    existing = set(Loan.objects.filter(loan_number__in=numbers).values_list('loan_number', flat=True))
+    duplicate = np.zeros(size, dtype=bool)
+    batch_numbers = set()
+    for i, value in enumerate(loan_number):
+        if value is None:
+            continue
+        duplicate[i] = value in existing or value in seen_loan_numbers or value in batch_numbers
+        batch_numbers.add(value)
+    checks.append((duplicate, 'loan_number: A loan with this loan number already exists.'))
+
+    # Foreign keys must point at existing rows: one query per referenced table.
+    for attnames, model in ((AFFILIATE_FIELDS, Affiliate), (ROLE_FIELDS, Loan._meta.get_field('loan_officer').related_model)):
+        ids = {value for attname in attnames for value in columns[attname] if value is not None}
+        known = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        for attname in attnames:
+            column = columns[attname]
+            checks.append((~_isnull(column) & ~_isin(column, known), f'{attname}: Does not exist.'))
+
+    invalid = np.array([bool(errors) for errors in row_errors], dtype=bool)
+    for mask, _ in checks:
+        invalid |= mask
+
+    errors = []
+    for i in np.flatnonzero(invalid):
+        messages = row_errors[i] + [message for mask, message in checks if mask[i]]
+        errors.append({'row': first_row + int(i), 'loan_number': loan_number[i], 'errors': messages})
+
+    valid = np.flatnonzero(~invalid)
+    candidates = [
+        Loan(**{attname: columns[attname][i] for attname in IMPORT_FIELDS if columns[attname][i] is not None})
+        for i in valid
+    ]
+    loans = []
+    for i, loan, breaches in zip(valid, candidates, batch_lending_limit_breaches(candidates)):
+        if breaches:
+            messages = [
+                'loan_amount: ' + LENDING_LIMIT_ERROR.format(affiliate_id=affiliate_id, proposed=proposed, current=current)
+                for affiliate_id, current, proposed in breaches
+            ]
+            errors.append({'row': first_row + int(i), 'loan_number': loan_number[i], 'errors': messages})
+        else:
+            loans.append(loan)
+    errors.sort(key=lambda error: error['row'])
+    seen_loan_numbers.update(loan.loan_number for loan in loans)
+    return loans, errors
+
+
+def import_loans(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    # Streams rows through batched validation and writes each batch's valid loans with bulk_create
+    # in its own transaction, so one bad row never blocks the rest of the file. bulk_create skips
+    # Loan.save and its signals, so exposure summaries are updated and cached debt service dropped
+    # for the whole batch at once.
+    result = ImportResult()
+    seen_loan_numbers = set()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+        loans, errors = validate_batch(batch, result.rows_read + 1, seen_loan_numbers)
+        result.rows_read += len(batch)
+        result.errors.extend(errors)
+        if loans:
+            with transaction.atomic():
+                Loan.objects.bulk_create(loans, batch_size=1000)
+                exposure.loans_added(loans)
+                debt_service.invalidate(loan.borrower_id for loan in loans)
+            result.created += len(loans)
+    return result
+
+
+def import_loans_file(file, import_format, chunk_size=IMPORT_CHUNK_SIZE):
+    # Accepts a binary or text file object (e.g. an uploaded file).
+    if isinstance(file.read(0), bytes):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    return import_loans(read_rows(file, import_format), chunk_size)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from loans.models import LoanCustomFieldValue
+
+
+class Command(BaseCommand):
+    help = 'Deletes LoanCustomFieldValue rows that hold no value; under sparse storage a missing row already means the default.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        deleted = 0
+        # Delete by primary key chunks so each statement stays short on a large table.
+        while True:
+            pks = list(LoanCustomFieldValue.empty_rows().order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            deleted += LoanCustomFieldValue.objects.filter(pk__in=pks).delete()[0]
+            self.stdout.write(f'Deleted {deleted} empty custom field values')
+        self.stdout.write(self.style.SUCCESS(f'Done; {deleted} empty custom field values removed.'))
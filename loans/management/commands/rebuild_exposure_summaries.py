@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from loans import exposure
+
+
+class Command(BaseCommand):
+    help = 'Checks the incrementally maintained exposure summaries against a full recompute and rebuilds them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report differences; exit with status 1 if any are found.')
+
+    def handle(self, *args, **options):
+        totals = exposure.recompute()
+        differences = exposure.compare(totals)
+        for dimension, key, stored, expected in differences:
+            self.stdout.write(
+                f'{dimension} {key or "(none)"}: stored {stored[0]} loans / {stored[1]}, '
+                f'recomputed {expected[0]} loans / {expected[1]}'
+            )
+
+        if options['check']:
+            if differences:
+                self.stderr.write(f'{len(differences)} exposure summaries differ from a full recompute.')
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS('Exposure summaries match a full recompute.'))
+            return
+
+        exposure.rebuild(totals)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(totals)} exposure summaries ({len(differences)} corrected).'))
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.repricing import reprice_loans
+
+
+class Command(BaseCommand):
+    help = 'Reprices variable rate loans due under their repricing frequency from the BaseRate history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help='Repricing date (YYYY-MM-DD); defaults to today.')
+        parser.add_argument('--dry-run', action='store_true', help='Report the rate changes without saving them.')
+
+    def handle(self, *args, **options):
+        try:
+            as_of = date.fromisoformat(options['as_of']) if options['as_of'] else date.today()
+        except ValueError:
+            raise CommandError('--as-of must be a date in YYYY-MM-DD format.')
+
+        changes = reprice_loans(as_of, dry_run=options['dry_run'])
+        for change in changes:
+            for field, rate in change['rates'].items():
+                if rate['old'] != rate['new']:
+                    self.stdout.write(
+                        f"{change['loan_number']} {field}: {rate['old']} -> {rate['new']} "
+                        f"({rate['base_rate']} {rate['base']} as of {change['reset_date']})"
+                    )
+            for field in change['missing']:
+                self.stdout.write(self.style.WARNING(
+                    f"{change['loan_number']} {field}: no base rate history as of {change['reset_date']}; will be retried."
+                ))
+            for field in change['unsupported']:
+                self.stdout.write(self.style.WARNING(
+                    f"{change['loan_number']} {field}: base rate cannot be repriced automatically; left unchanged."
+                ))
+        verb = 'would be repriced' if options['dry_run'] else 'repriced'
+        incomplete = sum(1 for change in changes if change['missing'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(changes) - incomplete} loans {verb} as of {as_of}; {incomplete} missing base rate history.'
+        ))
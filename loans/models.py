@@ -1,6 +1,33 @@
+from datetime import date
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, Q, Value, FilteredRelation
+from django.db.models.functions import Coalesce
 from relationships.models import Affiliate
 
+class LoanQuerySet(models.QuerySet):
+    # Annotates custom field values onto each loan as ordinary columns. Each field becomes one
+    # LEFT JOIN on LoanCustomFieldValue, so any number of fields load in a single query, and a
+    # loan without a stored row for a field reads as that field's default.
+    # Fields may be given as CustomField instances, primary keys or names; keyword arguments
+    # choose the annotation name, positional fields are annotated as custom_field_<pk>.
+    def with_custom_fields(self, *fields, **named_fields):
+        requested = [(None, field) for field in fields] + [(alias, field) for alias, field in named_fields.items()]
+        custom_fields = CustomField.resolve([field for _, field in requested])
+
+        queryset = self
+        for (alias, _), custom_field in zip(requested, custom_fields):
+            relation = f'_custom_field_value_{custom_field.pk}'
+            queryset = queryset.annotate(**{
+                relation: FilteredRelation('custom_field_values', condition=Q(custom_field_values__custom_field=custom_field.pk)),
+            })
+            column = F(f'{relation}__{custom_field.value_column}')
+            default = custom_field.typed_default()
+            if default is not None:
+                column = Coalesce(column, Value(default, output_field=LoanCustomFieldValue._meta.get_field(custom_field.value_column)))
+            queryset = queryset.annotate(**{alias or f'custom_field_{custom_field.pk}': column})
+        return queryset
+
 class Loan(models.Model):
     LOAN_PROGRAM_CHOICES = [
         ('CONSUMER', 'Consumer'),
@@ -80,6 +107,12 @@ class Loan(models.Model):
         ('CUSTOM', 'Custom'),
     ]
 
+    LOAN_STATUS_CHOICES = [
+        ('PROPOSED', 'Proposed'),
+        ('EXISTING', 'Existing'),
+        ('PAID_OFF', 'Paid Off'),
+    ]
+
     REPAYMENT_TYPE_CHOICES = [
         ('INTEREST_ONLY', 'Interest Only'),
         ('PRINCIPAL_AND_INTEREST', 'Principal and Interest'),
@@ -87,6 +120,8 @@ class Loan(models.Model):
     ]
 
     loan_number = models.CharField(max_length=50, primary_key=True, default='')
+    # Proposed loans are still in underwriting; only proposed and existing loans carry debt service (see loans.debt_service).
+    loan_status = models.CharField(max_length=10, choices=LOAN_STATUS_CHOICES, default='EXISTING')
     loan_program = models.CharField(max_length=10, choices=LOAN_PROGRAM_CHOICES)
     loan_type = models.CharField(max_length=15, choices=LOAN_TYPE_CHOICES)
 
@@ -96,20 +131,27 @@ class Loan(models.Model):
 
     conversion_type = models.CharField(max_length=20, choices=CONVERSION_CHOICES, blank=True, null=True)
 
+    # Fields only kept for SBA loans, and the loan types that require a Conversion Type. Shared with
+    # the bulk importer (loans.importer), which applies the same rules to whole batches at once.
+    SBA_ONLY_FIELDS = ('loan_delivery_method', 'jobs_created', 'jobs_retained')
+    CONVERSION_LOAN_TYPES = ('NONREVOLVING', 'CONSTRUCTION')
+    SBA_DELIVERY_METHOD_ERROR = 'Loan Delivery Method is required for SBA loans.'
+    SBA_JOBS_ERROR = 'Jobs Created and Jobs Retained are required for SBA loans.'
+    CONVERSION_TYPE_ERROR = 'Conversion Type is required for Non-Revolving Line of Credit and Construction Loan types.'
+
     def save(self, *args, **kwargs):
         if self.loan_program == 'SBA':
             if not self.loan_delivery_method:
-                raise ValueError('Loan Delivery Method is required for SBA loans.')
+                raise ValueError(self.SBA_DELIVERY_METHOD_ERROR)
             if self.jobs_created is None or self.jobs_retained is None:
-                raise ValueError('Jobs Created and Jobs Retained are required for SBA loans.')
+                raise ValueError(self.SBA_JOBS_ERROR)
         else:
-            self.loan_delivery_method = None
-            self.jobs_created = None
-            self.jobs_retained = None
+            for field in self.SBA_ONLY_FIELDS:
+                setattr(self, field, None)
 
-        if self.loan_type in ['NONREVOLVING', 'CONSTRUCTION']:
+        if self.loan_type in self.CONVERSION_LOAN_TYPES:
             if not self.conversion_type:
-                raise ValueError('Conversion Type is required for Non-Revolving Line of Credit and Construction Loan types.')
+                raise ValueError(self.CONVERSION_TYPE_ERROR)
         else:
             self.conversion_type = None
 
@@ -164,6 +206,8 @@ class Loan(models.Model):
     interest_rate_repricing_frequency = models.CharField(max_length=15, choices=REPRICING_FREQUENCY_CHOICES)
     interest_rate_repricing_frequency_custom = models.CharField(max_length=255, blank=True, null=True)
     first_interest_rate_adjustment_date = models.DateField()
+    # Reset date whose base rate the variable full rates currently reflect; maintained by loans.repricing.
+    rate_last_repriced_date = models.DateField(blank=True, null=True)
     #Repayment Fields
     repayment_frequency = models.CharField(max_length=15, choices=REPAYMENT_FREQUENCY_CHOICES)
     repayment_frequency_custom = models.CharField(max_length=255, blank=True, null=True)
@@ -177,6 +221,32 @@ class Loan(models.Model):
     #Use of Proceeds; currently a work-in-progress and, as-is, mimicking the SBA Form 1920
     use_of_proceeds = models.JSONField(blank=True, null=True)
 
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        # Composite indexes backing the loan list's keyset pagination for each sort/filter it offers.
+        indexes = [
+            models.Index(fields=['loan_program', 'loan_number'], name='loan_program_number_idx'),
+            models.Index(fields=['loan_type', 'loan_number'], name='loan_type_number_idx'),
+            models.Index(fields=['loan_officer', 'loan_number'], name='loan_officer_number_idx'),
+        ]
+
+    # Custom field values are stored sparsely: a loan only has a LoanCustomFieldValue row for
+    # fields holding something other than the field's default.
+    def get_custom_field_value(self, custom_field):
+        row = self.custom_field_values.filter(custom_field=custom_field).first()
+        if row is None:
+            return custom_field.typed_default()
+        return getattr(row, custom_field.value_column)
+
+    def set_custom_field_value(self, custom_field, value):
+        if value is None or value == custom_field.typed_default():
+            LoanCustomFieldValue.objects.filter(loan=self, custom_field=custom_field).delete()
+        else:
+            LoanCustomFieldValue.objects.update_or_create(
+                loan=self, custom_field=custom_field, defaults={custom_field.value_column: value},
+            )
+
 #Model to allow for customization of loan fields.
 class CustomField(models.Model):
     FIELD_TYPE_CHOICES = [
@@ -187,11 +257,60 @@ class CustomField(models.Model):
         ('BOOLEAN', 'Boolean'),
     ]
 
+    # LoanCustomFieldValue column holding each field type's value.
+    VALUE_COLUMNS = {
+        'TEXT': 'value_text',
+        'NUMBER': 'value_number',
+        'DECIMAL': 'value_decimal',
+        'DATE': 'value_date',
+        'BOOLEAN': 'value_boolean',
+    }
+
     name = models.CharField(max_length=255)
     field_type = models.CharField(max_length=10, choices=FIELD_TYPE_CHOICES)
     required = models.BooleanField(default=False)
+    # Value reported for loans without a stored value; entered as text and converted per field type.
+    default_value = models.CharField(max_length=255, blank=True, null=True)
+
+    def __str__(self):
+        return self.name
 
-#Model to store the values of the custom fields for each loan:
+    @property
+    def value_column(self):
+        return self.VALUE_COLUMNS[self.field_type]
+
+    def typed_default(self):
+        if self.default_value in (None, ''):
+            return None
+        if self.field_type == 'NUMBER':
+            return int(self.default_value)
+        if self.field_type == 'DECIMAL':
+            return Decimal(self.default_value)
+        if self.field_type == 'DATE':
+            return date.fromisoformat(self.default_value)
+        if self.field_type == 'BOOLEAN':
+            return self.default_value.strip().lower() in ('true', 'yes', '1')
+        return self.default_value
+
+    @classmethod
+    def resolve(cls, fields):
+        # Maps CustomField instances, primary keys or names to CustomField objects with one query.
+        pks = [field for field in fields if isinstance(field, int)]
+        names = [field for field in fields if isinstance(field, str)]
+        found = {}
+        if pks or names:
+            for custom_field in cls.objects.filter(Q(pk__in=pks) | Q(name__in=names)):
+                found[custom_field.pk] = custom_field
+                found.setdefault(custom_field.name, custom_field)
+        resolved = []
+        for field in fields:
+            custom_field = field if isinstance(field, cls) else found.get(field)
+            if custom_field is None:
+                raise cls.DoesNotExist(f'Custom field {field!r} does not exist.')
+            resolved.append(custom_field)
+        return resolved
+
+#Model to store the values of the custom fields for each loan. Storage is sparse: a missing row means the custom field's default.
 class LoanCustomFieldValue(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='custom_field_values')
     custom_field = models.ForeignKey(CustomField, on_delete=models.CASCADE, related_name='loan_custom_field_values')
@@ -204,6 +323,63 @@ class LoanCustomFieldValue(models.Model):
     class Meta:
         unique_together = ('loan', 'custom_field')
 
+    @property
+    def value(self):
+        return getattr(self, self.custom_field.value_column)
+
+    # Rows with no value at all are what the old eager creation left behind; they carry no information under sparse storage.
+    @classmethod
+    def empty_rows(cls):
+        return cls.objects.filter(
+            value_text__isnull=True, value_number__isnull=True, value_decimal__isnull=True,
+            value_date__isnull=True, value_boolean__isnull=True,
+        )
+
+#History of published base rates (e.g. WSJ Prime, SBA Peg) used to reprice variable rate loans. Each row is the rate in effect from its effective date until the next row for the same base rate.
+class BaseRate(models.Model):
+    BASE_RATE_CHOICES = [
+        ('WSJ_PRIME', 'Wall Street Journal Prime'),
+        ('SBA_PEG', 'SBA Peg Rate'),
+    ]
+
+    base_rate = models.CharField(max_length=15, choices=BASE_RATE_CHOICES)
+    effective_date = models.DateField()
+    rate = models.DecimalField(max_digits=7, decimal_places=4)
+
+    class Meta:
+        ordering = ['base_rate', 'effective_date']
+        constraints = [
+            models.UniqueConstraint(fields=['base_rate', 'effective_date'], name='unique_base_rate_effective_date')
+        ]
+
+    def __str__(self):
+        return f"{self.get_base_rate_display()} {self.rate}% effective {self.effective_date}"
+
+#Pre-aggregated loan exposure (count and total loan amount) per reporting dimension, kept current incrementally by loans.exposure from Loan signals so dashboards never GROUP BY the loan table.
+class ExposureSummary(models.Model):
+    DIMENSION_CHOICES = [
+        ('loan_program', 'Loan Program'),
+        ('loan_type', 'Loan Type'),
+        ('loan_officer', 'Loan Officer'),
+        ('portfolio_manager', 'Portfolio Manager'),
+        ('borrower_state', 'Borrower State'),
+        ('borrower_county', 'Borrower County'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    # Value of the dimension (choice code, user id, state, or "county, state"); blank when the loan has none.
+    key = models.CharField(max_length=120, blank=True)
+    loan_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='unique_exposure_summary_dimension_key')
+        ]
+
+    def __str__(self):
+        return f"{self.get_dimension_display()} {self.key or '(none)'}: {self.loan_count} loans, {self.total_amount}"
+
 class UseOfProceedsCategory(models.Model):
     CATEGORY_CHOICES = [
         (1, 'Land Acquisition'),
@@ -236,6 +412,6 @@ class UseOfProceedsAllocation(models.Model):
         ('EQUITY_INJECTION', 'Applicant Equity Injection'),
     ]
 
-    use_of_proceeds_category = models.ForeignKey(UseOfProceedsCategory, on_delete=models.CASCADE, related_name='allo>
+    use_of_proceeds_category = models.ForeignKey(UseOfProceedsCategory, on_delete=models.CASCADE, related_name='allocations')
     column = models.CharField(max_length=16, choices=COLUMN_CHOICES)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
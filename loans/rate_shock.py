@@ -0,0 +1,264 @@
+import os
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from multiprocessing import Pool
+
+import numpy as np
+from django.db.models import Q
+
+from .amortization import (
+    LOAN_TERM_FIELDS, RATE_UNITS, ScheduleBatch, amortize_rates, clamp_rate, from_cents, loan_terms, payments_before,
+    to_rate_units,
+)
+from .debt_service import DEBT_SERVICE_STATUSES, annual_debt_service, schedulable
+from .models import Loan
+from .repricing import PRICING_PERIODS, REPRICING_FIELDS, REPRICING_INTERVALS, BaseRateHistory, add_months, reset_date
+
+# Interest rate shocks across the loan book. A shock moves every base rate by a number of basis
+# points from some months after the as-of date on: ((0, 200),) is an immediate, parallel +200bp
+# move and several steps make a path (((0, 100), (6, 200)) reaches +200bp after six months).
+# Over the year after the as-of date each variable loan reprices on its own reset dates to the
+# shocked base rate plus its spread, held within its floor and ceiling, and is amortized from its
+# loan amount at the rates in effect. Every shock is compared to the unshocked baseline, in which
+# loans reprice to today's base rates. Loans are scheduled a chunk at a time as rate matrices of
+# shape (loans, payments), in worker processes which never touch the database.
+
+Shock = namedtuple('Shock', 'name steps')
+
+BASELINE = Shock('baseline', ())
+PARALLEL_SHOCKS = tuple(Shock(f'+{basis_points}bp', ((0, basis_points),)) for basis_points in (100, 200, 300))
+
+ZERO = Decimal(0)
+HUNDRED = Decimal(100)
+
+# Loans scheduled per task.
+LOAN_CHUNK_SIZE = 2000
+
+SHOCK_FIELDS = tuple(dict.fromkeys((*LOAN_TERM_FIELDS, *REPRICING_FIELDS)))
+
+LOAN_RESULT_FIELDS = (
+    'loan_number',
+    'borrower_id',
+    'shock',
+    'base_rate',
+    'shocked_rate',
+    'base_payment',
+    'shocked_payment',
+    'payment_change',
+    'base_interest_income',
+    'shocked_interest_income',
+    'interest_income_change',
+    'debt_service_change',
+)
+
+
+def parse_shock(value):
+    # A Shock from the command line: basis points for a parallel shock ('200', '-100'), or a path
+    # of months:basis points steps ('0:100,6:200').
+    try:
+        if ':' not in value:
+            basis_points = int(value)
+            return Shock(f'{basis_points:+d}bp', ((0, basis_points),))
+        steps = tuple(sorted(tuple(int(part) for part in step.split(':')) for step in value.split(',')))
+    except ValueError:
+        raise ValueError(f'{value!r} is not a shock in basis points or a months:basis points path.')
+    if any(len(step) != 2 or step[0] < 0 for step in steps):
+        raise ValueError(f'{value!r} is not a shock in basis points or a months:basis points path.')
+    return Shock(value, steps)
+
+
+def shocked_history(history, as_of, steps):
+    # The base rate history up to as_of with each step's move applied to every base rate from the
+    # step's date on. Moves are measured from the rates in effect on as_of and never take a base
+    # rate below zero.
+    rows = {
+        (base_rate, effective_date): rate
+        for base_rate, dates in history.dates.items()
+        for effective_date, rate in zip(dates, history.rates[base_rate])
+        if effective_date <= as_of
+    }
+    for months, basis_points in steps:
+        effective_date = add_months(as_of, months)
+        for base_rate in history.dates:
+            rate = history.rate_on(base_rate, as_of)
+            if rate is not None:
+                rows[base_rate, effective_date] = max(rate + Decimal(basis_points) / HUNDRED, ZERO)
+    return BaseRateHistory((base_rate, effective_date, rate) for (base_rate, effective_date), rate in rows.items())
+
+
+def change_dates(as_of, steps):
+    # Dates the shocked base rates can change on: as_of (loans reprice to today's rates) and each step.
+    return sorted({as_of, *(add_months(as_of, months) for months, _ in steps)})
+
+
+def next_reset_date(first_adjustment_date, frequency, on_or_after):
+    # Earliest scheduled reset on or after the given date.
+    if on_or_after <= first_adjustment_date:
+        return first_adjustment_date
+    unit, count = REPRICING_INTERVALS[frequency]
+    if unit == 'days':
+        return first_adjustment_date + timedelta(days=-((first_adjustment_date - on_or_after).days // count) * count)
+    months = (on_or_after.year - first_adjustment_date.year) * 12 + on_or_after.month - first_adjustment_date.month
+    n = max(months // count, 0)
+    while reset_date(first_adjustment_date, frequency, n) < on_or_after:
+        n += 1
+    return reset_date(first_adjustment_date, frequency, n)
+
+
+def _pricing(loan, on_date):
+    # Pricing period fields in effect on a date: Period 2 from the first adjustment date on, when set.
+    adjustment_date = loan['first_interest_rate_adjustment_date']
+    if loan['period_2_full_rate'] is not None and adjustment_date is not None and on_date >= adjustment_date:
+        return PRICING_PERIODS[1]
+    return PRICING_PERIODS[0]
+
+
+def repriced_rate(loan, history, reset):
+    # Full rate a loan resets to: base rate plus spread for variable pricing, held within the
+    # floor and ceiling.
+    rate_type_field, base_rate_field, spread_field, full_rate_field = _pricing(loan, reset)
+    rate = loan[full_rate_field]
+    if loan[rate_type_field] == 'VARIABLE' and loan[spread_field] is not None:
+        base = history.rate_on(loan[base_rate_field], reset)
+        if base is not None:
+            rate = base + loan[spread_field]
+    return clamp_rate(rate, loan[rate_type_field], loan['floor_rate'], loan['ceiling_rate'])
+
+
+def rate_path(loan, history, dates, as_of, periods):
+    # Rate units of the loan's first `periods` payments, counted from as_of: its current rate, then
+    # from the first reset on or after each change date within the year, the repriced rate.
+    rate_type_field, _, _, full_rate_field = _pricing(loan, as_of)
+    current = clamp_rate(loan[full_rate_field], loan[rate_type_field], loan['floor_rate'], loan['ceiling_rate'])
+    rates = np.full(periods, to_rate_units(current), dtype=np.int64)
+    frequency = loan['interest_rate_repricing_frequency']
+    first_adjustment_date = loan['first_interest_rate_adjustment_date']
+    if frequency not in REPRICING_INTERVALS or first_adjustment_date is None:
+        return rates
+    horizon = add_months(as_of, 12)
+    for reset in sorted({next_reset_date(first_adjustment_date, frequency, on_date) for on_date in dates}):
+        if reset > horizon:
+            break
+        rates[payments_before(as_of, reset, loan['repayment_frequency']):] = to_rate_units(repriced_rate(loan, history, reset))
+    return rates
+
+
+def _shock_chunk(args):
+    # {shock name: (rate at year end, regular payment, interest income, annual debt service)} for
+    # a chunk of loans, as arrays in rate units and cents.
+    loans, histories, as_of = args
+    terms = [loan_terms(loan) for loan in loans]
+    terms = {
+        key: np.asarray([loan[key] for loan in terms], dtype=bool if key == 'interest_only' else np.int64)
+        for key in ('principal', 'term_payments', 'amortization_payments', 'payments_per_year', 'interest_only')
+    }
+    payments_per_year = terms['payments_per_year']
+    periods = int(payments_per_year.max())
+    rows = np.arange(len(loans))
+    first_year = np.arange(periods) < payments_per_year[:, np.newaxis]
+    # The year's last regular payment: the final one before maturity for loans maturing within the year.
+    regular = np.clip(np.where(terms['term_payments'] > payments_per_year, payments_per_year, terms['term_payments'] - 1), 1, None) - 1
+
+    results = {}
+    for name, (history, dates) in histories.items():
+        rates = np.stack([rate_path(loan, history, dates, as_of, periods) for loan in loans])
+        schedules = ScheduleBatch([loan['loan_number'] for loan in loans], terms, *amortize_rates(rates=rates, **terms))
+        results[name] = (
+            rates[rows, payments_per_year - 1],
+            schedules.payment[rows, regular],
+            (schedules.interest * first_year).sum(axis=1),
+            annual_debt_service(schedules),
+        )
+    return loans, results
+
+
+def shock_candidates():
+    # Proposed and existing loans with variable pricing in either period.
+    return (
+        Loan.objects
+        .filter(loan_status__in=list(DEBT_SERVICE_STATUSES))
+        .filter(Q(period_1_interest_rate_type='VARIABLE') | Q(period_2_interest_rate_type='VARIABLE'))
+        .order_by('loan_number')
+        .values(*SHOCK_FIELDS)
+    )
+
+
+def _rate(units):
+    return (Decimal(int(units)) / (RATE_UNITS // 100)).quantize(Decimal('0.0001'))
+
+
+def rate_shock(as_of, shocks=PARALLEL_SHOCKS, workers=None, chunk_size=LOAN_CHUNK_SIZE, history=None):
+    # Runs every shock over the book as of a date. Returns a dict of
+    #   'loans'      one dict of LOAN_RESULT_FIELDS per loan and shock;
+    #   'portfolio'  per scenario (the baseline first): loans, interest income and annual debt
+    #                service, with their changes from the baseline;
+    #   'borrowers'  {borrower id: {shock name: change in annual debt service}};
+    #   'unscheduled' loan numbers with custom or modified repayment, which cannot be scheduled.
+    history = history or BaseRateHistory.load(as_of)
+    scenarios = [BASELINE, *shocks]
+    histories = {shock.name: (shocked_history(history, as_of, shock.steps), change_dates(as_of, shock.steps)) for shock in scenarios}
+
+    loans, unscheduled = [], []
+    for loan in shock_candidates().iterator(chunk_size=chunk_size):
+        if schedulable(loan):
+            loans.append(loan)
+        else:
+            unscheduled.append(loan['loan_number'])
+    tasks = [(loans[start:start + chunk_size], histories, as_of) for start in range(0, len(loans), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        chunks = map(_shock_chunk, tasks)
+    else:
+        with Pool(workers) as pool:
+            chunks = pool.map(_shock_chunk, tasks)
+
+    names = [shock.name for shock in shocks]
+    results = []
+    totals = {shock.name: {'loans': 0, 'interest_income': 0, 'debt_service': 0} for shock in scenarios}
+    borrowers = {}
+    for chunk, arrays in chunks:
+        base_rate, base_payment, base_interest, base_debt_service = arrays[BASELINE.name]
+        for name, total in totals.items():
+            total['loans'] += len(chunk)
+            total['interest_income'] += int(arrays[name][2].sum())
+            total['debt_service'] += int(arrays[name][3].sum())
+        for i, loan in enumerate(chunk):
+            borrower = borrowers.setdefault(loan['borrower_id'], dict.fromkeys(names, 0))
+            for name in names:
+                rate, payment, interest, debt_service = arrays[name]
+                change = int(debt_service[i] - base_debt_service[i])
+                borrower[name] += change
+                results.append({
+                    'loan_number': loan['loan_number'],
+                    'borrower_id': loan['borrower_id'],
+                    'shock': name,
+                    'base_rate': _rate(base_rate[i]),
+                    'shocked_rate': _rate(rate[i]),
+                    'base_payment': from_cents(base_payment[i]),
+                    'shocked_payment': from_cents(payment[i]),
+                    'payment_change': from_cents(payment[i] - base_payment[i]),
+                    'base_interest_income': from_cents(base_interest[i]),
+                    'shocked_interest_income': from_cents(interest[i]),
+                    'interest_income_change': from_cents(interest[i] - base_interest[i]),
+                    'debt_service_change': from_cents(change),
+                })
+
+    baseline = totals[BASELINE.name]
+    portfolio = [
+        {
+            'shock': name,
+            'loans': total['loans'],
+            'interest_income': from_cents(total['interest_income']),
+            'interest_income_change': from_cents(total['interest_income'] - baseline['interest_income']),
+            'debt_service': from_cents(total['debt_service']),
+            'debt_service_change': from_cents(total['debt_service'] - baseline['debt_service']),
+        }
+        for name, total in totals.items()
+    ]
+    borrowers = {
+        borrower_id: {name: from_cents(cents) for name, cents in changes.items()}
+        for borrower_id, changes in borrowers.items()
+    }
+    return {'loans': results, 'portfolio': portfolio, 'borrowers': borrowers, 'unscheduled': unscheduled}
@@ -0,0 +1,151 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+
+from relationships.models import Affiliate, Individual, Business, BeneficialOwnership
+from .models import Loan
+
+# Minimum ownership percentage for an owner to be treated as controlling the owned affiliate, so
+# that the owned affiliate's borrowings count as the owner's indirect exposure.
+CONTROL_OWNERSHIP_PERCENTAGE = Decimal('25')
+
+EXPOSURE_CATEGORIES = ('direct', 'guaranteed', 'indirect')
+
+LENDING_LIMIT_ERROR = 'Exposure for affiliate {affiliate_id} would be {proposed:,.2f} (currently {current:,.2f}), above the legal lending limit.'
+
+# Owner affiliate -> owned affiliate for every ownership at or above the control threshold.
+_CONTROL_EDGES_SQL = '''
+    control_edges(owner_id, owned_id) AS (
+        SELECT COALESCE(i.affiliate_id, b.affiliate_id), o.affiliate_id
+        FROM {ownership} o
+        LEFT JOIN {individual} i ON i.uuid = o.owner_individual_id
+        LEFT JOIN {business} b ON b.uuid = o.owner_business_id
+        WHERE o.ownership_percentage >= %s
+    )
+'''
+
+# Every affiliate reachable from each root through control edges, the root included. UNION (not
+# UNION ALL) drops rows already found, so ownership cycles terminate.
+_EXPOSURE_SQL = '''
+    WITH RECURSIVE {control_edges},
+    network(root_id, affiliate_id) AS (
+        SELECT affiliate_id, affiliate_id FROM {affiliate} WHERE affiliate_id IN ({roots})
+        UNION
+        SELECT n.root_id, e.owned_id FROM network n JOIN control_edges e ON e.owner_id = n.affiliate_id
+    ),
+    root_loans(root_id, loan_number, category, amount) AS (
+        SELECT DISTINCT n.root_id, l.loan_number,
+            CASE
+                WHEN l.borrower_id = n.root_id THEN 'direct'
+                WHEN l.guarantor_id = n.root_id THEN 'guaranteed'
+                ELSE 'indirect'
+            END,
+            l.loan_amount
+        FROM network n
+        JOIN {loan} l ON l.borrower_id = n.affiliate_id OR (n.affiliate_id = n.root_id AND l.guarantor_id = n.root_id)
+    )
+    SELECT root_id, category, SUM(amount) FROM root_loans GROUP BY root_id, category
+'''
+
+# Every affiliate that controls each root, directly or through intermediate owners, as
+# (root, controller) pairs.
+_CONTROLLERS_SQL = '''
+    WITH RECURSIVE {control_edges},
+    controllers(root_id, affiliate_id) AS (
+        SELECT owned_id, owner_id FROM control_edges WHERE owned_id IN ({roots})
+        UNION
+        SELECT c.root_id, e.owner_id FROM controllers c JOIN control_edges e ON e.owned_id = c.affiliate_id
+    )
+    SELECT root_id, affiliate_id FROM controllers WHERE affiliate_id IS NOT NULL
+'''
+
+
+def _format(sql, **extra):
+    tables = {
+        'affiliate': Affiliate._meta.db_table,
+        'individual': Individual._meta.db_table,
+        'business': Business._meta.db_table,
+        'ownership': BeneficialOwnership._meta.db_table,
+        'loan': Loan._meta.db_table,
+    }
+    tables = {name: connection.ops.quote_name(table) for name, table in tables.items()}
+    return sql.format(control_edges=_CONTROL_EDGES_SQL.format(**tables), **tables, **extra)
+
+
+def relationship_exposure(affiliate_ids, threshold=CONTROL_OWNERSHIP_PERCENTAGE):
+    # Total exposure of each affiliate's relationship in one recursive query:
+    #   direct     - loans the affiliate borrows,
+    #   guaranteed - loans the affiliate guarantees for another borrower,
+    #   indirect   - loans borrowed by affiliates it controls through ownership at or above
+    #                `threshold`, at any depth.
+    # Each loan counts once per affiliate, in the first category that applies.
+    # Returns {affiliate_id: {'direct', 'guaranteed', 'indirect', 'total'}}.
+    affiliate_ids = list(affiliate_ids)
+    exposure = {affiliate_id: dict.fromkeys(EXPOSURE_CATEGORIES, Decimal(0)) for affiliate_id in affiliate_ids}
+    if not affiliate_ids:
+        return exposure
+    sql = _format(_EXPOSURE_SQL, roots=', '.join(['%s'] * len(affiliate_ids)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [threshold, *affiliate_ids])
+        for root_id, category, amount in cursor.fetchall():
+            exposure[root_id][category] = Decimal(str(amount))
+    for values in exposure.values():
+        values['total'] = sum(values[category] for category in EXPOSURE_CATEGORIES)
+    return exposure
+
+
+def controlling_affiliates(affiliate_id, threshold=CONTROL_OWNERSHIP_PERCENTAGE):
+    return batch_controlling_affiliates([affiliate_id], threshold)[affiliate_id]
+
+
+def batch_controlling_affiliates(affiliate_ids, threshold=CONTROL_OWNERSHIP_PERCENTAGE):
+    # controlling_affiliates for many affiliates in one recursive query. Returns
+    # {affiliate_id: [controlling affiliate ids]}.
+    affiliate_ids = list(dict.fromkeys(affiliate_ids))
+    controllers = {affiliate_id: [] for affiliate_id in affiliate_ids}
+    if not affiliate_ids:
+        return controllers
+    sql = _format(_CONTROLLERS_SQL, roots=', '.join(['%s'] * len(affiliate_ids)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [threshold, *affiliate_ids])
+        for root_id, affiliate_id in cursor.fetchall():
+            controllers[root_id].append(affiliate_id)
+    return controllers
+
+
+def lending_limit_breaches(loan, limit=None):
+    # Relationships that would exceed the legal lending limit if `loan` were booked: its borrower,
+    # its guarantor and every affiliate controlling the borrower. Returns a list of
+    # (affiliate_id, current total, total with the loan). Empty when no limit is configured.
+    return batch_lending_limit_breaches([loan], limit)[0]
+
+
+def batch_lending_limit_breaches(loans, limit=None):
+    # lending_limit_breaches for many new loans, as if booked in order: each loan counts on top of
+    # the earlier ones that fit within the limit. One controller query and one exposure query for
+    # the whole batch. Returns one list of breaches per loan.
+    limit = getattr(settings, 'LEGAL_LENDING_LIMIT', None) if limit is None else limit
+    if limit is None:
+        return [[] for _ in loans]
+    limit = Decimal(limit)
+    controllers = batch_controlling_affiliates(loan.borrower_id for loan in loans)
+    affected = []
+    for loan in loans:
+        affiliate_ids = {loan.borrower_id, loan.guarantor_id, *controllers[loan.borrower_id]}
+        affiliate_ids.discard(None)
+        affected.append(affiliate_ids)
+
+    totals = {affiliate_id: values['total'] for affiliate_id, values in relationship_exposure(set().union(*affected)).items()}
+    results = []
+    for loan, affiliate_ids in zip(loans, affected):
+        amount = Decimal(loan.loan_amount)
+        breaches = sorted(
+            (affiliate_id, totals[affiliate_id], totals[affiliate_id] + amount)
+            for affiliate_id in affiliate_ids if totals[affiliate_id] + amount > limit
+        )
+        if not breaches:
+            for affiliate_id in affiliate_ids:
+                totals[affiliate_id] += amount
+        results.append(breaches)
+    return results
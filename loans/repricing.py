@@ -0,0 +1,178 @@
+from bisect import bisect_right
+from calendar import monthrange
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
+from .amortization import clamp_rate
+from .models import Loan, BaseRate
+from . import debt_service
+
+# Length of each Loan.REPRICING_FREQUENCY_CHOICES interval as (unit, count). 'CUSTOM'
+# frequencies are free text and are never repriced automatically.
+REPRICING_INTERVALS = {
+    'DAILY': ('days', 1),
+    'WEEKLY': ('days', 7),
+    'BI_WEEKLY': ('days', 14),
+    'MONTHLY': ('months', 1),
+    'QUARTERLY': ('months', 3),
+    'SEMI_ANNUALLY': ('months', 6),
+    'ANNUALLY': ('months', 12),
+}
+
+# (rate type, base rate, spread, full rate) fields for each pricing period.
+PRICING_PERIODS = (
+    ('period_1_interest_rate_type', 'period_1_base_rate', 'period_1_interest_rate_spread', 'period_1_full_rate'),
+    ('period_2_interest_rate_type', 'period_2_base_rate', 'period_2_interest_rate_spread', 'period_2_full_rate'),
+)
+
+REPRICING_FIELDS = (
+    'loan_number',
+    'borrower_id',
+    'interest_rate_repricing_frequency',
+    'first_interest_rate_adjustment_date',
+    'rate_last_repriced_date',
+    'floor_rate',
+    'ceiling_rate',
+    *[field for period in PRICING_PERIODS for field in period],
+)
+
+# Base rates published to the BaseRate history. Variable periods on any other base rate
+# ('FIXED_RATE', 'OTHER') cannot be repriced automatically.
+PUBLISHED_BASE_RATES = frozenset(base_rate for base_rate, _ in BaseRate.BASE_RATE_CHOICES)
+
+# Loans per UPDATE statement; keeps the IN list a reasonable size.
+UPDATE_CHUNK_SIZE = 1000
+
+
+def add_months(value, months):
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, monthrange(year, month)[1]))
+
+
+def reset_date(first_adjustment_date, frequency, n):
+    # The n-th reset date (n=0 is the first interest rate adjustment date itself).
+    unit, count = REPRICING_INTERVALS[frequency]
+    if unit == 'days':
+        return first_adjustment_date + timedelta(days=n * count)
+    return add_months(first_adjustment_date, n * count)
+
+
+def latest_reset_date(first_adjustment_date, frequency, as_of):
+    # Most recent scheduled reset on or before as_of, or None before the first adjustment.
+    if frequency not in REPRICING_INTERVALS or as_of < first_adjustment_date:
+        return None
+    unit, count = REPRICING_INTERVALS[frequency]
+    if unit == 'days':
+        return reset_date(first_adjustment_date, frequency, (as_of - first_adjustment_date).days // count)
+    months = (as_of.year - first_adjustment_date.year) * 12 + as_of.month - first_adjustment_date.month
+    n = months // count
+    while reset_date(first_adjustment_date, frequency, n) > as_of:
+        n -= 1
+    return reset_date(first_adjustment_date, frequency, n)
+
+
+class BaseRateHistory:
+    # In-memory copy of the BaseRate table for fast point-in-time lookups during batch runs.
+
+    def __init__(self, rows):
+        self.dates = defaultdict(list)
+        self.rates = defaultdict(list)
+        for base_rate, effective_date, rate in sorted(rows):
+            self.dates[base_rate].append(effective_date)
+            self.rates[base_rate].append(rate)
+
+    @classmethod
+    def load(cls, as_of=None):
+        queryset = BaseRate.objects.all()
+        if as_of is not None:
+            queryset = queryset.filter(effective_date__lte=as_of)
+        return cls(queryset.values_list('base_rate', 'effective_date', 'rate'))
+
+    def rate_on(self, base_rate, on_date):
+        index = bisect_right(self.dates.get(base_rate, []), on_date)
+        if index == 0:
+            return None
+        return self.rates[base_rate][index - 1]
+
+
+def repricing_candidates(as_of):
+    return (
+        Loan.objects
+        .filter(Q(period_1_interest_rate_type='VARIABLE') | Q(period_2_interest_rate_type='VARIABLE'))
+        .filter(first_interest_rate_adjustment_date__lte=as_of, interest_rate_repricing_frequency__in=list(REPRICING_INTERVALS))
+        .values(*REPRICING_FIELDS)
+    )
+
+
+def repricing_changes(as_of, history=None):
+    # Works out, for every variable loan due to reset by as_of, the full rate each variable pricing
+    # period should carry: the base rate in effect on the loan's latest reset date plus its spread,
+    # held within the loan's floor and ceiling. Returns one change dict per loan due; a period with
+    # no base rate history on the reset date is listed under 'missing' instead of priced, and one
+    # on a base rate that is never published under 'unsupported'.
+    history = history or BaseRateHistory.load(as_of)
+    changes = []
+    for loan in repricing_candidates(as_of).iterator(chunk_size=2000):
+        reset = latest_reset_date(loan['first_interest_rate_adjustment_date'], loan['interest_rate_repricing_frequency'], as_of)
+        if reset is None or (loan['rate_last_repriced_date'] is not None and loan['rate_last_repriced_date'] >= reset):
+            continue
+        rates = {}
+        missing = []
+        unsupported = []
+        for rate_type_field, base_rate_field, spread_field, full_rate_field in PRICING_PERIODS:
+            if loan[rate_type_field] != 'VARIABLE' or loan[spread_field] is None:
+                continue
+            if loan[base_rate_field] not in PUBLISHED_BASE_RATES:
+                unsupported.append(full_rate_field)
+                continue
+            base = history.rate_on(loan[base_rate_field], reset)
+            if base is None:
+                missing.append(full_rate_field)
+                continue
+            new_rate = clamp_rate(base + loan[spread_field], 'VARIABLE', loan['floor_rate'], loan['ceiling_rate'])
+            rates[full_rate_field] = {
+                'base_rate': loan[base_rate_field],
+                'base': base,
+                'old': loan[full_rate_field],
+                'new': new_rate.quantize(Decimal('0.0001')),
+            }
+        if rates or missing or unsupported:
+            changes.append({
+                'loan_number': loan['loan_number'], 'borrower_id': loan['borrower_id'], 'reset_date': reset,
+                'rates': rates, 'missing': missing, 'unsupported': unsupported,
+            })
+    return changes
+
+
+def reprice_loans(as_of, dry_run=False, history=None):
+    # Reprices every due variable loan in one set-based pass. Loans are grouped by the values they
+    # end up with (reset date and new full rates), so a Prime move across thousands of loans becomes
+    # a handful of UPDATE ... WHERE loan_number IN (...) statements rather than a save per loan.
+    # A loan is only marked repriced through its reset date once every variable period is priced,
+    # so periods missing base rate history are retried on later runs. Unsupported periods do not
+    # hold the loan back, so they are reported once per reset date. With dry_run the changes are
+    # returned without writing anything.
+    changes = repricing_changes(as_of, history)
+    if dry_run:
+        return changes
+
+    groups = defaultdict(list)
+    for change in changes:
+        values = {} if change['missing'] else {'rate_last_repriced_date': change['reset_date']}
+        values.update({field: rate['new'] for field, rate in change['rates'].items()})
+        if values:
+            groups[tuple(sorted(values.items()))].append(change['loan_number'])
+
+    with transaction.atomic():
+        for values, loan_numbers in groups.items():
+            for start in range(0, len(loan_numbers), UPDATE_CHUNK_SIZE):
+                Loan.objects.filter(loan_number__in=loan_numbers[start:start + UPDATE_CHUNK_SIZE]).update(**dict(values))
+    # The updates skip Loan.save, so the repriced borrowers' cached debt service is dropped here.
+    debt_service.invalidate(change['borrower_id'] for change in changes)
+    return changes
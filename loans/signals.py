@@ -1,21 +1,71 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
 from django.dispatch import receiver
+from relationships.models import Business, Individual
 from .models import Loan, CustomField, LoanCustomFieldValue
+from . import debt_service, exposure
 
-@receiver(post_save, sender=Loan)
-def create_loan_custom_fields(sender, instance, created, **kwargs):
-    if created:
-        custom_fields = CustomField.objects.all()
-        for custom_field in custom_fields:
-            LoanCustomFieldValue.objects.create(loan=instance, custom_field=custom_field)
-
-@receiver(post_save, sender=CustomField)
-def create_custom_field_for_loans(sender, instance, created, **kwargs):
-    if created:
-        loans = Loan.objects.all()
-        for loan in loans:
-            LoanCustomFieldValue.objects.create(loan=loan, custom_field=instance)
+# Custom field values are stored sparsely (see LoanCustomFieldValue), so neither new loans nor
+# new custom fields need rows created up front.
 
 @receiver(post_delete, sender=CustomField)
 def delete_custom_field_values(sender, instance, **kwargs):
     LoanCustomFieldValue.objects.filter(custom_field=instance).delete()
+
+# Exposure summaries are maintained incrementally: each loan remembers the values it was loaded
+# with, and a save moves its contribution from those values to the new ones.
+@receiver(post_init, sender=Loan)
+def snapshot_loan_exposure(sender, instance, **kwargs):
+    instance._exposure_snapshot = exposure.snapshot(instance)
+
+@receiver(pre_save, sender=Loan)
+def capture_loan_exposure(sender, instance, **kwargs):
+    previous = instance._exposure_snapshot
+    if instance._state.adding or len(previous) < len(exposure.SNAPSHOT_FIELDS):
+        # New instances may still overwrite an existing loan number, and deferred loads lack old values.
+        previous = Loan.objects.filter(pk=instance.pk).values(*exposure.SNAPSHOT_FIELDS).first()
+    instance._exposure_previous = previous
+
+@receiver(post_save, sender=Loan)
+def update_loan_exposure(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    exposure.loan_saved(instance, created, instance._exposure_previous)
+    instance._exposure_snapshot = exposure.snapshot(instance)
+
+@receiver(pre_delete, sender=Loan)
+def capture_deleted_loan_exposure(sender, instance, **kwargs):
+    instance._exposure_deleted = {field: getattr(instance, field) for field in exposure.SNAPSHOT_FIELDS}
+
+@receiver(post_delete, sender=Loan)
+def remove_loan_exposure(sender, instance, **kwargs):
+    exposure.loan_deleted(instance._exposure_deleted)
+
+# Cached debt service is per borrower; a save can change the loan's terms, rates, status or borrower.
+@receiver(post_save, sender=Loan)
+def invalidate_loan_debt_service(sender, instance, raw=False, **kwargs):
+    previous = instance._exposure_previous or {}
+    debt_service.invalidate([instance.borrower_id, previous.get('borrower_id')])
+
+@receiver(post_delete, sender=Loan)
+def invalidate_deleted_loan_debt_service(sender, instance, **kwargs):
+    debt_service.invalidate([instance.borrower_id])
+
+# Borrower state and county come from the borrower's parties, so an address change moves the
+# borrower's loans between location keys.
+@receiver(pre_save, sender=Business)
+@receiver(pre_save, sender=Individual)
+@receiver(pre_delete, sender=Business)
+@receiver(pre_delete, sender=Individual)
+def capture_borrower_location(sender, instance, **kwargs):
+    instance._exposure_location = None
+    if Loan.objects.filter(borrower_id=instance.affiliate_id).exists():
+        instance._exposure_location = exposure.borrower_location(instance.affiliate_id)
+
+@receiver(post_save, sender=Business)
+@receiver(post_save, sender=Individual)
+@receiver(post_delete, sender=Business)
+@receiver(post_delete, sender=Individual)
+def update_borrower_location(sender, instance, raw=False, **kwargs):
+    before = getattr(instance, '_exposure_location', None)
+    if before is not None and not raw:
+        exposure.borrower_moved(instance.affiliate_id, before, exposure.borrower_location(instance.affiliate_id))
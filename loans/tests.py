@@ -1,3 +1,38 @@
-from django.test import TestCase
+import random
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .amortization import PAYMENTS_PER_YEAR, RATE_UNITS, amortize, reference_schedule
 
 # Create your tests here.
+
+class BatchScheduleTests(SimpleTestCase):
+    def random_terms(self, rng):
+        payments_per_year = rng.choice(list(PAYMENTS_PER_YEAR.values()))
+        term_payments = rng.randint(1, 4 * payments_per_year)
+        # Amortizations shorter than, equal to and (balloons) longer than the term.
+        amortization_payments = rng.choice([term_payments, rng.randint(1, term_payments), rng.randint(term_payments, 10 * payments_per_year)])
+        return {
+            'principal': rng.randint(1, 10 ** 11),
+            'rate_1': rng.choice([0, rng.randint(1, 25 * RATE_UNITS // 100)]),
+            'rate_2': rng.choice([0, rng.randint(1, 25 * RATE_UNITS // 100)]),
+            'rate_switch': rng.randint(0, term_payments),
+            'term_payments': term_payments,
+            'amortization_payments': amortization_payments,
+            'payments_per_year': payments_per_year,
+            'interest_only': rng.random() < 0.2,
+        }
+
+    def test_batch_engine_matches_reference_to_the_cent(self):
+        rng = random.Random(1)
+        loans = [self.random_terms(rng) for _ in range(1000)]
+        columns = {key: np.array([terms[key] for terms in loans]) for key in loans[0]}
+        payment, interest, principal, balance = amortize(**columns)
+
+        for index, terms in enumerate(loans):
+            expected = reference_schedule(terms)
+            actual = list(zip(payment[index], interest[index], principal[index], balance[index]))[:terms['term_payments']]
+            with self.subTest(loan=index, terms=terms):
+                self.assertEqual(actual, expected)
+                self.assertFalse(payment[index, terms['term_payments']:].any())
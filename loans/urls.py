@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import LoanDetailView, LoanListView, LoanCreateView, LoanUpdateView, LoanDeleteView
+from .views import LoanDetailView, LoanListView, LoanCreateView, LoanUpdateView, LoanDeleteView, exposure_dashboard, export_loans, export_use_of_proceeds, import_loans_view, affiliate_exposure
 
 app_name = 'loan'
 
@@ -9,4 +9,9 @@ urlpatterns = [
     path('<int:pk>/', LoanDetailView.as_view(), name='detail'),
     path('<int:pk>/update/', LoanUpdateView.as_view(), name='update'),
     path('<int:pk>/delete/', LoanDeleteView.as_view(), name='delete'),
+    path('exposure/', exposure_dashboard, name='exposure_dashboard'),
+    path('exposure/affiliate/<int:affiliate_id>/', affiliate_exposure, name='affiliate_exposure'),
+    path('export/<str:export_format>/', export_loans, name='export'),
+    path('import/', import_loans_view, name='import'),
+    path('export/use-of-proceeds/<str:export_format>/', export_use_of_proceeds, name='export_use_of_proceeds'),
 ]
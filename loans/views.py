@@ -1,12 +1,136 @@
+import base64
+import json
+
 from django.views.generic import ListView, DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-from .models import Loan
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.db.models import F, Q
+from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_POST
+from opnlend.exports import streaming_export
+from users.models import User
+from .models import Loan, ExposureSummary, CustomField, UseOfProceedsAllocation
+from . import exposure
+from .importer import IMPORT_FORMATS, import_loans_file
+from .relationship_exposure import LENDING_LIMIT_ERROR, lending_limit_breaches, relationship_exposure
+
+# Account role foreign keys rendered on the loan list.
+LOAN_ROLE_FIELDS = ('loan_officer', 'credit_analyst', 'underwriter', 'portfolio_manager')
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise BadRequest('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != 2:
+        raise BadRequest('Invalid cursor.')
+    return values
 
+
+# Keyset pagination: each page starts after the (sort value, loan_number) of the previous page's
+# last row instead of using OFFSET, so every page costs the same index range scan no matter how
+# deep it is. The program, type and officer sorts/filters are backed by the composite indexes
+# on Loan. Only the columns the list renders are selected, and the borrower, guarantor and
+# account roles are joined in the same query.
 class LoanListView(ListView):
     model = Loan
     template_name = 'loan_list.html'
     context_object_name = 'loans'
+    page_size = 50
+    sort_fields = {
+        'loan_number': 'loan_number',
+        'program': 'loan_program',
+        'type': 'loan_type',
+        'officer': 'loan_officer',
+    }
+    filter_fields = {
+        'program': ('loan_program', dict(Loan.LOAN_PROGRAM_CHOICES)),
+        'type': ('loan_type', dict(Loan.LOAN_TYPE_CHOICES)),
+        'officer': ('loan_officer', None),
+    }
+    list_columns = ('loan_number', 'loan_program', 'loan_type', 'loan_amount', 'loan_term', 'borrower__affiliate_code', 'guarantor__affiliate_code')
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort', 'loan_number')
+        if sort not in self.sort_fields:
+            raise BadRequest(f'Unknown sort {sort!r}.')
+        return sort
+
+    def get_filters(self):
+        filters = {}
+        for param, (field, choices) in self.filter_fields.items():
+            value = self.request.GET.get(param)
+            if not value:
+                continue
+            if choices is not None and value not in choices:
+                raise BadRequest(f'Unknown {param} {value!r}.')
+            if choices is None:
+                if not value.isdigit():
+                    raise BadRequest(f'Invalid {param} {value!r}.')
+                value = int(value)
+            filters[field] = value
+        return filters
+
+    def get_projection(self):
+        # The role foreign keys point at users.User, which is not the configured auth user model.
+        username_field = User.USERNAME_FIELD
+        roles = [f'{role}__{username_field}' for role in LOAN_ROLE_FIELDS]
+        return ['borrower', 'guarantor', *LOAN_ROLE_FIELDS, *self.list_columns, *roles]
+
+    def get_queryset(self):
+        sort_field = self.sort_fields[self.get_sort()]
+        queryset = (
+            Loan.objects.filter(**self.get_filters())
+            .select_related('borrower', 'guarantor', *LOAN_ROLE_FIELDS)
+            .only(*self.get_projection())
+        )
+        if sort_field == 'loan_number':
+            queryset = queryset.order_by('loan_number')
+        else:
+            # loan_officer is nullable; NULLS LAST is spelled out so the keyset condition below holds on every backend.
+            queryset = queryset.order_by(F(sort_field).asc(nulls_last=True), 'loan_number')
+
+        cursor = self.request.GET.get('cursor')
+        if cursor:
+            queryset = queryset.filter(self.after_cursor(sort_field, *decode_cursor(cursor)))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            last = rows[-1]
+            sort_value = getattr(last, Loan._meta.get_field(sort_field).attname)
+            self.next_cursor = encode_cursor([sort_value, last.loan_number])
+        return rows
+
+    @staticmethod
+    def after_cursor(sort_field, sort_value, loan_number):
+        if sort_field == 'loan_number':
+            return Q(loan_number__gt=loan_number)
+        if sort_value is None:
+            return Q(**{f'{sort_field}__isnull': True, 'loan_number__gt': loan_number})
+        return (
+            Q(**{f'{sort_field}__gt': sort_value})
+            | Q(**{sort_field: sort_value, 'loan_number__gt': loan_number})
+            | Q(**{f'{sort_field}__isnull': True})
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        context['sort'] = self.get_sort()
+        context['filters'] = {param: self.request.GET.get(param, '') for param in self.filter_fields}
+        context['next_cursor'] = self.next_cursor
+        context['query_string'] = params.urlencode()
+        return context
 
 class LoanDetailView(DetailView):
     model = Loan
@@ -18,6 +142,13 @@ class LoanCreateView(CreateView):
     template_name = 'loan_form.html'
     fields = '__all__'
 
+    def form_valid(self, form):
+        for affiliate_id, current, proposed in lending_limit_breaches(form.instance):
+            form.add_error('loan_amount', LENDING_LIMIT_ERROR.format(affiliate_id=affiliate_id, proposed=proposed, current=current))
+        if form.errors:
+            return self.form_invalid(form)
+        return super().form_valid(form)
+
 class LoanUpdateView(UpdateView):
     model = Loan
     template_name = 'loan_form.html'
@@ -27,3 +158,73 @@ class LoanDeleteView(DeleteView):
     model = Loan
     template_name = 'loan_confirm_delete.html'
     success_url = reverse_lazy('loan_list')
+
+#Executive exposure dashboard data, read from the pre-aggregated ExposureSummary rows.
+def exposure_dashboard(request):
+    if not exposure.can_view_dashboard(request.user):
+        raise PermissionDenied
+    user_names = {}
+    user_keys = ExposureSummary.objects.filter(dimension__in=['loan_officer', 'portfolio_manager']).exclude(key='').values_list('key', flat=True)
+    if user_keys:
+        user_names = {str(user.pk): str(user) for user in User.objects.filter(pk__in=set(user_keys))}
+
+    dimensions = {dimension: [] for dimension, _ in ExposureSummary.DIMENSION_CHOICES}
+    for summary in ExposureSummary.objects.filter(loan_count__gt=0).order_by('dimension', '-total_amount'):
+        dimensions[summary.dimension].append({
+            'key': summary.key,
+            'label': user_names.get(summary.key, summary.key),
+            'loan_count': summary.loan_count,
+            'total_amount': str(summary.total_amount),
+        })
+    return JsonResponse({'dimensions': dimensions})
+
+#Streaming NDJSON/CSV extracts for the data warehouse. Custom fields can be added as columns with ?custom_fields=Name,Other Name.
+@staff_member_required
+def export_loans(request, export_format):
+    fields = [field.attname for field in Loan._meta.concrete_fields]
+    headers = list(fields)
+    queryset = Loan.objects.order_by('loan_number')
+
+    names = [name.strip() for name in request.GET.get('custom_fields', '').split(',') if name.strip()]
+    if names:
+        aliases = {f'custom_field_{index}': name for index, name in enumerate(names)}
+        try:
+            queryset = queryset.with_custom_fields(**aliases)
+        except CustomField.DoesNotExist as exc:
+            raise BadRequest(str(exc))
+        fields += list(aliases)
+        headers += names
+    return streaming_export(queryset, fields, export_format, 'loans', headers=headers)
+
+@staff_member_required
+def export_use_of_proceeds(request, export_format):
+    queryset = UseOfProceedsAllocation.objects.order_by('use_of_proceeds_category__loan_id', 'use_of_proceeds_category_id', 'pk')
+    fields = [
+        'use_of_proceeds_category__loan_id',
+        'use_of_proceeds_category_id',
+        'use_of_proceeds_category__category',
+        'use_of_proceeds_category__description',
+        'column',
+        'amount',
+    ]
+    headers = ['loan_number', 'category_id', 'category', 'description', 'column', 'amount']
+    return streaming_export(queryset, fields, export_format, 'use_of_proceeds', headers=headers)
+
+#Bulk loan boarding: accepts a CSV or JSON Lines upload and returns the per-row error report.
+@staff_member_required
+@require_POST
+def import_loans_view(request):
+    upload = request.FILES.get('file')
+    if upload is None:
+        raise BadRequest('No file uploaded.')
+    import_format = request.POST.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+    if import_format not in IMPORT_FORMATS:
+        raise BadRequest(f'Unknown import format {import_format!r}.')
+    result = import_loans_file(upload.file, import_format)
+    return JsonResponse(result.as_dict(), status=200 if not result.errors else 207)
+
+#Direct, guaranteed and indirect (through controlled affiliates) exposure of one relationship.
+@staff_member_required
+def affiliate_exposure(request, affiliate_id):
+    values = relationship_exposure([affiliate_id])[affiliate_id]
+    return JsonResponse({'affiliate_id': affiliate_id, **{key: str(amount) for key, amount in values.items()}})
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     #wagtail api apps
     'wagtail.api.v2',
     'rest_framework',
@@ -170,6 +171,15 @@ ACCOUNT_ACTIVATION_DAYS = 7
 LOGIN_REDIRECT_URL = '/'
 
 
+# Legal lending limit per relationship (direct + guaranteed + indirect exposure). New loans that
+# would take a relationship over it are rejected; None disables the check.
+LEGAL_LENDING_LIMIT = None
+
+# HMAC key for the hashed SSN/EIN tokens in the party search index; falls back to SECRET_KEY.
+# Changing it requires `manage.py rebuild_party_search_index`.
+SEARCH_TOKEN_KEY = None
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
 
@@ -44,6 +44,8 @@ urlpatterns = [
     path('sitemap.xml', sitemap),
     # Your custom app URLs
     path('loans/', include('loans.urls')),
+    path('relationships/', include('relationships.urls')),
+    path('spreading/', include('spreading.urls')),
     # Wagtail URLs should be placed last
     path('', include(wagtail_urls)),
     # ... any other URL patterns ...
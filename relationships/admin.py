@@ -1,3 +1,26 @@
 from django.contrib import admin
+from django.utils import timezone
+from users.models import User
+from .models import DuplicateCandidate
 
 # Register your models here.
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = ('left_affiliate', 'right_affiliate', 'party_type', 'score', 'reasons', 'status', 'reviewed_by')
+    list_filter = ('status', 'party_type')
+    ordering = ('status', '-score')
+    readonly_fields = ('party_type', 'left_uuid', 'right_uuid', 'left_affiliate', 'right_affiliate', 'score', 'reasons', 'found_at', 'reviewed_by', 'reviewed_at')
+    actions = ('mark_confirmed', 'mark_rejected')
+
+    def _review(self, request, queryset, status):
+        # reviewed_by points at users.User, not the auth user making the request.
+        reviewer = User.objects.filter(username=request.user.get_username()).first()
+        queryset.update(status=status, reviewed_by=reviewer, reviewed_at=timezone.now())
+
+    @admin.action(description='Mark selected pairs as duplicates')
+    def mark_confirmed(self, request, queryset):
+        self._review(request, queryset, 'CONFIRMED')
+
+    @admin.action(description='Mark selected pairs as not duplicates')
+    def mark_rejected(self, request, queryset):
+        self._review(request, queryset, 'REJECTED')
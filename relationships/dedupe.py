@@ -0,0 +1,154 @@
+import os
+from collections import defaultdict, namedtuple
+from difflib import SequenceMatcher
+from itertools import combinations
+from multiprocessing import Pool
+
+from django.db import transaction
+
+from .models import Individual, Business, DuplicateCandidate
+from .search import normalize, token_hash
+
+# Candidate pairs with a score below this are not queued for review.
+MIN_SCORE = 0.75
+
+# Blocks larger than this (e.g. every party in one busy zip code on a common date) are skipped:
+# they would add many pairs while telling us little.
+MAX_BLOCK_SIZE = 200
+
+# Candidate pairs scored per task sent to a worker process.
+PAIR_CHUNK_SIZE = 20000
+
+# Rows read per round-trip when loading parties, and written per bulk_create.
+LOAD_CHUNK_SIZE = 5000
+WRITE_CHUNK_SIZE = 2000
+
+# Words dropped from business names before comparing them.
+BUSINESS_NAME_STOPWORDS = frozenset(('the', 'llc', 'inc', 'corp', 'corporation', 'co', 'company', 'ltd', 'lp', 'llp', 'pllc', 'pc'))
+
+# Score weights; they sum to 1.
+WEIGHTS = {'tax_id': 0.45, 'name': 0.35, 'date': 0.1, 'zip_code': 0.1}
+
+Party = namedtuple('Party', 'uuid affiliate_id party_type name zip_code date tax_id')
+
+
+def name_key(name, party_type):
+    # Normalized words in sorted order, so 'Smith John' and 'John Smith' compare equal.
+    words = normalize(name).split()
+    if party_type == 'BUSINESS':
+        words = [word for word in words if word not in BUSINESS_NAME_STOPWORDS]
+    return ' '.join(sorted(words))
+
+
+def load_parties():
+    parties = []
+    individuals = Individual.objects.values_list('uuid', 'affiliate_id', 'first_name', 'last_name', 'zip_code', 'dob', 'ssn')
+    for uuid, affiliate_id, first_name, last_name, zip_code, dob, ssn in individuals.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        parties.append(Party(uuid, affiliate_id, 'INDIVIDUAL', name_key(f'{first_name} {last_name}', 'INDIVIDUAL'), zip_code[:5], dob, token_hash(ssn)))
+    businesses = Business.objects.values_list('uuid', 'affiliate_id', 'entity_name', 'zip_code', 'date_of_formation', 'ein')
+    for uuid, affiliate_id, entity_name, zip_code, formed, ein in businesses.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        parties.append(Party(uuid, affiliate_id, 'BUSINESS', name_key(entity_name, 'BUSINESS'), zip_code[:5], formed, token_hash(ein)))
+    return parties
+
+
+def blocking_keys(party):
+    keys = [('tax_id', party.tax_id)]
+    if party.name:
+        keys.append(('name_zip', party.name, party.zip_code))
+        keys.append(('name_date', party.name, party.date))
+    keys.append(('zip_date', party.zip_code, party.date))
+    return [(party.party_type, *key) for key in keys]
+
+
+def candidate_pairs(parties):
+    # Index pairs (i, j), i < j, sharing at least one blocking key and belonging to different
+    # affiliates. Only parties in a common block are ever compared, which keeps the work near
+    # linear in the number of parties rather than quadratic.
+    blocks = defaultdict(list)
+    for index, party in enumerate(parties):
+        for key in blocking_keys(party):
+            blocks[key].append(index)
+    pairs = set()
+    for members in blocks.values():
+        if 2 <= len(members) <= MAX_BLOCK_SIZE:
+            for i, j in combinations(members, 2):
+                if parties[i].affiliate_id != parties[j].affiliate_id:
+                    pairs.add((i, j))
+    return sorted(pairs)
+
+
+def score_pair(left, right):
+    reasons = []
+    score = 0.0
+    if left.tax_id == right.tax_id:
+        score += WEIGHTS['tax_id']
+        reasons.append('tax_id')
+    similarity = SequenceMatcher(None, left.name, right.name).ratio() if left.name and right.name else 0.0
+    score += WEIGHTS['name'] * similarity
+    if similarity >= 0.9:
+        reasons.append('name')
+    if left.date == right.date:
+        score += WEIGHTS['date']
+        reasons.append('date')
+    if left.zip_code == right.zip_code:
+        score += WEIGHTS['zip_code']
+        reasons.append('zip_code')
+    return round(score, 3), reasons
+
+
+# Worker processes receive the party list once, through the pool initializer.
+_parties = None
+
+
+def _init_worker(parties):
+    global _parties
+    _parties = parties
+
+
+def _score_chunk(args):
+    pairs, min_score = args
+    matches = []
+    for i, j in pairs:
+        score, reasons = score_pair(_parties[i], _parties[j])
+        if score >= min_score:
+            matches.append((i, j, score, reasons))
+    return matches
+
+
+def score_pairs(parties, pairs, min_score=MIN_SCORE, workers=None):
+    chunks = [(pairs[start:start + PAIR_CHUNK_SIZE], min_score) for start in range(0, len(pairs), PAIR_CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        _init_worker(parties)
+        return [match for chunk in chunks for match in _score_chunk(chunk)]
+    with Pool(workers, initializer=_init_worker, initargs=(parties,)) as pool:
+        return [match for matches in pool.imap_unordered(_score_chunk, chunks) for match in matches]
+
+
+@transaction.atomic
+def write_candidates(parties, matches):
+    # Replaces the pending review queue. Pairs already confirmed or rejected keep their decision.
+    DuplicateCandidate.objects.filter(status='PENDING').delete()
+    candidates = []
+    for i, j, score, reasons in matches:
+        left, right = sorted((parties[i], parties[j]), key=lambda party: str(party.uuid))
+        candidates.append(DuplicateCandidate(
+            party_type=left.party_type,
+            left_uuid=left.uuid,
+            right_uuid=right.uuid,
+            left_affiliate_id=left.affiliate_id,
+            right_affiliate_id=right.affiliate_id,
+            score=score,
+            reasons=reasons,
+        ))
+    DuplicateCandidate.objects.bulk_create(candidates, batch_size=WRITE_CHUNK_SIZE, ignore_conflicts=True)
+
+
+def find_duplicates(min_score=MIN_SCORE, workers=None):
+    # Batch entity resolution over every Individual and Business: block, score candidate pairs in
+    # worker processes, and queue the likely duplicates for review. Returns run statistics.
+    parties = load_parties()
+    pairs = candidate_pairs(parties)
+    matches = score_pairs(parties, pairs, min_score, workers)
+    write_candidates(parties, matches)
+    return {'parties': len(parties), 'pairs': len(pairs), 'candidates': len(matches)}
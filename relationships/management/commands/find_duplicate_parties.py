@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from relationships import dedupe
+
+
+class Command(BaseCommand):
+    help = 'Finds probable duplicate Individuals and Businesses across affiliates and queues them for review.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-score', type=float, default=dedupe.MIN_SCORE)
+        parser.add_argument('--workers', type=int, help='Worker processes for scoring; defaults to the CPU count.')
+
+    def handle(self, *args, **options):
+        stats = dedupe.find_duplicates(options['min_score'], options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Compared {stats['pairs']} candidate pairs among {stats['parties']} parties; "
+            f"{stats['candidates']} queued for review."
+        ))
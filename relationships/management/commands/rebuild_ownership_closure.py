@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from relationships import ownership
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the beneficial ownership closure table from every BeneficialOwnership row.'
+
+    def handle(self, *args, **options):
+        count = ownership.rebuild_closure()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} ownership closure rows.'))
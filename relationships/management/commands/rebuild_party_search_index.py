@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from relationships import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the party search index from every Individual and Business.'
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} parties.'))
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.8 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationships', '0003_alter_affiliate_affiliate_code_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnershipClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_percentage', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owned_closure', to='relationships.affiliate')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owner_closure', to='relationships.affiliate')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'effective_percentage'], name='closure_descendant_pct_idx'), models.Index(fields=['ancestor', 'effective_percentage'], name='closure_ancestor_pct_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ownershipclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_ownership_closure_pair'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.8 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationships', '0004_ownershipclosure'),
+    ]
+
+    operations = [
+        # The trigram indexes below need pg_trgm's gin_trgm_ops operator class.
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='PartySearchIndex',
+            fields=[
+                ('party_uuid', models.UUIDField(primary_key=True, serialize=False)),
+                ('party_type', models.CharField(choices=[('INDIVIDUAL', 'Individual'), ('BUSINESS', 'Business Entity')], max_length=10)),
+                ('display_name', models.CharField(max_length=160)),
+                ('search_name', models.CharField(max_length=160)),
+                ('search_address', models.CharField(max_length=260)),
+                ('tax_id_hash', models.CharField(db_index=True, max_length=64)),
+                ('tax_id_last_four_hash', models.CharField(db_index=True, max_length=64)),
+                ('affiliate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='relationships.affiliate')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_name'], name='party_search_name_trgm', opclasses=['gin_trgm_ops']), django.contrib.postgres.indexes.GinIndex(fields=['search_address'], name='party_search_address_trgm', opclasses=['gin_trgm_ops']), models.Index(fields=['search_name'], name='party_search_name_prefix', opclasses=['varchar_pattern_ops']), models.Index(fields=['search_address'], name='party_search_address_prefix', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.8 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('relationships', '0005_partysearchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('party_type', models.CharField(choices=[('INDIVIDUAL', 'Individual'), ('BUSINESS', 'Business Entity')], max_length=10)),
+                ('left_uuid', models.UUIDField()),
+                ('right_uuid', models.UUIDField()),
+                ('score', models.DecimalField(decimal_places=3, max_digits=4)),
+                ('reasons', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending Review'), ('CONFIRMED', 'Confirmed Duplicate'), ('REJECTED', 'Not a Duplicate')], default='PENDING', max_length=10)),
+                ('found_at', models.DateTimeField(auto_now_add=True)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('left_affiliate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='relationships.affiliate')),
+                ('reviewed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.user')),
+                ('right_affiliate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='relationships.affiliate')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', '-score'], name='duplicate_status_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='duplicatecandidate',
+            constraint=models.UniqueConstraint(fields=('left_uuid', 'right_uuid'), name='unique_duplicate_candidate_pair'),
+        ),
+    ]
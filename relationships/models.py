@@ -1,5 +1,7 @@
 from django.db import models
 import uuid
+from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex
 from django.db.models import UniqueConstraint
 
 class Affiliate(models.Model):
@@ -88,3 +90,100 @@ class BeneficialOwnership(models.Model):
 
     def __str__(self):
         return f"{self.owner_individual or self.owner_business}: {self.ownership_percentage}%"
+
+    def owner_affiliate_id(self):
+        owner = self.owner_individual or self.owner_business
+        return owner.affiliate_id if owner else None
+
+    def clean(self):
+        from .ownership import creates_cycle
+        if (self.owner_individual_id is None) == (self.owner_business_id is None):
+            raise ValidationError('Exactly one of Owner Individual or Owner Business is required.')
+        if creates_cycle(self.owner_affiliate_id(), self.affiliate_id, exclude=self.pk):
+            raise ValidationError('This ownership would make the affiliate (indirectly) own itself.')
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        super().save(*args, **kwargs)
+
+class OwnershipClosure(models.Model):
+    # Precomputed effective ownership of `descendant` by `ancestor` through any chain of
+    # BeneficialOwnership rows, summed over every path (e.g. 50% of a business that owns 60% of
+    # the descendant is 30%). Maintained by relationships.ownership; never edited by hand.
+    ancestor = models.ForeignKey(Affiliate, on_delete=models.CASCADE, related_name='owned_closure')
+    descendant = models.ForeignKey(Affiliate, on_delete=models.CASCADE, related_name='owner_closure')
+    effective_percentage = models.DecimalField(max_digits=9, decimal_places=4)
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_ownership_closure_pair')
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'effective_percentage'], name='closure_descendant_pct_idx'),
+            models.Index(fields=['ancestor', 'effective_percentage'], name='closure_ancestor_pct_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor} -> {self.descendant}: {self.effective_percentage}%"
+
+class PartySearchIndex(models.Model):
+    # Search document for one Individual or Business, maintained by relationships.search. Names
+    # and addresses are stored normalized for trigram and prefix matching; SSNs and EINs only as
+    # keyed hashes of the full number and of its last four digits, never as raw values.
+    PARTY_TYPE_CHOICES = [
+        ('INDIVIDUAL', 'Individual'),
+        ('BUSINESS', 'Business Entity'),
+    ]
+
+    party_uuid = models.UUIDField(primary_key=True)
+    party_type = models.CharField(max_length=10, choices=PARTY_TYPE_CHOICES)
+    affiliate = models.ForeignKey(Affiliate, on_delete=models.CASCADE, related_name='search_entries')
+    display_name = models.CharField(max_length=160)
+    search_name = models.CharField(max_length=160)
+    search_address = models.CharField(max_length=260)
+    tax_id_hash = models.CharField(max_length=64, db_index=True)
+    tax_id_last_four_hash = models.CharField(max_length=64, db_index=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_name'], name='party_search_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['search_address'], name='party_search_address_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['search_name'], name='party_search_name_prefix', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['search_address'], name='party_search_address_prefix', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return self.display_name
+
+class DuplicateCandidate(models.Model):
+    # A pair of Individual or Business rows under different affiliates that the duplicate-party job
+    # (relationships.dedupe) scored as probably the same party, awaiting review.
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending Review'),
+        ('CONFIRMED', 'Confirmed Duplicate'),
+        ('REJECTED', 'Not a Duplicate'),
+    ]
+
+    party_type = models.CharField(max_length=10, choices=PartySearchIndex.PARTY_TYPE_CHOICES)
+    left_uuid = models.UUIDField()
+    right_uuid = models.UUIDField()
+    left_affiliate = models.ForeignKey(Affiliate, on_delete=models.CASCADE, related_name='+')
+    right_affiliate = models.ForeignKey(Affiliate, on_delete=models.CASCADE, related_name='+')
+    score = models.DecimalField(max_digits=4, decimal_places=3)
+    reasons = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    found_at = models.DateTimeField(auto_now_add=True)
+    reviewed_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['left_uuid', 'right_uuid'], name='unique_duplicate_candidate_pair')
+        ]
+        indexes = [
+            models.Index(fields=['status', '-score'], name='duplicate_status_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.left_affiliate} / {self.right_affiliate}: {self.score}"
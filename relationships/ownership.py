@@ -0,0 +1,161 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import BeneficialOwnership, OwnershipClosure
+
+# Effective ownership at or above which an owner is a beneficial owner for KYC purposes.
+KYC_OWNERSHIP_THRESHOLD = Decimal('25')
+
+HUNDRED = Decimal(100)
+PERCENTAGE_PLACES = Decimal('0.0001')
+
+# Affiliates per IN (...) when deleting stale closure rows.
+DELETE_CHUNK_SIZE = 1000
+
+_EDGE_FIELDS = ('affiliate_id', 'owner_individual__affiliate_id', 'owner_business__affiliate_id', 'ownership_percentage')
+
+
+class OwnershipCycleError(Exception):
+    pass
+
+
+def _add_edges(owners, rows):
+    # owners: {owned affiliate: {owner affiliate: fraction owned}}; parallel rows are summed.
+    for owned, individual_owner, business_owner, percentage in rows:
+        owner = individual_owner or business_owner
+        if owner is not None:
+            owners[owned][owner] = owners[owned].get(owner, Decimal(0)) + percentage / HUNDRED
+
+
+def owner_graph(affiliate_ids, exclude=None):
+    # Upward ownership edges of `affiliate_ids` and everything that owns them, loaded one level
+    # (one query) at a time. Iterative, so chain depth is not limited by the recursion limit.
+    owners = defaultdict(dict)
+    seen = set(affiliate_ids)
+    frontier = set(affiliate_ids)
+    while frontier:
+        rows = BeneficialOwnership.objects.filter(affiliate_id__in=frontier)
+        if exclude is not None:
+            rows = rows.exclude(pk=exclude)
+        _add_edges(owners, rows.values_list(*_EDGE_FIELDS))
+        frontier = {owner for owned in frontier for owner in owners.get(owned, ())} - seen
+        seen |= frontier
+    return owners
+
+
+def descendant_ids(affiliate_ids):
+    # Every affiliate owned, directly or through other affiliates, by any of `affiliate_ids`.
+    descendants = set()
+    frontier = set(affiliate_ids)
+    while frontier:
+        owned = set(
+            BeneficialOwnership.objects
+            .filter(Q(owner_individual__affiliate_id__in=frontier) | Q(owner_business__affiliate_id__in=frontier))
+            .values_list('affiliate_id', flat=True)
+        )
+        frontier = owned - descendants
+        descendants |= frontier
+    return descendants
+
+
+def creates_cycle(owner_id, owned_id, exclude=None):
+    # Whether an ownership of `owned_id` by `owner_id` would close a loop, i.e. `owned_id` already
+    # (indirectly) owns `owner_id`. `exclude` leaves out the ownership row being edited.
+    if owner_id is None or owned_id is None:
+        return False
+    if owner_id == owned_id:
+        return True
+    return any(owned_id in edges for edges in owner_graph([owner_id], exclude).values())
+
+
+def effective_owners(affiliate_id, owners):
+    # {ancestor: (effective fraction, shortest depth)} for one affiliate, summing the product of
+    # percentages over every path. Nodes are visited in topological order (Kahn's algorithm), so
+    # each owner's share is complete before it is passed further up; nodes never reached mean a cycle.
+    pending = defaultdict(int)
+    nodes = {affiliate_id}
+    stack = [affiliate_id]
+    while stack:
+        for owner in owners.get(stack.pop(), ()):
+            pending[owner] += 1
+            if owner not in nodes:
+                nodes.add(owner)
+                stack.append(owner)
+
+    share = defaultdict(Decimal)
+    share[affiliate_id] = Decimal(1)
+    depth = {affiliate_id: 0}
+    ready = [affiliate_id] if not pending[affiliate_id] else []
+    visited = 0
+    while ready:
+        node = ready.pop()
+        visited += 1
+        for owner, fraction in owners.get(node, {}).items():
+            share[owner] += share[node] * fraction
+            depth[owner] = min(depth.get(owner, depth[node] + 1), depth[node] + 1)
+            pending[owner] -= 1
+            if not pending[owner]:
+                ready.append(owner)
+    if visited < len(nodes):
+        raise OwnershipCycleError(f'Ownership of affiliate {affiliate_id} is circular.')
+    return {owner: (share[owner], depth[owner]) for owner in nodes if owner != affiliate_id}
+
+
+def closure_rows(affiliate_ids, owners):
+    rows = []
+    for affiliate_id in affiliate_ids:
+        for ancestor, (fraction, depth) in effective_owners(affiliate_id, owners).items():
+            rows.append(OwnershipClosure(
+                ancestor_id=ancestor,
+                descendant_id=affiliate_id,
+                effective_percentage=(fraction * HUNDRED).quantize(PERCENTAGE_PLACES),
+                depth=depth,
+            ))
+    return rows
+
+
+@transaction.atomic
+def refresh_closure(affiliate_ids):
+    # Recomputes the closure rows of the given owned affiliates and everything below them, the only
+    # rows an ownership change on those affiliates can affect.
+    targets = set(affiliate_ids) | descendant_ids(affiliate_ids)
+    rows = closure_rows(targets, owner_graph(targets))
+    targets = list(targets)
+    for start in range(0, len(targets), DELETE_CHUNK_SIZE):
+        OwnershipClosure.objects.filter(descendant_id__in=targets[start:start + DELETE_CHUNK_SIZE]).delete()
+    OwnershipClosure.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+@transaction.atomic
+def rebuild_closure():
+    owners = defaultdict(dict)
+    _add_edges(owners, BeneficialOwnership.objects.values_list(*_EDGE_FIELDS))
+    rows = closure_rows(list(owners), owners)
+    OwnershipClosure.objects.all().delete()
+    OwnershipClosure.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def ultimate_owners(affiliate_id, threshold=KYC_OWNERSHIP_THRESHOLD):
+    # Owners at the top of their chains (owned by nobody) holding at least `threshold`% of the affiliate.
+    return (
+        OwnershipClosure.objects
+        .filter(descendant_id=affiliate_id, effective_percentage__gte=threshold)
+        .filter(~Exists(BeneficialOwnership.objects.filter(affiliate_id=OuterRef('ancestor_id'))))
+        .select_related('ancestor')
+        .order_by('-effective_percentage')
+    )
+
+
+def controlled_affiliates(affiliate_id, threshold=KYC_OWNERSHIP_THRESHOLD):
+    # Everything the affiliate owns at least `threshold`% of, at any depth.
+    return (
+        OwnershipClosure.objects
+        .filter(ancestor_id=affiliate_id, effective_percentage__gte=threshold)
+        .select_related('descendant')
+        .order_by('-effective_percentage')
+    )
@@ -0,0 +1,144 @@
+import hashlib
+import hmac
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Individual, Business, PartySearchIndex
+
+# Results returned per search.
+SEARCH_LIMIT = 25
+
+# Documents written per bulk_create when rebuilding the index.
+INDEX_CHUNK_SIZE = 2000
+
+_NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+_NON_DIGIT = re.compile(r'\D+')
+
+
+def normalize(value):
+    # Lowercase ASCII words separated by single spaces: 'José  O'Brien, Jr.' -> 'jose o brien jr'.
+    value = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode()
+    return _NON_ALPHANUMERIC.sub(' ', value.lower()).strip()
+
+
+def token_hash(value):
+    # Keyed hash of a tax id (or its last four digits). The key keeps the 10^4 / 10^9 possible
+    # values from being brute-forced out of the index without it.
+    key = getattr(settings, 'SEARCH_TOKEN_KEY', None) or settings.SECRET_KEY
+    digits = _NON_DIGIT.sub('', value or '')
+    return hmac.new(key.encode(), digits.encode(), hashlib.sha256).hexdigest()
+
+
+def _join(*parts):
+    return ' '.join(part for part in parts if part)
+
+
+def individual_document(individual):
+    return PartySearchIndex(
+        party_uuid=individual.uuid,
+        party_type='INDIVIDUAL',
+        affiliate_id=individual.affiliate_id,
+        display_name=_join(individual.first_name, individual.middle_name, individual.last_name),
+        search_name=normalize(_join(individual.first_name, individual.middle_name, individual.last_name)),
+        search_address=normalize(_join(individual.address_1, individual.address_2, individual.city, individual.state, individual.zip_code)),
+        tax_id_hash=token_hash(individual.ssn),
+        tax_id_last_four_hash=token_hash(individual.ssn[-4:]),
+    )
+
+
+def business_document(business):
+    return PartySearchIndex(
+        party_uuid=business.uuid,
+        party_type='BUSINESS',
+        affiliate_id=business.affiliate_id,
+        display_name=business.entity_name,
+        search_name=normalize(business.entity_name),
+        search_address=normalize(_join(business.address_1, business.address_2, business.city, business.state, business.zip_code)),
+        tax_id_hash=token_hash(business.ein),
+        tax_id_last_four_hash=token_hash(business.ein[-4:]),
+    )
+
+
+def index_party(document):
+    fields = [field.attname for field in PartySearchIndex._meta.concrete_fields if not field.primary_key]
+    PartySearchIndex.objects.update_or_create(
+        party_uuid=document.party_uuid, defaults={field: getattr(document, field) for field in fields},
+    )
+
+
+def remove_party(party_uuid):
+    PartySearchIndex.objects.filter(party_uuid=party_uuid).delete()
+
+
+@transaction.atomic
+def rebuild_index():
+    PartySearchIndex.objects.all().delete()
+    count = 0
+    for model, document in ((Individual, individual_document), (Business, business_document)):
+        batch = []
+        for party in model.objects.iterator(chunk_size=INDEX_CHUNK_SIZE):
+            batch.append(document(party))
+            if len(batch) == INDEX_CHUNK_SIZE:
+                PartySearchIndex.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        PartySearchIndex.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def _text_matches(queryset, term):
+    # Postgres: prefix match on the name (varchar_pattern_ops index) or trigram similarity on the
+    # name or address (GIN gin_trgm_ops indexes; pg_trgm.similarity_threshold, 0.3 by default),
+    # ranked by similarity with prefix matches first.
+    # Other databases fall back to name prefix and word-prefix matching.
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        return (
+            queryset
+            .filter(Q(search_name__startswith=term) | Q(search_name__trigram_similar=term) | Q(search_address__trigram_similar=term))
+            .annotate(rank=Greatest(
+                Case(When(search_name__startswith=term, then=Value(1.0)), default=Value(0.0), output_field=FloatField()),
+                TrigramSimilarity('search_name', term),
+                TrigramSimilarity('search_address', term) * Value(0.8),
+            ))
+        )
+    return (
+        queryset
+        .filter(Q(search_name__startswith=term) | Q(search_name__contains=f' {term}') | Q(search_address__startswith=term))
+        .annotate(rank=Case(
+            When(search_name__startswith=term, then=Value(1.0)),
+            When(search_name__contains=f' {term}', then=Value(0.8)),
+            default=Value(0.5),
+            output_field=FloatField(),
+        ))
+    )
+
+
+def search_parties(query, party_type=None, limit=SEARCH_LIMIT):
+    # Ranked search across Individuals and Businesses by name, address, full SSN/EIN or its last
+    # four digits. Identifier lookups go through the hashed token indexes and rank above text matches.
+    queryset = PartySearchIndex.objects.select_related('affiliate')
+    if party_type:
+        queryset = queryset.filter(party_type=party_type)
+    digits = _NON_DIGIT.sub('', query)
+    term = normalize(query)
+    if not term:
+        return []
+
+    if digits and len(digits) in (4, 9) and not re.search(r'[a-z]', term):
+        token_field = 'tax_id_last_four_hash' if len(digits) == 4 else 'tax_id_hash'
+        matches = list(queryset.filter(**{token_field: token_hash(digits)}).annotate(rank=Value(2.0, output_field=FloatField()))[:limit])
+        if len(digits) == 9 or len(matches) == limit:
+            return matches
+        # Four digits may also be a street number.
+        found = {match.pk for match in matches}
+        others = queryset.filter(search_address__startswith=term).exclude(pk__in=found).annotate(rank=Value(0.5, output_field=FloatField()))
+        return matches + list(others.order_by('search_name')[:limit - len(matches)])
+
+    return list(_text_matches(queryset, term).order_by(F('rank').desc(), 'search_name')[:limit])
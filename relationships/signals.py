@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from .models import BeneficialOwnership, Individual, Business
+from . import ownership, search
+
+# An ownership row only affects the closure of the affiliate it owns and everything below it, so
+# those rows are recomputed whenever it is saved or deleted.
+@receiver(post_init, sender=BeneficialOwnership)
+def snapshot_owned_affiliate(sender, instance, **kwargs):
+    instance._owned_affiliate_id = instance.__dict__.get('affiliate_id')
+
+@receiver(post_save, sender=BeneficialOwnership)
+def refresh_ownership_closure(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ownership.refresh_closure({instance._owned_affiliate_id, instance.affiliate_id} - {None})
+    instance._owned_affiliate_id = instance.affiliate_id
+
+@receiver(post_delete, sender=BeneficialOwnership)
+def remove_ownership_closure(sender, instance, **kwargs):
+    ownership.refresh_closure({instance.affiliate_id})
+
+# Keep the party search index in step with Individuals and Businesses.
+@receiver(post_save, sender=Individual)
+def index_individual(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_party(search.individual_document(instance))
+
+@receiver(post_save, sender=Business)
+def index_business(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_party(search.business_document(instance))
+
+@receiver(post_delete, sender=Individual)
+@receiver(post_delete, sender=Business)
+def unindex_party(sender, instance, **kwargs):
+    search.remove_party(instance.uuid)
@@ -0,0 +1,11 @@
+from django.urls import path
+from .views import export_affiliates, export_individuals, export_businesses, search
+
+app_name = 'relationships'
+
+urlpatterns = [
+    path('search/', search, name='search'),
+    path('export/affiliates/<str:export_format>/', export_affiliates, name='export_affiliates'),
+    path('export/individuals/<str:export_format>/', export_individuals, name='export_individuals'),
+    path('export/businesses/<str:export_format>/', export_businesses, name='export_businesses'),
+]
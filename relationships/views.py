@@ -1,3 +1,52 @@
 from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models.functions import Right
+from django.http import JsonResponse
+from opnlend.exports import streaming_export
+from .models import Affiliate, Individual, Business, PartySearchIndex
+from .search import search_parties
 
 # Create your views here.
+
+# Streaming NDJSON/CSV extracts for the data warehouse. SSNs and EINs are exported as their
+# last four digits only.
+@staff_member_required
+def export_affiliates(request, export_format):
+    fields = ['affiliate_id', 'affiliate_code', 'affiliate_type']
+    return streaming_export(Affiliate.objects.order_by('affiliate_id'), fields, export_format, 'affiliates')
+
+@staff_member_required
+def export_individuals(request, export_format):
+    fields = [field.attname for field in Individual._meta.concrete_fields if field.name != 'ssn']
+    return streaming_export(
+        Individual.objects.order_by('affiliate_id', 'uuid'), fields, export_format, 'individuals',
+        expressions={'ssn_last_four': Right('ssn', 4)},
+    )
+
+@staff_member_required
+def export_businesses(request, export_format):
+    fields = [field.attname for field in Business._meta.concrete_fields if field.name != 'ein']
+    return streaming_export(
+        Business.objects.order_by('affiliate_id', 'uuid'), fields, export_format, 'businesses',
+        expressions={'ein_last_four': Right('ein', 4)},
+    )
+
+# Ranked party lookup across Individuals and Businesses by name, address, SSN/EIN or its last four.
+@staff_member_required
+def search(request):
+    query = request.GET.get('q', '').strip()
+    party_type = request.GET.get('type')
+    if party_type not in dict(PartySearchIndex.PARTY_TYPE_CHOICES):
+        party_type = None
+    results = search_parties(query, party_type) if query else []
+    return JsonResponse({'results': [
+        {
+            'party_uuid': str(result.party_uuid),
+            'party_type': result.party_type,
+            'affiliate_id': result.affiliate_id,
+            'affiliate_code': result.affiliate.affiliate_code,
+            'name': result.display_name,
+            'rank': round(result.rank, 3),
+        }
+        for result in results
+    ]})
@@ -0,0 +1,178 @@
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+
+from .chart_of_accounts import INCOME_STATEMENT_CHART
+from .models import DerivedStatement, IncomeStatement
+
+# Every income statement amount is a flow over the period, so line items and totals alike are
+# annualized and rolled into trailing twelve months the same way. The totals are sums of the
+# line items, so they stay consistent with them.
+FLOW_FIELDS = (*INCOME_STATEMENT_CHART.inputs, *INCOME_STATEMENT_CHART.totals)
+
+# Businesses refreshed per pass by refresh_all.
+BUSINESS_BATCH_SIZE = 500
+
+Source = namedtuple('Source', 'pk business_id period_ending_date months_in_period version')
+
+
+def year_earlier(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return date(day.year - 1, 2, 28)
+
+
+def _sources(business_ids):
+    return [
+        Source(*row) for row in
+        IncomeStatement.objects
+        .filter(business_name_id__in=business_ids, period_ending_date__isnull=False, months_in_period__isnull=False)
+        .order_by('business_name_id', 'period_ending_date')
+        .values_list('pk', 'business_name_id', 'period_ending_date', 'months_in_period', 'version')
+    ]
+
+
+def derivations(sources):
+    # Which statements each derived statement is computed from:
+    # {(business id, kind, period ending date): (source, ...)}.
+    # Annualized: the period itself. TTM: a fiscal year end is its own TTM; an interim period's
+    # TTM is interim + prior fiscal year end - the prior year's interim covering the same months.
+    # Interim periods without both of those have no TTM.
+    by_date = {(source.business_id, source.period_ending_date): source for source in sources}
+    fiscal_year_ends = defaultdict(list)
+    for source in sources:
+        if source.months_in_period == 12:
+            fiscal_year_ends[source.business_id].append(source.period_ending_date)
+
+    derived = {}
+    for source in sources:
+        business_id, period_ending_date = source.business_id, source.period_ending_date
+        derived[business_id, 'ANNUALIZED', period_ending_date] = (source,)
+        if source.months_in_period == 12:
+            derived[business_id, 'TTM', period_ending_date] = (source,)
+            continue
+        prior_interim = by_date.get((business_id, year_earlier(period_ending_date)))
+        if prior_interim is None or prior_interim.months_in_period != source.months_in_period:
+            continue
+        year_ends = fiscal_year_ends[business_id]
+        position = bisect_left(year_ends, period_ending_date)
+        if position and year_ends[position - 1] > prior_interim.period_ending_date:
+            derived[business_id, 'TTM', period_ending_date] = (source, by_date[business_id, year_ends[position - 1]], prior_interim)
+    return derived
+
+
+def source_versions(sources):
+    return ','.join(f'{source.pk}:{source.version}' for source in sources)
+
+
+def _load_values(business_ids):
+    # Line items and totals of the given businesses' income statements as one float matrix,
+    # with a row index by statement id. Missing amounts count as zero.
+    rows = list(IncomeStatement.objects.filter(business_name_id__in=business_ids).values_list('pk', *FLOW_FIELDS))
+    values = np.array([[0.0 if value is None else float(value) for value in row[1:]] for row in rows], dtype=float)
+    return {row[0]: position for position, row in enumerate(rows)}, values.reshape(len(rows), len(FLOW_FIELDS))
+
+
+def compute(derived, index, values):
+    # Derived statement values for every key in `derived`, computed in one vectorized pass per
+    # kind of derivation: {key: {field: Decimal}}.
+    keys = {'ANNUALIZED': [], 'FYE': [], 'TTM': []}
+    for key, sources in derived.items():
+        kind = 'FYE' if key[1] == 'TTM' and len(sources) == 1 else key[1]
+        keys[kind].append(key)
+
+    computed = {}
+
+    def rows(kind, position):
+        return np.array([index[derived[key][position].pk] for key in keys[kind]], dtype=int)
+
+    if keys['ANNUALIZED']:
+        months = np.array([derived[key][0].months_in_period for key in keys['ANNUALIZED']], dtype=float)
+        computed.update(zip(keys['ANNUALIZED'], values[rows('ANNUALIZED', 0)] * (12 / months)[:, np.newaxis]))
+    if keys['FYE']:
+        computed.update(zip(keys['FYE'], values[rows('FYE', 0)]))
+    if keys['TTM']:
+        computed.update(zip(keys['TTM'], values[rows('TTM', 0)] + values[rows('TTM', 1)] - values[rows('TTM', 2)]))
+
+    return {
+        key: {field: Decimal(f'{amount:.2f}') for field, amount in zip(FLOW_FIELDS, row)}
+        for key, row in computed.items()
+    }
+
+
+def _decimals(values):
+    return {field: None if amount is None else Decimal(amount) for field, amount in values.items()}
+
+
+@transaction.atomic
+def refresh(business_ids):
+    # Brings the derived statements of the given businesses up to date and returns them all:
+    # {(business id, kind, period ending date): {field: Decimal}}. Statements whose sources are
+    # unchanged are read from the table; only businesses with a stale, missing or orphaned
+    # derived statement have their income statements loaded, and those are recomputed together.
+    business_ids = list(business_ids)
+    derived = derivations(_sources(business_ids))
+    existing = {
+        (row.business_id, row.kind, row.period_ending_date): row
+        for row in DerivedStatement.objects.filter(business_id__in=business_ids)
+    }
+    stale = [key for key, sources in derived.items() if key not in existing or existing[key].source_versions != source_versions(sources)]
+    obsolete = [row.pk for key, row in existing.items() if key not in derived]
+
+    results = {key: _decimals(row.values) for key, row in existing.items() if key in derived}
+    if stale:
+        index, values = _load_values(list({key[0] for key in stale}))
+        computed = compute({key: derived[key] for key in stale}, index, values)
+        obsolete.extend(existing[key].pk for key in stale if key in existing)
+        DerivedStatement.objects.filter(pk__in=obsolete).delete()
+        DerivedStatement.objects.bulk_create([
+            DerivedStatement(
+                business_id=key[0], kind=key[1], period_ending_date=key[2],
+                source_versions=source_versions(derived[key]), values=computed[key],
+            )
+            for key in stale
+        ])
+        results.update(computed)
+    elif obsolete:
+        DerivedStatement.objects.filter(pk__in=obsolete).delete()
+    return results
+
+
+def derived_statements(business_ids, kind):
+    # {business id: {period ending date: {field: Decimal}}} for one kind ('ANNUALIZED' or 'TTM').
+    statements = defaultdict(dict)
+    for (business_id, statement_kind, period_ending_date), values in refresh(business_ids).items():
+        if statement_kind == kind:
+            statements[business_id][period_ending_date] = values
+    return dict(statements)
+
+
+def annualized_statements(business_ids):
+    return derived_statements(business_ids, 'ANNUALIZED')
+
+
+def ttm_statements(business_ids):
+    return derived_statements(business_ids, 'TTM')
+
+
+def latest_ttm(business_ids):
+    # Each business's most recent trailing twelve months, for covenant tests:
+    # {business id: (period ending date, {field: Decimal})}.
+    return {
+        business_id: max(statements.items())
+        for business_id, statements in ttm_statements(business_ids).items()
+    }
+
+
+def refresh_all(batch_size=BUSINESS_BATCH_SIZE):
+    # Refreshes derived statements for every business with income statements, `batch_size`
+    # businesses at a time. Returns the number of businesses processed.
+    business_ids = list(IncomeStatement.objects.order_by().values_list('business_name_id', flat=True).distinct())
+    for start in range(0, len(business_ids), batch_size):
+        refresh(business_ids[start:start + batch_size])
+    return len(business_ids)
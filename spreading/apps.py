@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SpreadingConfig(AppConfig):
     name = 'spreading'
+
+    def ready(self):
+        import spreading.signals
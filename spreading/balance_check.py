@@ -0,0 +1,189 @@
+import re
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from .chart_of_accounts import BALANCE_SHEET_CHART
+from .models import BalanceSheet
+
+# Live balance checking while a balance sheet is keyed. The working values of a spread (line
+# items and totals) are kept in the cache between requests, so each request carries only the
+# cells that changed and recomputes only the totals downstream of them. A saved balance sheet's
+# working copies are dropped whenever it is saved, deleted or re-chained.
+
+CACHE_TIMEOUT = 60 * 60
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+# Each line item's effect on the unbalanced amount (+1 for assets, -1 for liabilities and equity).
+UNBALANCED_COEFFICIENTS = BALANCE_SHEET_CHART.coefficients('unbalanced_amount')
+
+# Retained earnings are carried from the income statement and the prior fiscal year end rather
+# than keyed, so they are never suggested as the source of an offage.
+CARRIED_FIELDS = ('beginning_retained_earnings', 'current_period_retained_earnings')
+HINT_FIELDS = tuple(
+    name for name in BALANCE_SHEET_CHART.inputs
+    if UNBALANCED_COEFFICIENTS.get(name) in (1, -1) and name not in CARRIED_FIELDS
+)
+
+# A slide moves the decimal point by up to this many places.
+SLIDE_PLACES = 3
+# An offage within this share of a single account suggests reviewing that account.
+ACCOUNT_TOLERANCE = Decimal('0.02')
+# An offage this large a share of total assets suggests a slide across the spread.
+LARGE_OFFAGE_SHARE = Decimal('0.30')
+MAX_HINTS = 5
+
+# Draft ids name a new spread's working copy; they end up in cache keys.
+DRAFT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def cache_key(user_id, balance_sheet_id=None, draft=None):
+    # Saved spreads are keyed by balance sheet and new ones by the client's draft id, so two new
+    # spreads never share a working copy.
+    return f'spreading:balance_check:{user_id}:{balance_sheet_id or f"new:{draft}"}'
+
+
+def editors_key(balance_sheet_id):
+    # Users holding a working copy of a saved balance sheet.
+    return f'spreading:balance_check:{balance_sheet_id}:editors'
+
+
+def invalidate(balance_sheet_ids):
+    # Drops every user's working copy of the given balance sheets.
+    keys = {balance_sheet_id: editors_key(balance_sheet_id) for balance_sheet_id in balance_sheet_ids}
+    if not keys:
+        return
+    editors = cache.get_many(keys.values())
+    cache.delete_many([
+        *(cache_key(user_id, balance_sheet_id) for balance_sheet_id, key in keys.items() for user_id in editors.get(key, ())),
+        *keys.values(),
+    ])
+
+
+def _add_editor(user_id, balance_sheet_id):
+    key = editors_key(balance_sheet_id)
+    editors = cache.get(key, set())
+    editors.add(user_id)
+    cache.set(key, editors, CACHE_TIMEOUT)
+
+
+def clean_draft(draft):
+    # A new spread's draft id as posted by the client. Raises ValidationError.
+    if not isinstance(draft, str) or not DRAFT_ID_PATTERN.match(draft):
+        raise ValidationError('A new spread needs a "draft" id of up to 64 letters, digits, "-" or "_".')
+    return draft
+
+
+def clean_changes(changes):
+    # {field: raw value} posted by the form to {field: Decimal}, cleaned the way the model fields
+    # would clean them (NegativeDecimalFields flip the sign). Raises ValidationError.
+    if not isinstance(changes, dict):
+        raise ValidationError('changes must be an object of field: amount.')
+    cleaned = {}
+    for name, value in changes.items():
+        if name not in BALANCE_SHEET_CHART.inputs:
+            raise ValidationError(f'{name!r} is not a balance sheet line item.')
+        if value in (None, ''):
+            cleaned[name] = ZERO
+            continue
+        field = BalanceSheet._meta.get_field(name)
+        cleaned[name] = field.clean(value if isinstance(value, str) else str(value), None).quantize(CENT)
+    return cleaned
+
+
+def initial_values(balance_sheet_id=None):
+    # Line items and stored totals of a saved balance sheet, or an empty spread. Returns None for
+    # an unknown balance sheet.
+    if balance_sheet_id is None:
+        values = dict.fromkeys(BALANCE_SHEET_CHART.inputs, ZERO)
+        values.update(BALANCE_SHEET_CHART.evaluate(values))
+        return values
+    values = (
+        BalanceSheet.objects
+        .filter(pk=balance_sheet_id)
+        .values(*BALANCE_SHEET_CHART.inputs, *BALANCE_SHEET_CHART.totals)
+        .first()
+    )
+    if values is not None:
+        values = {name: ZERO if value is None else value for name, value in values.items()}
+    return values
+
+
+def _transposed(entered, suggested):
+    # Whether two adjacent digits of the entered amount were swapped.
+    entered, suggested = str(int(abs(entered) * 100)), str(int(abs(suggested) * 100))
+    if len(entered) != len(suggested):
+        return False
+    differ = [index for index, (a, b) in enumerate(zip(entered, suggested)) if a != b]
+    return (
+        len(differ) == 2 and differ[1] == differ[0] + 1
+        and entered[differ[0]] == suggested[differ[1]] and entered[differ[1]] == suggested[differ[0]]
+    )
+
+
+def _slid(entered, suggested):
+    for places in range(1, SLIDE_PLACES + 1):
+        scale = 10 ** places
+        if entered == suggested * scale or entered * scale == suggested:
+            return True
+    return False
+
+
+def hints(values):
+    # Likely sources of the offage, most specific first. For each keyed account, the amount
+    # that would balance the spread on its own is compared to the amount entered: a digit
+    # transposition, a decimal slide, a flipped sign, or an offage close to the account's whole
+    # amount (entered twice, or belonging elsewhere). A single pass over the line items.
+    unbalanced = values.get('unbalanced_amount') or ZERO
+    if not unbalanced:
+        return []
+    exact, close = [], []
+    nine = int(abs(unbalanced) * 100) % 9 == 0
+    for name in HINT_FIELDS:
+        entered = values.get(name) or ZERO
+        if not entered:
+            continue
+        suggested = entered - UNBALANCED_COEFFICIENTS[name] * unbalanced
+        hint = {'field': name, 'entered': entered, 'suggested': suggested}
+        if suggested == -entered:
+            exact.append({'kind': 'sign', **hint})
+        elif nine and _transposed(entered, suggested):
+            exact.append({'kind': 'transposition', **hint})
+        elif _slid(entered, suggested):
+            exact.append({'kind': 'slide', **hint})
+        elif abs(abs(unbalanced) - abs(entered)) <= ACCOUNT_TOLERANCE * abs(entered):
+            close.append({'kind': 'account', **hint})
+    close.sort(key=lambda hint: abs(abs(unbalanced) - abs(hint['entered'])))
+    found = (exact + close)[:MAX_HINTS]
+
+    total_assets = values.get('total_assets') or ZERO
+    if total_assets and abs(unbalanced) >= LARGE_OFFAGE_SHARE * abs(total_assets):
+        found.append({'kind': 'large_offage', 'field': None, 'entered': None, 'suggested': None})
+    return found
+
+
+def check(user_id, changes, balance_sheet_id=None, draft=None, reset=False):
+    # Applies the changed cells to the user's working copy of a spread and returns
+    # (unbalanced amount, recomputed totals, hints, reset). The working copy starts from the
+    # saved balance sheet, or an empty spread for a new spread's `draft` id. It is started over
+    # when the client asks (`reset`) and when there is none (first request, expired from the
+    # cache, or the saved balance sheet changed), in which case the returned `reset` is True and
+    # a new spread's client should post all of its cells again. Returns None for an unknown
+    # balance sheet.
+    key = cache_key(user_id, balance_sheet_id, draft)
+    values = None if reset else cache.get(key)
+    reset = values is None
+    if reset:
+        values = initial_values(balance_sheet_id)
+        if values is None:
+            return None
+    if balance_sheet_id is not None and (reset or not cache.touch(editors_key(balance_sheet_id), CACHE_TIMEOUT)):
+        _add_editor(user_id, balance_sheet_id)
+    values.update(changes)
+    totals = BALANCE_SHEET_CHART.recalculate(values, list(changes)) if changes else {}
+    cache.set(key, values, CACHE_TIMEOUT)
+    return values['unbalanced_amount'], totals, hints(values), reset
+
@@ -0,0 +1,198 @@
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+
+from .models import BalanceSheet, UCACashFlow
+
+# The UCA cash flow, defined once as data in the order of the workbook's 'UCA Cash Flow Analysis'
+# sheet. Each line sums its terms, where a term is an earlier line, or a statement field of the
+# ending period (income statement or balance sheet); 'change:' takes the balance sheet field's
+# change since the beginning period and 'prior:' its beginning value. A leading '-' subtracts.
+# Expense accounts held in a NegativeDecimalField are already negative, so they are added.
+UCA_LINES = {
+    'net_sales': ['net_revenue'],
+    'change_in_trade_receivables': ['-change:accounts_receivable_net'],
+    'cash_collected_from_sales': ['net_sales', 'change_in_trade_receivables'],
+    'cost_of_goods_sold': ['cogs_subtotal'],
+    'change_in_inventory': ['-change:inventory_subtotal'],
+    'change_in_trade_payables': ['change:trade_accounts_payable'],
+    'cash_paid_to_suppliers': ['cost_of_goods_sold', 'change_in_inventory', 'change_in_trade_payables'],
+    'gross_cash_profit': ['cash_collected_from_sales', 'cash_paid_to_suppliers'],
+    'operating_expenses': ['-total_operating_expenses'],
+    'depreciation_and_amortization': ['depreciation_and_depletion', 'amortization', '-cost_of_goods_sold_depreciation'],
+    'change_in_prepaid_expenses': ['-change:prepaid_expenses_generic'],
+    'change_in_accruals': ['change:accruals_subtotal', 'change:customer_advances'],
+    'cash_paid_for_operating_costs': [
+        'operating_expenses', 'depreciation_and_amortization', 'change_in_prepaid_expenses', 'change_in_accruals',
+    ],
+    'cash_after_operations': ['gross_cash_profit', 'cash_paid_for_operating_costs'],
+    'change_in_other_payables': ['change:other_accounts_payable'],
+    'change_in_revolving_lines': ['change:revolving_lines_subtotal'],
+    'change_in_other_current_liabilities': [
+        'change:payroll_liabilities', 'change:taxes_payable', 'change:other_current_liabilities_subtotal',
+    ],
+    'change_in_other_current_assets': ['-change:other_current_assets_subtotal'],
+    'income_taxes': ['c_corporate_taxes_subtotal'],
+    'other_income_and_expenses': ['total_other_income_and_expenses', '-interest_expense'],
+    'net_cash_after_operations': [
+        'cash_after_operations', 'change_in_other_payables', 'change_in_revolving_lines',
+        'change_in_other_current_liabilities', 'change_in_other_current_assets', 'income_taxes',
+        'other_income_and_expenses',
+    ],
+    'interest_paid': ['interest_expense'],
+    'dividends_paid': ['distributions_to_shareholders'],
+    'cash_paid_for_interest_and_dividends': ['interest_paid', 'dividends_paid'],
+    'net_cash_income': ['net_cash_after_operations', 'cash_paid_for_interest_and_dividends'],
+    'prior_current_maturities': ['-prior:current_portion_of_long_term_debt_subtotal'],
+    'cash_after_debt_amortization': ['net_cash_income', 'prior_current_maturities'],
+    'intangible_asset_expenditures': ['-change:net_intangible_assets', '-amortization'],
+    'fixed_asset_expenditures': ['-change:net_fixed_assets', '-depreciation_and_depletion', 'cost_of_goods_sold_depreciation'],
+    'financing_surplus': ['cash_after_debt_amortization', 'intangible_asset_expenditures', 'fixed_asset_expenditures'],
+    # New long-term debt: this period's long-term debt and current maturities, less the long-term
+    # portion carried in (the prior current maturities were repaid above).
+    'change_in_long_term_debt': ['change:total_notes_payable', 'current_portion_of_long_term_debt_subtotal'],
+    'change_in_due_to_related_parties': ['change:due_to_others_subtotal'],
+    'change_in_due_from_related_parties': ['-change:due_from_related_parties_generic'],
+    'change_in_due_to_shareholders': ['change:due_to_shareholders_subtotal'],
+    'change_in_due_from_shareholders': ['-change:due_from_shareholders_generic'],
+    'change_in_other_long_term_assets': ['-change:other_long_term_assets_subtotal'],
+    'change_in_other_long_term_liabilities': ['change:other_long_term_liabilities_subtotal'],
+    'change_in_equity': ['change:paid_in_capital', 'change:other_equity_subtotal'],
+    'total_external_financing': [
+        'change_in_long_term_debt', 'change_in_due_to_related_parties', 'change_in_due_from_related_parties',
+        'change_in_due_to_shareholders', 'change_in_due_from_shareholders', 'change_in_other_long_term_assets',
+        'change_in_other_long_term_liabilities', 'change_in_equity',
+    ],
+    'cash_after_financing': ['financing_surplus', 'total_external_financing'],
+    'actual_change_in_cash': ['change:cash_subtotal'],
+    # What the analysis does not explain (retained earnings adjustments, unspread accounts).
+    'unexplained_change_in_cash': ['actual_change_in_cash', '-cash_after_financing'],
+}
+
+BULK_BATCH_SIZE = 500
+
+# Businesses rebuilt per pass by rebuild_all.
+BUSINESS_BATCH_SIZE = 500
+
+
+def _parse(term):
+    sign = -1 if term.startswith('-') else 1
+    term = term.lstrip('-')
+    kind, _, field = term.rpartition(':')
+    return sign, kind or None, field
+
+
+# Statement fields the lines read, balance sheet fields (read for both periods) first, then
+# income statement fields (read for the ending period); the column order of the loaded matrix.
+_FIELDS = sorted({
+    field for terms in UCA_LINES.values() for term in terms
+    for _, _, field in [_parse(term)] if field not in UCA_LINES
+})
+_BALANCE_SHEET_NAMES = {field.name for field in BalanceSheet._meta.fields}
+BALANCE_SHEET_FIELDS = [name for name in _FIELDS if name in _BALANCE_SHEET_NAMES]
+INCOME_STATEMENT_FIELDS = [name for name in _FIELDS if name not in _BALANCE_SHEET_NAMES]
+SOURCE_FIELDS = BALANCE_SHEET_FIELDS + INCOME_STATEMENT_FIELDS
+
+
+def month_index(day):
+    return day.year * 12 + day.month
+
+
+def _load(business_ids):
+    # Every dated balance sheet of the given businesses, with its income statement's amounts, as
+    # one float matrix. Missing amounts count as zero.
+    rows = list(
+        BalanceSheet.objects
+        .filter(business_name_id__in=business_ids, period_ending_date__isnull=False)
+        .order_by('business_name_id', 'period_ending_date')
+        .values_list(
+            'uuid', 'business_name_id', 'period_ending_date', 'income_statement__months_in_period',
+            *BALANCE_SHEET_FIELDS, *(f'income_statement__{name}' for name in INCOME_STATEMENT_FIELDS),
+        )
+    )
+    values = np.array([[0.0 if value is None else float(value) for value in row[4:]] for row in rows], dtype=float)
+    return rows, values.reshape(len(rows), len(SOURCE_FIELDS))
+
+
+def pairs(rows, since=None):
+    # (ending row, beginning row) index pairs. A balance sheet is paired with the same business's
+    # balance sheet at the start of its income statement's period (months_in_period earlier), so
+    # the income statement bridges exactly the two. With `since`, only periods ending on or after
+    # that date.
+    by_month = {(row[1], month_index(row[2])): position for position, row in enumerate(rows)}
+    ending, beginning = [], []
+    for position, (_, business_id, period_ending_date, months, *_) in enumerate(rows):
+        if months and (since is None or period_ending_date >= since):
+            prior = by_month.get((business_id, month_index(period_ending_date) - months))
+            if prior is not None:
+                ending.append(position)
+                beginning.append(prior)
+    return np.array(ending, dtype=int), np.array(beginning, dtype=int)
+
+
+def compute(values, ending, beginning):
+    # Every UCA line for every (ending, beginning) pair in one vectorized pass: {line: array}.
+    column = {name: position for position, name in enumerate(SOURCE_FIELDS)}
+    current, prior = values[ending], values[beginning]
+    lines = {}
+    for name, terms in UCA_LINES.items():
+        total = np.zeros(len(ending))
+        for term in terms:
+            sign, kind, field = _parse(term)
+            if field in lines:
+                amount = lines[field]
+            elif kind == 'change':
+                amount = current[:, column[field]] - prior[:, column[field]]
+            elif kind == 'prior':
+                amount = prior[:, column[field]]
+            else:
+                amount = current[:, column[field]]
+            total += sign * amount
+        lines[name] = np.round(total, 2)
+    return lines
+
+
+@transaction.atomic
+def rebuild(business_ids, since=None):
+    # Recomputes and stores the UCA cash flows of the given businesses: every period, or with
+    # `since` only the periods ending on or after it (an edit to a period changes its own cash
+    # flow and the next one's). One read, one delete and one bulk_create whatever the number of
+    # periods. Returns the number of cash flows written.
+    business_ids = list(business_ids)
+    rows, values = _load(business_ids)
+    ending, beginning = pairs(rows, since)
+    lines = compute(values, ending, beginning)
+
+    stale = UCACashFlow.objects.filter(business_id__in=business_ids)
+    if since is not None:
+        stale = stale.filter(period_ending_date__gte=since)
+    stale.delete()
+    UCACashFlow.objects.bulk_create([
+        UCACashFlow(
+            business_id=rows[row][1],
+            balance_sheet_id=rows[row][0],
+            prior_balance_sheet_id=rows[prior][0],
+            period_ending_date=rows[row][2],
+            months_in_period=rows[row][3],
+            **{name: Decimal(f'{lines[name][pair]:.2f}') for name in UCA_LINES},
+        )
+        for pair, (row, prior) in enumerate(zip(ending, beginning))
+    ], batch_size=BULK_BATCH_SIZE)
+    return len(ending)
+
+
+def rebuild_all(batch_size=BUSINESS_BATCH_SIZE):
+    # Rebuilds every business's UCA cash flows, `batch_size` businesses at a time. Returns the
+    # number of cash flows written.
+    business_ids = list(BalanceSheet.objects.order_by().values_list('business_name_id', flat=True).distinct())
+    return sum(rebuild(business_ids[start:start + batch_size]) for start in range(0, len(business_ids), batch_size))
+
+
+def cash_flows(business_ids):
+    # Stored UCA cash flows by business, oldest first: {business id: [UCACashFlow, ...]}.
+    flows = defaultdict(list)
+    for flow in UCACashFlow.objects.filter(business_id__in=business_ids).order_by('business_id', 'period_ending_date'):
+        flows[flow.business_id].append(flow)
+    return dict(flows)
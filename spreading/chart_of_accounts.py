@@ -0,0 +1,99 @@
+from .evaluator import Chart
+
+# Line items and the totals built from them, defined once for every spread statement. Each total
+# maps to the line items (or other totals) it sums; a leading '-' subtracts a term. Accounts held
+# in a NegativeDecimalField are already stored as negative amounts, so they are simply added.
+# The keys are the statement models' stored total columns, which are computed on save.
+
+
+def udfs(prefix, count):
+    return [f'{prefix}_udf{number}' for number in range(1, count + 1)]
+
+
+INCOME_STATEMENT = {
+    'revenue_subtotal': ['revenue_generic', *udfs('revenue', 4)],
+    'net_revenue': ['revenue_subtotal', 'returns_and_allowances'],
+    'cogs_subtotal': ['cost_of_goods_sold_generic', 'cost_of_goods_sold_depreciation', 'cost_of_goods_sold_udf1'],
+    'total_gross_profit': ['net_revenue', 'cogs_subtotal'],
+    'rent_lease_expenses_subtotal': ['real_estate_rent', 'operating_leases', 'rent_and_lease_expense_udf1'],
+    'taxes_and_licenses_subtotal': ['real_estate_taxes', 'payroll_taxes', 'other_taxes_and_licenses'],
+    'other_operating_expenses_subtotal': ['other_operating_expenses_generic', *udfs('other_operating_expenses', 7)],
+    'total_operating_expenses': [
+        'salaries_and_wages', 'officers_compensation', 'repairs_and_maintenance', 'bad_debt',
+        'rent_lease_expenses_subtotal', 'taxes_and_licenses_subtotal', 'depreciation_and_depletion', 'amortization',
+        'legal_and_professional_expenses', 'employee_benefit_programs', 'advertising', 'other_operating_expenses_subtotal',
+    ],
+    'net_operating_income': ['total_gross_profit', '-total_operating_expenses'],
+    'other_income_and_expenses_subtotal': ['other_income_or_expense_generic', *udfs('other_income_or_expense', 2)],
+    'total_other_income_and_expenses': [
+        'gain_on_sale_of_asset', 'loss_on_sale_of_asset', 'interest_income', 'interest_expense',
+        'other_income_and_expenses_subtotal',
+    ],
+    'net_profit_loss': ['net_operating_income', 'total_other_income_and_expenses'],
+    'c_corporate_taxes_subtotal': ['c_corporation_taxes', 'c_corporation_tax_refund'],
+    'net_profit_loss_after_taxes': ['net_profit_loss', 'c_corporate_taxes_subtotal'],
+    'current_period_retained_earnings': ['net_profit_loss_after_taxes', 'distributions_to_shareholders'],
+}
+
+BALANCE_SHEET = {
+    # Assets
+    'cash_subtotal': ['cash_at_financial_institution', 'cash_at_other_financial_institution', 'unclassified_cash_account'],
+    'accounts_receivable_net': ['accounts_receivable', 'bad_debt_allowance'],
+    'inventory_subtotal': ['inventory_generic', 'raw_material', 'work_in_progress', 'finished_goods'],
+    'other_current_assets_subtotal': ['other_current_assets_generic', *udfs('other_current_assets', 3)],
+    'total_current_assets': [
+        'cash_subtotal', 'accounts_receivable_net', 'inventory_subtotal', 'prepaid_expenses_generic',
+        'other_current_assets_subtotal',
+    ],
+    'other_gross_plant_and_equipment_subtotal': ['other_gross_plant_and_equipment_generic', *udfs('other_gross_plant_and_equipment', 3)],
+    'gross_plant_and_equipment': [
+        'machinery_and_equipment', 'computers_and_office_equipment', 'furniture_and_fixtures', 'leasehold_improvements',
+        'construction_in_progress', 'building', 'other_gross_plant_and_equipment_subtotal',
+    ],
+    'net_plant_and_equipment': ['gross_plant_and_equipment', 'accumulated_depreciation'],
+    'net_fixed_assets': ['net_plant_and_equipment', 'land'],
+    'net_intangible_assets': [
+        'goodwill', 'trademarks_and_licenses', 'financing_costs', *udfs('other_intangible_assets', 3),
+        'accumulated_amortization',
+    ],
+    'other_long_term_assets_subtotal': ['other_long_term_assets_generic', *udfs('other_long_term_assets', 4)],
+    'total_long_term_assets': [
+        'net_fixed_assets', 'net_intangible_assets', 'due_from_related_parties_generic', 'due_from_shareholders_generic',
+        'other_long_term_assets_subtotal',
+    ],
+    'total_assets': ['total_current_assets', 'total_long_term_assets'],
+
+    # Liabilities
+    'accounts_payable_subtotal': ['trade_accounts_payable', 'other_accounts_payable'],
+    'current_portion_of_long_term_debt_subtotal': ['current_portion_of_long_term_debt_generic', *udfs('current_portion_of_long_term_debt', 3)],
+    'revolving_lines_subtotal': [
+        'revolving_lines_generic', 'credit_cards_payable', 'revolving_lines_of_credit_generic', *udfs('other_revolving_line', 4),
+    ],
+    'accruals_subtotal': ['other_accruals_generic', *udfs('other_accruals', 3)],
+    'other_current_liabilities_subtotal': ['other_current_liabilities_generic', *udfs('other_current_liabilities', 3)],
+    'total_current_liabilities': [
+        'accounts_payable_subtotal', 'current_portion_of_long_term_debt_subtotal', 'revolving_lines_subtotal',
+        'accruals_subtotal', 'taxes_payable', 'customer_advances', 'payroll_liabilities', 'other_current_liabilities_subtotal',
+    ],
+    'refinanced_long_term_debt_subtotal': ['refianced_long_term_debt_generic', *udfs('refianced_long_term_debt', 7)],
+    'long_term_notes_payable_subtotal': ['long_term_notes_payable_generic', *udfs('long_term_notes_payable', 4)],
+    'total_notes_payable': ['refinanced_long_term_debt_subtotal', 'long_term_notes_payable_subtotal'],
+    'due_to_others_subtotal': ['due_to_related_parties_generic', *udfs('due_to_related_parties', 3)],
+    'due_to_shareholders_subtotal': ['due_to_shareholders_generic', *udfs('due_to_shareholders', 3)],
+    'other_long_term_liabilities_subtotal': ['other_long_term_liabilities_generic', *udfs('other_long_term_liabilities', 4)],
+    'total_long_term_liabilities': [
+        'total_notes_payable', 'due_to_others_subtotal', 'due_to_shareholders_subtotal', 'other_long_term_liabilities_subtotal',
+    ],
+    'total_liabilities': ['total_current_liabilities', 'total_long_term_liabilities'],
+
+    # Shareholders' Equity
+    'other_equity_subtotal': ['other_equity_generic', *udfs('other_equity', 4)],
+    'total_shareholders_equity': [
+        'paid_in_capital', 'beginning_retained_earnings', 'current_period_retained_earnings', 'other_equity_subtotal',
+    ],
+    'total_shareholders_equity_and_total_liabilities': ['total_shareholders_equity', 'total_liabilities'],
+    'unbalanced_amount': ['total_assets', '-total_shareholders_equity_and_total_liabilities'],
+}
+
+INCOME_STATEMENT_CHART = Chart(INCOME_STATEMENT)
+BALANCE_SHEET_CHART = Chart(BALANCE_SHEET)
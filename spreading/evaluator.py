@@ -0,0 +1,143 @@
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import ExpressionWrapper, F, Value
+from django.db.models.functions import Coalesce, Round
+
+ZERO = Decimal(0)
+
+
+def _amount_field():
+    return models.DecimalField(max_digits=15, decimal_places=2)
+
+
+def _balanced_sum(expressions):
+    if not expressions:
+        return Value(ZERO, output_field=_amount_field())
+    while len(expressions) > 1:
+        expressions = [
+            expressions[index] + expressions[index + 1] if index + 1 < len(expressions) else expressions[index]
+            for index in range(0, len(expressions), 2)
+        ]
+    return expressions[0]
+
+
+def _term(term):
+    # 'name' adds the line item, '-name' subtracts it.
+    return (-1, term[1:]) if term.startswith('-') else (1, term)
+
+
+class Chart:
+    # A chart of accounts compiled for evaluation. `formulas` maps each total to the line items
+    # and other totals it sums (see spreading.chart_of_accounts). Totals are ordered
+    # topologically once, so evaluating a statement is a single pass with every total computed
+    # after the totals it depends on, and an edit only recomputes the totals downstream of it.
+
+    def __init__(self, formulas):
+        self.formulas = {total: tuple(_term(term) for term in terms) for total, terms in formulas.items()}
+        self.totals = self._order()
+        self.inputs = tuple(dict.fromkeys(
+            name for total in self.totals for _, name in self.formulas[total] if name not in self.formulas
+        ))
+        self._position = {total: index for index, total in enumerate(self.totals)}
+        self._dependents = {}
+        for total in self.totals:
+            for _, name in self.formulas[total]:
+                self._dependents.setdefault(name, []).append(total)
+        self._downstream = {}
+
+    def _order(self):
+        # Kahn's algorithm over total -> total dependencies; raises on circular formulas.
+        pending = {total: {name for _, name in terms if name in self.formulas} for total, terms in self.formulas.items()}
+        order = []
+        ready = [total for total, requires in pending.items() if not requires]
+        while ready:
+            total = ready.pop(0)
+            order.append(total)
+            for other, requires in pending.items():
+                if total in requires:
+                    requires.remove(total)
+                    if not requires:
+                        ready.append(other)
+        if len(order) < len(self.formulas):
+            raise ValueError(f'Circular formulas: {sorted(set(self.formulas) - set(order))}')
+        return tuple(order)
+
+    def downstream(self, name):
+        # Totals affected by a change to `name`, in evaluation order.
+        if name not in self._downstream:
+            affected = set()
+            stack = [name]
+            while stack:
+                for total in self._dependents.get(stack.pop(), ()):
+                    if total not in affected:
+                        affected.add(total)
+                        stack.append(total)
+            self._downstream[name] = tuple(sorted(affected, key=self._position.__getitem__))
+        return self._downstream[name]
+
+    def _compute(self, values, total):
+        result = ZERO
+        for sign, name in self.formulas[total]:
+            value = values.get(name)
+            if value is not None:
+                result += value if sign > 0 else -value
+        values[total] = result
+        return result
+
+    def evaluate(self, values):
+        # Computes every total from the line items in `values` (missing or None items count as 0).
+        # Returns the totals; `values` itself is left unchanged.
+        values = dict(values)
+        return {total: self._compute(values, total) for total in self.totals}
+
+    def recalculate(self, values, changed):
+        # Incremental recalculation: `values` holds line items and previously computed totals and
+        # is updated in place; only totals downstream of the `changed` names are recomputed.
+        # Returns the recomputed totals.
+        if isinstance(changed, str):
+            changed = (changed,)
+        affected = set()
+        for name in changed:
+            affected.update(self.downstream(name))
+        return {total: self._compute(values, total) for total in sorted(affected, key=self._position.__getitem__)}
+
+    def values(self, instance):
+        return {name: getattr(instance, name) for name in self.inputs}
+
+    def update(self, instance, changed):
+        # Recomputes only the totals downstream of the `changed` line items on a statement instance
+        # whose totals are otherwise current.
+        values = {name: getattr(instance, name) for name in (*self.inputs, *self.totals)}
+        for total, value in self.recalculate(values, changed).items():
+            setattr(instance, total, value)
+
+    def apply(self, instance):
+        # Stores every total on a statement instance.
+        for total, value in self.evaluate(self.values(instance)).items():
+            setattr(instance, total, value)
+
+    def coefficients(self, name):
+        # `name` expanded to {line item: multiplier}; every total is a linear combination of items.
+        if name not in self.formulas:
+            return {name: 1}
+        result = {}
+        for sign, term in self.formulas[name]:
+            for item, multiplier in self.coefficients(term).items():
+                result[item] = result.get(item, 0) + sign * multiplier
+        return {item: multiplier for item, multiplier in result.items() if multiplier}
+
+    def expression(self, name):
+        # Database expression computing `name` from the line item columns, with NULL counting as 0,
+        # so totals can be annotated, filtered and aggregated in SQL exactly as evaluate() computes
+        # them. Items are summed as a balanced tree to keep the generated SQL shallow.
+        added, subtracted = [], []
+        for item, multiplier in self.coefficients(name).items():
+            column = Coalesce(F(item), Value(ZERO), output_field=_amount_field())
+            if abs(multiplier) != 1:
+                column = column * Value(Decimal(abs(multiplier)))
+            (added if multiplier > 0 else subtracted).append(column)
+        result = _balanced_sum(added)
+        if subtracted:
+            result = result - _balanced_sum(subtracted)
+        return ExpressionWrapper(Round(result, 2), output_field=_amount_field())
@@ -0,0 +1,28 @@
+from django.db import models
+
+
+# Decimal field for accounts that are always carried as negative amounts (contra-assets,
+# expenses entered on the income statement as deductions, distributions). Whatever sign is
+# entered, the value is converted to -abs(value) when cleaned and again when saved.
+# Please note that the conversion will not be reflected in the form until saved, unless
+# client-side JavaScript code handles the negative conversion in real-time.
+class NegativeDecimalField(models.DecimalField):
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value is not None:
+            value = -abs(value)
+        return value
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is not None:
+            value = -abs(value)
+        return value
+
+
+def normalize_negative_fields(instance):
+    # Applies the NegativeDecimalField sign convention to unsaved values, so totals computed
+    # before saving see the amounts as they will be stored.
+    for field in instance._meta.concrete_fields:
+        if isinstance(field, NegativeDecimalField):
+            setattr(instance, field.attname, field.to_python(getattr(instance, field.attname)))
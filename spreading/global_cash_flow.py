@@ -0,0 +1,189 @@
+import hashlib
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from loans.debt_service import debt_service as loan_debt_service
+from relationships.models import Affiliate, Business, Individual, OwnershipClosure
+from .annualization import ttm_statements
+from .models import BalanceSheet, IncomeStatement, PersonalCashFlow
+
+# Global cash flow of a relationship: the businesses and individuals standing behind one
+# affiliate, combined into a single cash flow and DSCR per year.
+#
+# The relationship of an affiliate is the affiliate itself, its individual owners (at any depth)
+# and every business those individuals own. Each business counts at the share its relationship
+# owners hold in it (capped at 100%), except the affiliate itself, which counts in full. Each
+# individual counts in full.
+#
+# Business cash flow is trailing-twelve-month EBITDA and business debt service annual interest
+# plus current maturities of long-term debt, as in spreading.ratios. The annual debt service of
+# the members' proposed loans (loans.debt_service) is added to every year, by the same shares, so
+# the DSCR is pro forma. Periods are aligned by year: a member's figures for a year are its
+# latest period ending in that year.
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+ZERO = Decimal(0)
+ONE = Decimal(1)
+HUNDRED = Decimal(100)
+CENT = Decimal('0.01')
+
+FIELDS = (
+    'business_cash_flow',
+    'personal_cash_flow',
+    'cash_available',
+    'business_debt_service',
+    'personal_debt_service',
+    'proposed_debt_service',
+    'debt_service',
+)
+
+
+def relationship(affiliate_id):
+    # (individual affiliate ids, {business affiliate id: share}) of an affiliate's relationship.
+    affiliate_type = Affiliate.objects.values_list('affiliate_type', flat=True).get(pk=affiliate_id)
+    individuals = set(
+        OwnershipClosure.objects
+        .filter(descendant_id=affiliate_id, ancestor__affiliate_type='INDIVIDUAL')
+        .values_list('ancestor_id', flat=True)
+    )
+    if affiliate_type == 'INDIVIDUAL':
+        individuals.add(affiliate_id)
+
+    shares = defaultdict(Decimal)
+    owned = (
+        OwnershipClosure.objects
+        .filter(ancestor_id__in=individuals, descendant__affiliate_type='BUSINESS')
+        .values_list('descendant_id', 'effective_percentage')
+    )
+    for business_id, percentage in owned:
+        shares[business_id] += percentage / HUNDRED
+    shares = {business_id: min(share, ONE) for business_id, share in shares.items()}
+    if affiliate_type == 'BUSINESS':
+        shares[affiliate_id] = ONE
+    return individuals, shares
+
+
+def cache_key(affiliate_id, individuals, shares, businesses, people, proposed):
+    # Keyed by everything the result is computed from: the relationship's ownership shares, the
+    # proposed loans' debt service and the id and version of every income statement, balance sheet
+    # and personal cash flow in it. Any edit bumps a version, so stale results are never read and
+    # need no invalidation.
+    versions = [
+        sorted(individuals),
+        sorted((borrower_id, str(amount)) for borrower_id, amount in proposed.items()),
+        sorted((business_id, str(share)) for business_id, share in shares.items()),
+        sorted(map(str, businesses)),
+        sorted((str(pk), version) for pk, version in IncomeStatement.objects.filter(business_name_id__in=businesses).values_list('pk', 'version')),
+        sorted((str(pk), version) for pk, version in BalanceSheet.objects.filter(business_name_id__in=businesses).values_list('pk', 'version')),
+        sorted((str(pk), version) for pk, version in PersonalCashFlow.objects.filter(individual_id__in=people).values_list('pk', 'version')),
+    ]
+    digest = hashlib.sha1(repr(versions).encode()).hexdigest()
+    return f'spreading:global_cash_flow:{affiliate_id}:{digest}'
+
+
+def _by_year(periods):
+    # {year: value} keeping the latest period ending in each year, from {period ending date: value}.
+    years = {}
+    for period_ending_date in sorted(periods):
+        years[period_ending_date.year] = periods[period_ending_date]
+    return years
+
+
+def _amount(values, name):
+    value = values.get(name)
+    return ZERO if value is None else Decimal(value)
+
+
+def business_years(business_ids):
+    # {business id: {year: (cash flow, debt service)}} from trailing twelve months.
+    statements = ttm_statements(business_ids)
+    maturities = {
+        (business_id, period_ending_date): amount or ZERO
+        for business_id, period_ending_date, amount in
+        BalanceSheet.objects
+        .filter(business_name_id__in=business_ids, period_ending_date__isnull=False)
+        .values_list('business_name_id', 'period_ending_date', 'current_portion_of_long_term_debt_subtotal')
+    }
+    years = {}
+    for business_id, periods in statements.items():
+        flows = {}
+        for period_ending_date, values in periods.items():
+            interest = abs(_amount(values, 'interest_expense'))
+            ebitda = (
+                _amount(values, 'net_profit_loss') + interest + _amount(values, 'depreciation_and_depletion')
+                + _amount(values, 'amortization') + abs(_amount(values, 'cost_of_goods_sold_depreciation'))
+            )
+            flows[period_ending_date] = (ebitda, interest + maturities.get((business_id, period_ending_date), ZERO))
+        years[business_id] = _by_year(flows)
+    return years
+
+
+def personal_years(individual_ids):
+    # {individual id: {year: (cash flow, debt service)}}, annualized by months in period.
+    periods = defaultdict(dict)
+    for flow in PersonalCashFlow.objects.filter(individual_id__in=individual_ids):
+        annualize = Decimal(12) / flow.months_in_period
+        periods[flow.individual_id][flow.period_ending_date] = (
+            flow.cash_available() * annualize, flow.personal_debt_service * annualize,
+        )
+    return {individual_id: _by_year(flows) for individual_id, flows in periods.items()}
+
+
+def compute(individuals, shares, businesses, people, proposed):
+    # [{'year', field: Decimal, ..., 'dscr', 'missing'}, ...] oldest first. `businesses` and
+    # `people` map Business and Individual ids to their affiliate ids and `proposed` affiliate ids
+    # to their proposed loans' annual debt service; `missing` lists the affiliates with no
+    # statement for the year.
+    business_flows = business_years(list(businesses))
+    personal_flows = personal_years(list(people))
+    years = sorted({year for flows in (*business_flows.values(), *personal_flows.values()) for year in flows})
+    proposed_debt_service = sum(
+        (amount * shares.get(affiliate_id, ONE) for affiliate_id, amount in proposed.items()), ZERO,
+    )
+
+    results = []
+    for year in years:
+        totals = dict.fromkeys(FIELDS, ZERO)
+        reported = set()
+        for business_id, affiliate_id in businesses.items():
+            if year in business_flows.get(business_id, {}):
+                cash_flow, debt_service = business_flows[business_id][year]
+                totals['business_cash_flow'] += cash_flow * shares[affiliate_id]
+                totals['business_debt_service'] += debt_service * shares[affiliate_id]
+                reported.add(affiliate_id)
+        for individual_id, affiliate_id in people.items():
+            if year in personal_flows.get(individual_id, {}):
+                cash_flow, debt_service = personal_flows[individual_id][year]
+                totals['personal_cash_flow'] += cash_flow
+                totals['personal_debt_service'] += debt_service
+                reported.add(affiliate_id)
+        totals['cash_available'] = totals['business_cash_flow'] + totals['personal_cash_flow']
+        totals['proposed_debt_service'] = proposed_debt_service
+        totals['debt_service'] = totals['business_debt_service'] + totals['personal_debt_service'] + proposed_debt_service
+        result = {'year': year, **{name: amount.quantize(CENT) for name, amount in totals.items()}}
+        result['dscr'] = (totals['cash_available'] / totals['debt_service']).quantize(CENT) if totals['debt_service'] else None
+        result['missing'] = sorted((set(shares) | set(individuals)) - reported)
+        results.append(result)
+    return results
+
+
+def global_cash_flow(affiliate_id):
+    # Global cash flow and DSCR of an affiliate's relationship, by year. Results are cached under
+    # the versions of every input statement and the (cached) loan debt service; a handful of small queries decide whether the cached
+    # result is still current, and only a miss loads and combines the statements.
+    individuals, shares = relationship(affiliate_id)
+    businesses = dict(Business.objects.filter(affiliate_id__in=list(shares)).values_list('pk', 'affiliate_id'))
+    people = dict(Individual.objects.filter(affiliate_id__in=individuals).values_list('pk', 'affiliate_id'))
+    proposed = {
+        borrower_id: loans['proposed']
+        for borrower_id, loans in loan_debt_service([*individuals, *shares]).items() if loans['proposed']
+    }
+    key = cache_key(affiliate_id, individuals, shares, businesses, people, proposed)
+    results = cache.get(key)
+    if results is None:
+        results = compute(individuals, shares, businesses, people, proposed)
+        cache.set(key, results, CACHE_TIMEOUT)
+    return results
@@ -5,12 +5,26 @@ from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from django.db.models import F
 from spreading.models import GlobalStatement
+from spreading.fields import NegativeDecimalField, normalize_negative_fields
+from spreading.chart_of_accounts import INCOME_STATEMENT_CHART
+from spreading.querysets import StatementQuerySet
 from datetime import timedelta
 
 
-class NegativeDecimalField(models.DecimalField):
-    def get_prep_value(self, value):
-        return super().get_prep_value(-abs(value))
+def months_in_period(period_ending_date, legal_entity_fiscal_year_end):
+    # Months from the fiscal year end preceding the period end through the period end (1-12).
+    if period_ending_date and legal_entity_fiscal_year_end:
+        fy_end_month = legal_entity_fiscal_year_end.month
+        period_end_month = period_ending_date.month
+
+        if fy_end_month == 12:
+            return period_end_month
+        elif period_end_month > fy_end_month:
+            return period_end_month - fy_end_month
+        else:
+            return (12 - fy_end_month) + period_end_month
+    else:
+        return None
 
 class IncomeStatement(models.Model):
     # The below global ID will populate with the primary key that was generated by the Spreading app's model. This same key will be assigned to all other spreading related apps for a given period; allowing for globally associating all financial statements in the event there are two instances of statements spread containing the same date and financial statement type (very rarely would this ever happen, but could with company prepred statements).
@@ -43,12 +57,15 @@ class IncomeStatement(models.Model):
 
     # The amount of months in period will be utilized in other model classes to normalize data
     # (i.e., annualize an interim period, adjusts annual debt service obligations for the amount of months in period)
-    months_in_period = models.IntegerField()
+    months_in_period = models.IntegerField(null=True, blank=True, editable=False)
+
+    # Incremented on every save; derived statements record the versions they were computed from.
+    version = models.PositiveIntegerField(default=1, editable=False)
 
 
 
     ### Revenue (subtotal)
-    revenue_subtotal = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    revenue_subtotal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
 
     #
@@ -61,12 +78,12 @@ class IncomeStatement(models.Model):
     #
     returns_and_allowances = NegativeDecimalField(max_digits=15, decimal_places=2) # NegativeDecimalField is used to require any data entered to be a negative amount.
     ### Net Revenue Field
-    net_revenue = models.DecimalField(max_digits=10, decimal_places=2) # = Revenue Subtotal + Returns and Allowances (-)
+    net_revenue = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False) # = Revenue Subtotal + Returns and Allowances (-)
 
 
     #
     ### Cost of Goods Sold (subtotal)
-    cogs_subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    cogs_subtotal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
 
     # Cost of Goods Sold Subtotal Fields (Cascade)
@@ -75,7 +92,7 @@ class IncomeStatement(models.Model):
     cost_of_goods_sold_udf1 = NegativeDecimalField(max_digits=15, decimal_places=2)
     #
     ### Total Gross Profit (Loss)
-    total_gross_profit = models.DecimalField(max_digits=10, decimal_places=2)
+    total_gross_profit = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     ######################################
 
@@ -85,7 +102,7 @@ class IncomeStatement(models.Model):
     repairs_and_maintenance = models.DecimalField(max_digits=15, decimal_places=2)
     bad_debt = models.DecimalField(max_digits=15, decimal_places=2)
     # Rent and Lease Expenses (subtotal)
-    rent_lease_expenses_subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    rent_lease_expenses_subtotal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     #
     # Rent and Lease Expenses Subtotal Fields (Cascade)
@@ -94,7 +111,7 @@ class IncomeStatement(models.Model):
     rent_and_lease_expense_udf1 = models.DecimalField(max_digits=15, decimal_places=2)
     #
     # Taxes and Licenses (subtotal)
-    taxes_and_licenses_subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    taxes_and_licenses_subtotal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     #
     # Taxes and Licenses (Cascade)
@@ -109,7 +126,7 @@ class IncomeStatement(models.Model):
     advertising = models.DecimalField(max_digits=15, decimal_places=2)
     #
     ## Other Operating Expenses (subtotal)
-    other_operating_expenses_subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    other_operating_expenses_subtotal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
     # Other Operating Expenses Fields (Cascade); Addtional user defined fields are included to allow Users to breakout notable expenses year-over-year.
     other_operating_expenses_generic = models.DecimalField(max_digits=15, decimal_places=2)
     other_operating_expenses_udf1 = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -121,15 +138,15 @@ class IncomeStatement(models.Model):
     other_operating_expenses_udf7 = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     #
     ### Total Operating Expenses
-    total_operating_expenses = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    total_operating_expenses = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     # Net Operating Income; = Gross Profit - Total Operating Expenses
-    net_operating_income = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    net_operating_income = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     ###########################################
 
     ## Other Income and Expenses (subtotal) # Other Income and Expenses Subtotal Field
-    total_other_income_and_expenses = models.DecimalField(max_digits=15, decimal_places=2)
+    total_other_income_and_expenses = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     # Other Income and Expenses (Cascade)
     gain_on_sale_of_asset = models.DecimalField(max_digits=15, decimal_places=2)
@@ -138,7 +155,7 @@ class IncomeStatement(models.Model):
     interest_expense = NegativeDecimalField(max_digits=15, decimal_places=2) # Cash Flow Add Back using the absolute value of this field due to it being entered as a negative value.
     #
     ## Other Income and Expenses (subtotal)
-    other_income_and_expenses_subtotal = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    other_income_and_expenses_subtotal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     #
     # Other Income and Expenses (Cascade)
@@ -147,119 +164,46 @@ class IncomeStatement(models.Model):
     other_income_or_expense_udf2 = models.DecimalField(max_digits=15, decimal_places=2)
     #
     ### Net Profit (Loss); Pre-Tax
-    net_profit_loss = models.DecimalField(max_digits=15, decimal_places=2)
+    net_profit_loss = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
 
     ###################################
 
     # C-Corporation Taxes
-    c_corporate_taxes_subtotal = models.DecimalField(max_digits=15, decimal_places=2) # C-Corporate Taxes Subtotal Field
+    c_corporate_taxes_subtotal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False) # C-Corporate Taxes Subtotal Field
     # C-Corporation Taxes (Cascade)
     c_corporation_taxes = NegativeDecimalField(max_digits=15, decimal_places=2) # Cash flow add back (absolute value) for EBIT, EBITDA, and EBITDAR
     c_corporation_tax_refund = models.DecimalField(max_digits=15, decimal_places=2) # Cash flow Reduction back for EBIT, EBITDA, and EBITDAR
     #
     ### Net Profit (Loss)
-    net_profit_loss_after_taxes = models.DecimalField(max_digits=15, decimal_places=2)
+    net_profit_loss_after_taxes = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
     distributions_to_shareholders = NegativeDecimalField(max_digits=15, decimal_places=2) # Entered as a negative value
 
 
-    @property
-    def months_in_period(self):
-        if self.period_ending_date and self.legal_entity_fiscal_year_end:
-            fy_end_month = self.legal_entity_fiscal_year_end.month
-            period_end_month = self.period_ending_date.month
+    # Current Period Retained Earnings; = Net Profit (Loss) After Taxes + Distributions to Shareholders (-).
+    # Carried to the associated Balance Sheet.
+    current_period_retained_earnings = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False)
+
+    CHART = INCOME_STATEMENT_CHART
+
+    objects = StatementQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business_name', 'months_in_period', 'period_ending_date'], name='is_business_fye_idx'),
+        ]
+
+    # Months in period, subtotals and totals are stored columns computed from the line items on
+    # save, using the formulas in spreading.chart_of_accounts.
+    def compute_totals(self):
+        self.months_in_period = months_in_period(self.period_ending_date, self.legal_entity_fiscal_year_end)
+        normalize_negative_fields(self)
+        self.CHART.apply(self)
+
+    def save(self, *args, **kwargs):
+        self.compute_totals()
+        if not self._state.adding:
+            self.version += 1
+        super().save(*args, **kwargs)
 
-            if fy_end_month == 12:
-                return period_end_month
-            elif period_end_month > fy_end_month:
-                return period_end_month - fy_end_month
-            else:
-                return (12 - fy_end_month) + period_end_month
-        else:
-            return None
-
-    @property
-    def revenue_subtotal(self):
-        result = self.revenue_generic + self.revenue_udf1 + self.revenue_udf2 + self.revenue_udf3 + self.revenue_udf4
-        return result
-
-    @property
-    def net_revenue(self):
-        result = self.revenue_subtotal - self.returns_and_allowances
-        return result
-
-    @property
-    def cost_of_goods_sold_subtotal(self):
-        result = self.cost_of_goods_sold_generic + self.cost_of_goods_sold_depreciation + self.cost_of_goods_sold_udf1
-        return result
-
-    @property
-    def total_gross_profit(self):
-        result = self.net_revenue - self.cost_of_goods_sold_subtotal
-        return result
-
-    @property
-    def rent_and_lease_expenses_subtotal(self):
-        result = self.real_estate_rent + self.operating_leases + self.rent_and_lease_expense_udf1
-        return result
-
-    @property
-    def taxes_licenses_and_insurance_subtotal(self):
-        result = self.real_estate_taxes + self.payroll_taxes + self.other_taxes_and_licenses
-        return result
-
-    @property
-    def other_operating_expenses_subtotal(self):
-        results = (
-            self.other_operating_expenses_udf1 + self.other_operating_expenses_udf2 + self.other_operating_expenses_udf3 +
-            self.other_operating_expenses_udf4 + self.other_operating_expenses_udf5 + self.other_operating_expenses_udf6 +
-            self.other_operating_expenses_udf7
-        )
-
-    @property
-    def total_operating_expenses(self):
-        result = (
-            self.salaries_and_wages + self.officers_compensation + self.repairs_and_maintenance + self.bad_debt +
-            self.rent_and_lease_expenses_subtotal + self.taxes_and_licenses_subtotal +
-            self.depreciation_and_depletion + self.amortization + self.legal_and_professional_expenses +
-            self.employee_benefit_programs + self.advertising + self.other_operating_expenses_subtotal
-        )
-        return result
-
-    @property
-    def net_operating_income(self):
-        result = self.total_gross_profit - self.total_operating_expenses
-        return result
-
-    @property
-    def total_other_income_and_expenses(self):
-        result = (self.gain_on_sale_of_asset + self.loss_on_sale_of_asset + self.interest_income)
-        return result
-
-    @property
-    def other_income_or_expenses_subtotal(self):
-        result = self.other_income_or_expense_general
-        return result
-
-    @property
-    def net_profit_loss(self):
-        result = self.net_operating_income + self.total_other_income_and_expenses
-        return result
-
-    @property
-    def net_profit_loss_after_taxes(self):
-        result = self.net_profit_loss + self.c_corporate_taxes_subtotal # Note: In most cases, the C-Corp. tax subtotal will be a negative value. Which, is why it is summed here.
-        return result
-            
-        #Distribution of Earnings
-        
-        # Retained Earnings; = Net Income (Loss) After C-Corporation Taxes + Distribution to Shareholders (-). Note that I am adding the values here because Distribution to Shareholders is entered as a negative value within the model.
-
-    @property
-    def retained_earnings(self):
-        result = self.net_profit_loss + self.distributions_to_shareholders
-        return result
-
-    @property
     def __str__(self):
-        result = f"Income Statement of user {self.user} for business {self.business.entity_name}"
-        return result
+        return f"Income Statement of user {self.user} for business {self.business_name.entity_name}"
@@ -0,0 +1,29 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from spreading.workbook_export import CSV_HEADERS, LAYOUTS, SPREAD_EXPORT_FORMATS, csv_rows, write_workbook
+
+
+class Command(BaseCommand):
+    help = 'Exports multi-period spreads with totals and ratios for one affiliate or the whole portfolio.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=SPREAD_EXPORT_FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--affiliate', type=int, help='Only this affiliate\'s businesses; defaults to the portfolio.')
+        parser.add_argument('--layout', choices=LAYOUTS, default='spreading_model')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        export_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if export_format not in SPREAD_EXPORT_FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}; pass --format.')
+        if export_format == 'csv':
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(CSV_HEADERS)
+                writer.writerows(csv_rows(options['affiliate']))
+        else:
+            write_workbook(path, options['affiliate'], LAYOUTS[options['layout']])
+        self.stdout.write(self.style.SUCCESS(f'Spreads written to {path}.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from spreading import workbook_import
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Imports legacy spreads from Financial Spreading Model workbooks (.xlsx), parsing them in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--user', required=True, help='Username the imported statements are entered under.')
+        parser.add_argument('--mapping', help='JSON file overriding the default sheet, row and column mapping.')
+        parser.add_argument('--workers', type=int, help='Worker processes for parsing; defaults to the CPU count.')
+        parser.add_argument('--batch-size', type=int, default=workbook_import.LOAD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+        try:
+            mapping = workbook_import.load_mapping(options['mapping'])
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Invalid mapping: {error}')
+
+        result = workbook_import.import_workbooks(
+            options['paths'], user, mapping, options['workers'], options['batch_size'],
+        )
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {result.workbooks} workbooks: {result.created} periods created, {len(result.errors)} errors.'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from spreading import cash_flow
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored UCA cash flow of every balance sheet period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=cash_flow.BUSINESS_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = cash_flow.rebuild_all(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} UCA cash flows.'))
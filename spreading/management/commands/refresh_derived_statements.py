@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from spreading import annualization
+
+
+class Command(BaseCommand):
+    help = 'Recomputes stale annualized and trailing-twelve-month statements for every business.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=annualization.BUSINESS_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = annualization.refresh_all(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Derived statements are current for {count} businesses.'))
@@ -0,0 +1,29 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from spreading.stress import BORROWER_CHUNK_SIZE, DEFAULT_SCENARIO, RESULT_FIELDS, Scenario, stress_test
+
+
+class Command(BaseCommand):
+    help = 'Monte Carlo stress test of DSCR for every commercial borrower (or the given businesses), written to a CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--business', action='append', dest='businesses', help='Business uuid; may be repeated. Defaults to every commercial borrower.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, help='Worker processes; defaults to the number of CPUs.')
+        parser.add_argument('--chunk-size', type=int, default=BORROWER_CHUNK_SIZE)
+        for field, value in DEFAULT_SCENARIO._asdict().items():
+            parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+
+    def handle(self, *args, **options):
+        scenario = Scenario(**{field: options[field] for field in Scenario._fields})
+        count = 0
+        with open(options['path'], 'w', newline='') as file:
+            writer = csv.DictWriter(file, RESULT_FIELDS)
+            writer.writeheader()
+            for result in stress_test(options['businesses'], scenario, options['seed'], options['workers'], options['chunk_size']):
+                writer.writerow(result)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Stress tested {count} borrowers; results written to {options['path']}."))
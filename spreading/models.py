@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from relationships.models import Affiliate, Business, Individual
 
@@ -11,3 +12,83 @@ class GlobalStatement(models.Model):
 
     def __str__(self):
         return f"Global Statement ID: {self.pk}"
+
+    # Global cash flow and DSCR of the statement's relationship, by year (see spreading.global_cash_flow).
+    def global_cash_flow(self):
+        from spreading.global_cash_flow import global_cash_flow
+        return global_cash_flow(self.affiliate_id)
+
+
+class PersonalCashFlow(models.Model):
+    # One period of an individual's personal cash flow (tax return or personal financial
+    # statement), for the global cash flow. Income from the owner's businesses (K-1s, wages
+    # paid by them) is left out: those businesses' cash flow is counted by ownership share.
+    individual = models.ForeignKey(Individual, on_delete=models.CASCADE, related_name='personal_cash_flows')
+    period_ending_date = models.DateField()
+    months_in_period = models.IntegerField(default=12)
+
+    # Income
+    wages_and_salaries = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    interest_and_dividends = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    net_rental_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    other_income = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Expenses (entered as positive amounts)
+    income_taxes = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    living_expenses = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Personal debt service: mortgages, vehicle loans, credit cards, other personal obligations.
+    personal_debt_service = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    # Incremented on every save; global cash flows are cached by the versions they were computed from.
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['individual', 'period_ending_date'], name='unique_personal_cash_flow'),
+        ]
+
+    def cash_available(self):
+        return (
+            self.wages_and_salaries + self.interest_and_dividends + self.net_rental_income + self.other_income
+            - self.income_taxes - self.living_expenses
+        )
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Personal cash flow for {self.individual} ending {self.period_ending_date}"
+
+
+class DerivedStatement(models.Model):
+    # An income statement computed from others (see spreading.annualization): one period
+    # annualized, or trailing twelve months built from an interim period, the prior fiscal year
+    # end and the prior year's interim. `source_versions` records the id:version of every source
+    # statement; the row is stale once any of them no longer matches.
+    KIND_CHOICES = [
+        ('ANNUALIZED', 'Annualized'),
+        ('TTM', 'Trailing Twelve Months'),
+    ]
+
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='derived_statements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    period_ending_date = models.DateField()
+    source_versions = models.CharField(max_length=255)
+    values = models.JSONField(encoder=DjangoJSONEncoder)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['business', 'kind', 'period_ending_date'], name='unique_derived_statement'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} statement for {self.business} ending {self.period_ending_date}"
+
+
+# The statement models live in their own packages; importing them here registers them with the
+# spreading app.
+from spreading.income_statement.models import IncomeStatement
+from spreading.balance_sheet.models import BalanceSheet
+from spreading.uca_cash_flow.models import UCACashFlow
@@ -0,0 +1,9 @@
+from relationships.models import Business
+from .models import BalanceSheet
+
+
+def borrowers_below_current_ratio(threshold=1):
+    # Businesses whose latest fiscal-year-end balance sheet has a current ratio below `threshold`,
+    # in one query over the stored totals.
+    below = BalanceSheet.objects.latest_fiscal_year_end().with_current_ratio().filter(current_ratio__lt=threshold)
+    return Business.objects.filter(pk__in=below.values('business_name'))
@@ -0,0 +1,31 @@
+from django.db import models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import NullIf
+
+# Prefix of the totals annotated by StatementQuerySet.with_totals; the unprefixed names are the
+# stored total columns.
+COMPUTED_PREFIX = 'computed_'
+
+
+class StatementQuerySet(models.QuerySet):
+    def with_totals(self, *totals):
+        # Annotates `computed_<total>` for each named total (all of them by default), computed in the
+        # database from the line items with the model's chart of accounts.
+        chart = self.model.CHART
+        return self.annotate(**{f'{COMPUTED_PREFIX}{total}': chart.expression(total) for total in totals or chart.totals})
+
+
+class BalanceSheetQuerySet(StatementQuerySet):
+    def latest_fiscal_year_end(self):
+        # Each business's most recent balance sheet whose income statement covers a full fiscal year.
+        fiscal_year_ends = self.model.objects.filter(income_statement__months_in_period=12)
+        latest = fiscal_year_ends.filter(business_name=OuterRef('business_name')).order_by('-period_ending_date').values('pk')[:1]
+        return self.filter(income_statement__months_in_period=12, pk=Subquery(latest))
+
+    def with_current_ratio(self):
+        ratio = models.ExpressionWrapper(
+            F('total_current_assets') / NullIf(F('total_current_liabilities'), 0),
+            output_field=models.DecimalField(max_digits=15, decimal_places=4),
+        )
+        return self.annotate(current_ratio=ratio)
+
@@ -0,0 +1,254 @@
+import numpy as np
+from django.core.cache import cache
+
+from loans.debt_service import debt_service as loan_debt_service
+from relationships.models import Business
+from .models import BalanceSheet
+
+# Statement columns loaded into the ratio matrix: income statement columns are read through the
+# balance sheet's income_statement, so each row is one period's pair of statements.
+INCOME_STATEMENT_COLUMNS = (
+    'months_in_period',
+    'net_revenue',
+    'cogs_subtotal',
+    'cost_of_goods_sold_depreciation',
+    'total_gross_profit',
+    'total_operating_expenses',
+    'depreciation_and_depletion',
+    'amortization',
+    'net_operating_income',
+    'interest_expense',
+    'net_profit_loss',
+    'net_profit_loss_after_taxes',
+    'distributions_to_shareholders',
+)
+BALANCE_SHEET_COLUMNS = (
+    'cash_subtotal',
+    'accounts_receivable_net',
+    'inventory_subtotal',
+    'prepaid_expenses_generic',
+    'total_current_assets',
+    'net_fixed_assets',
+    'total_assets',
+    'accounts_payable_subtotal',
+    'current_portion_of_long_term_debt_subtotal',
+    'total_current_liabilities',
+    'total_liabilities',
+    'total_shareholders_equity',
+)
+COLUMNS = INCOME_STATEMENT_COLUMNS + BALANCE_SHEET_COLUMNS
+# COLUMNS as read from BalanceSheet.
+MATRIX_FIELDS = (*(f'income_statement__{name}' for name in INCOME_STATEMENT_COLUMNS), *BALANCE_SHEET_COLUMNS)
+
+RATIOS = (
+    'current_ratio',
+    'quick_ratio',
+    'debt_to_worth',
+    'ebit',
+    'ebitda',
+    'interest_coverage',
+    'debt_service',
+    'dscr',
+    'return_on_assets',
+    'return_on_equity',
+    'days_receivable',
+    'days_inventory',
+    'days_payable',
+    'days_payable_excluding_depreciation',
+    'net_sales_to_net_fixed_assets',
+    'gross_margin',
+    'net_profit_margin',
+    'revenue_growth',
+    'net_profit_growth',
+    'operating_profit_growth',
+)
+
+# Coverage with the annual debt service of the borrower's proposed loans (loans.debt_service)
+# added to each period's debt service. Loans change independently of statements, so these are
+# applied when ratios are read rather than cached with them.
+PRO_FORMA_RATIOS = (
+    'proposed_debt_service',
+    'pro_forma_debt_service',
+    'pro_forma_dscr',
+)
+
+DAYS_PER_YEAR = 365
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def cache_key(business_id):
+    return f'spreading:ratios:{business_id}'
+
+
+def invalidate(business_id):
+    cache.delete(cache_key(business_id))
+
+
+class StatementMatrix:
+    # Every period for a set of businesses as one dense float matrix: a row per statement period
+    # (sorted by business, then period end) and a column per line item in COLUMNS. Missing
+    # values are NaN.
+
+    def __init__(self, keys, business_ids, period_ending_dates, values):
+        self.keys = keys
+        self.business_ids = business_ids
+        self.period_ending_dates = period_ending_dates
+        self.values = values
+        self.index = {name: position for position, name in enumerate(COLUMNS)}
+
+    @classmethod
+    def load(cls, business_ids):
+        return cls.from_rows(
+            BalanceSheet.objects
+            .filter(business_name_id__in=business_ids, income_statement__isnull=False)
+            .order_by('business_name_id', 'period_ending_date')
+            .values_list('uuid', 'business_name_id', 'period_ending_date', *MATRIX_FIELDS)
+        )
+
+    @classmethod
+    def from_rows(cls, rows):
+        # `rows` are (balance sheet uuid, business id, period ending date, *COLUMNS) tuples,
+        # already sorted by business and period.
+        rows = list(rows)
+        values = np.array([[np.nan if value is None else float(value) for value in row[3:]] for row in rows], dtype=float)
+        return cls(
+            [str(row[0]) for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            values.reshape(len(rows), len(COLUMNS)),
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def column(self, name):
+        return self.values[:, self.index[name]]
+
+
+def _divide(numerator, denominator):
+    # Elementwise division with NaN wherever the denominator is zero or missing.
+    result = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=result, where=(denominator != 0) & ~np.isnan(denominator))
+    return result
+
+
+def _growth(matrix, values):
+    # Change from the same business's previous period; NaN for each business's first period.
+    growth = np.full(len(matrix), np.nan)
+    if len(matrix) > 1:
+        business_ids = matrix.business_ids
+        same_business = np.array([business_ids[row] == business_ids[row - 1] for row in range(1, len(business_ids))])
+        growth[1:] = np.where(same_business, _divide(values[1:], np.abs(values[:-1])) - np.sign(values[:-1]), np.nan)
+    return growth
+
+
+def compute_ratios(matrix):
+    # Every ratio in RATIOS for every row of `matrix` in one vectorized pass. Flow amounts are
+    # annualized by months in period, so interim and annual periods compare directly.
+    # Expense accounts held as negative amounts (NegativeDecimalField) are used by absolute value.
+    c = matrix.column
+    annualize = _divide(12, c('months_in_period'))
+    days_in_period = DAYS_PER_YEAR * _divide(c('months_in_period'), 12)
+    cogs = np.abs(c('cogs_subtotal'))
+    cogs_depreciation = np.abs(np.nan_to_num(c('cost_of_goods_sold_depreciation')))
+    interest = np.abs(np.nan_to_num(c('interest_expense')))
+
+    ebit = c('net_profit_loss') + interest
+    ebitda = ebit + np.nan_to_num(c('depreciation_and_depletion')) + np.nan_to_num(c('amortization')) + cogs_depreciation
+    # Annual debt service: interest paid plus the current maturities of long-term debt.
+    debt_service = interest * annualize + np.nan_to_num(c('current_portion_of_long_term_debt_subtotal'))
+    annual_revenue = c('net_revenue') * annualize
+    annual_net_profit = c('net_profit_loss_after_taxes') * annualize
+    # Quick assets: current assets other than inventory and prepaid expenses.
+    quick_assets = c('total_current_assets') - np.nan_to_num(c('inventory_subtotal')) - np.nan_to_num(c('prepaid_expenses_generic'))
+
+    return {
+        'current_ratio': _divide(c('total_current_assets'), c('total_current_liabilities')),
+        'quick_ratio': _divide(quick_assets, c('total_current_liabilities')),
+        'debt_to_worth': _divide(c('total_liabilities'), c('total_shareholders_equity')),
+        'ebit': ebit,
+        'ebitda': ebitda,
+        'annual_ebitda': ebitda * annualize,
+        # Net profit after taxes over interest expense, as the workbook computes it.
+        'interest_coverage': _divide(c('net_profit_loss_after_taxes'), interest),
+        'debt_service': debt_service,
+        'dscr': _divide(ebitda * annualize, debt_service),
+        'return_on_assets': _divide(annual_net_profit, c('total_assets')),
+        'return_on_equity': _divide(annual_net_profit, c('total_shareholders_equity')),
+        'days_receivable': _divide(c('accounts_receivable_net'), c('net_revenue')) * days_in_period,
+        'days_inventory': _divide(c('inventory_subtotal'), cogs) * days_in_period,
+        'days_payable': _divide(c('accounts_payable_subtotal'), cogs) * days_in_period,
+        'days_payable_excluding_depreciation': _divide(c('accounts_payable_subtotal'), cogs - cogs_depreciation) * days_in_period,
+        'net_sales_to_net_fixed_assets': _divide(annual_revenue, c('net_fixed_assets')),
+        'gross_margin': _divide(c('total_gross_profit'), c('net_revenue')),
+        'net_profit_margin': _divide(c('net_profit_loss_after_taxes'), c('net_revenue')),
+        'revenue_growth': _growth(matrix, annual_revenue),
+        'net_profit_growth': _growth(matrix, annual_net_profit),
+        'operating_profit_growth': _growth(matrix, c('net_operating_income') * annualize),
+    }
+
+
+def common_size(matrix):
+    # Income statement columns as a share of net revenue, balance sheet columns as a share of
+    # total assets: {column: array}.
+    net_revenue = matrix.column('net_revenue')
+    total_assets = matrix.column('total_assets')
+    sizes = {name: _divide(matrix.column(name), net_revenue) for name in INCOME_STATEMENT_COLUMNS if name != 'months_in_period'}
+    sizes.update({name: _divide(matrix.column(name), total_assets) for name in BALANCE_SHEET_COLUMNS})
+    return sizes
+
+
+def _value(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def row_ratios(ratios, row):
+    # One row of compute_ratios' output as {ratio: value or None}.
+    return {name: _value(ratios[name][row]) for name in RATIOS}
+
+
+def statement_ratios(business_ids):
+    # Ratios for every statement period of the given businesses:
+    # {business id: {balance sheet uuid: {'period_ending_date', ratio: value, ...}}}, including the
+    # PRO_FORMA_RATIOS. Results are cached per business and invalidated whenever one of its
+    # statements is saved or deleted; only businesses missing from the cache are loaded and
+    # computed, as one batch.
+    business_ids = list(dict.fromkeys(business_ids))
+    keys = {business_id: cache_key(business_id) for business_id in business_ids}
+    cached = cache.get_many(keys.values())
+    results = {business_id: cached[key] for business_id, key in keys.items() if key in cached}
+    missing = [business_id for business_id in business_ids if business_id not in results]
+    if missing:
+        matrix = StatementMatrix.load(missing)
+        ratios = compute_ratios(matrix)
+        computed = {business_id: {} for business_id in missing}
+        for row, key in enumerate(matrix.keys):
+            statement = {'period_ending_date': matrix.period_ending_dates[row], 'annual_ebitda': _value(ratios['annual_ebitda'][row])}
+            statement.update(row_ratios(ratios, row))
+            computed[matrix.business_ids[row]][key] = statement
+        cache.set_many({keys[business_id]: statements for business_id, statements in computed.items()}, CACHE_TIMEOUT)
+        results.update(computed)
+    return with_pro_forma(results)
+
+
+def with_pro_forma(results):
+    # Adds the PRO_FORMA_RATIOS to statement_ratios results, from each business's borrower's
+    # (cached) loan debt service.
+    affiliates = dict(Business.objects.filter(pk__in=list(results)).values_list('pk', 'affiliate_id'))
+    loans = loan_debt_service(affiliates.values())
+    pro_forma = {}
+    for business_id, statements in results.items():
+        proposed = float(loans[affiliates[business_id]]['proposed']) if business_id in affiliates else 0.0
+        pro_forma[business_id] = {}
+        for key, statement in statements.items():
+            debt_service = (statement['debt_service'] or 0.0) + proposed
+            annual_ebitda = statement.get('annual_ebitda')
+            pro_forma[business_id][key] = {
+                **statement,
+                'proposed_debt_service': proposed,
+                'pro_forma_debt_service': debt_service,
+                'pro_forma_dscr': annual_ebitda / debt_service if annual_ebitda is not None and debt_service else None,
+            }
+    return pro_forma
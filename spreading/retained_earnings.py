@@ -0,0 +1,129 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .chart_of_accounts import BALANCE_SHEET_CHART
+from .models import IncomeStatement, BalanceSheet
+from . import balance_check, cash_flow, ratios
+
+# Fields rewritten when a balance sheet's beginning retained earnings change: the field itself and
+# every total downstream of it.
+CHAIN_FIELDS = ('beginning_retained_earnings', *BALANCE_SHEET_CHART.downstream('beginning_retained_earnings'))
+
+BULK_BATCH_SIZE = 500
+
+# Retained earnings roll forward from fiscal year end to fiscal year end: every period's beginning
+# retained earnings are the ending retained earnings (beginning + current period) of the latest
+# earlier balance sheet whose income statement covers a full fiscal year. Interim periods report
+# year-to-date earnings, so they start from that same year end. Periods with no earlier fiscal
+# year end keep the beginning retained earnings entered for them.
+
+
+def closes_fiscal_year(sheet):
+    return getattr(sheet, 'income_statement_months', None) == 12
+
+
+def ending_retained_earnings(sheet):
+    return (sheet.beginning_retained_earnings or 0) + (sheet.current_period_retained_earnings or 0)
+
+
+def _sheets(business_id):
+    return (
+        BalanceSheet.objects
+        .filter(business_name_id=business_id, period_ending_date__isnull=False)
+        .annotate(income_statement_months=F('income_statement__months_in_period'))
+    )
+
+
+def chain(sheets, opening=None):
+    # Chains retained earnings through `sheets` (one business, sorted by period ending date) in
+    # memory, starting from `opening` (the prior fiscal year end's ending retained earnings, or
+    # None). Updates beginning retained earnings and the totals that depend on them; returns the
+    # sheets that changed.
+    changed = []
+    for sheet in sheets:
+        if opening is not None and sheet.beginning_retained_earnings != opening:
+            sheet.beginning_retained_earnings = opening
+            BALANCE_SHEET_CHART.update(sheet, 'beginning_retained_earnings')
+            changed.append(sheet)
+        if closes_fiscal_year(sheet):
+            opening = ending_retained_earnings(sheet)
+    return changed
+
+
+def opening_before(business_id, period_ending_date, inclusive=False):
+    # Ending retained earnings of the latest fiscal year end before (or on) the given date.
+    lookup = 'period_ending_date__lte' if inclusive else 'period_ending_date__lt'
+    previous = (
+        _sheets(business_id)
+        .filter(income_statement_months=12, **{lookup: period_ending_date})
+        .order_by('-period_ending_date')
+        .only('beginning_retained_earnings', 'current_period_retained_earnings')
+        .first()
+    )
+    return None if previous is None else ending_retained_earnings(previous)
+
+
+def carry_forward(sheet):
+    # Sets one unsaved balance sheet's beginning retained earnings from the previous fiscal year end.
+    if sheet.period_ending_date and sheet.business_name_id:
+        opening = opening_before(sheet.business_name_id, sheet.period_ending_date)
+        if opening is not None:
+            sheet.beginning_retained_earnings = opening
+
+
+@transaction.atomic
+def rechain(business_id, after=None):
+    # Re-chains a business's balance sheets; with `after`, only the periods ending after that date
+    # (the ones an edit on that date can affect). One read for the opening balance, one for the
+    # periods re-chained and one bulk_update. Returns the number of balance sheets updated.
+    sheets = _sheets(business_id).order_by('period_ending_date')
+    opening = None
+    if after is not None:
+        opening = opening_before(business_id, after, inclusive=True)
+        sheets = sheets.filter(period_ending_date__gt=after)
+    changed = chain(list(sheets), opening)
+    BalanceSheet.objects.bulk_update(changed, CHAIN_FIELDS, batch_size=BULK_BATCH_SIZE)
+    if changed:
+        ratios.invalidate(business_id)
+        balance_check.invalidate(sheet.pk for sheet in changed)
+    return len(changed)
+
+
+@transaction.atomic
+def bulk_load(income_statements, balance_sheets):
+    # Loads many periods of spreads at once. `income_statements` are unsaved IncomeStatements and
+    # `balance_sheets` unsaved BalanceSheets (each optionally pointing at one of them). Totals are
+    # computed in memory, each business's periods (new and existing) are sorted and chained once,
+    # and everything is written with two bulk_creates and one bulk_update, whatever the order
+    # the periods arrive in. The businesses' UCA cash flows are then rebuilt in one pass.
+    for statement in income_statements:
+        statement.compute_totals()
+    IncomeStatement.objects.bulk_create(income_statements, batch_size=BULK_BATCH_SIZE)
+
+    by_business = defaultdict(list)
+    for sheet in balance_sheets:
+        sheet.sync_income_statement()
+        sheet.compute_totals()
+        by_business[sheet.business_name_id].append(sheet)
+
+    existing = (
+        BalanceSheet.objects
+        .filter(business_name_id__in=list(by_business), period_ending_date__isnull=False)
+        .annotate(income_statement_months=F('income_statement__months_in_period'))
+    )
+    for sheet in existing:
+        by_business[sheet.business_name_id].append(sheet)
+
+    updated = []
+    for business_id, sheets in by_business.items():
+        dated = sorted((sheet for sheet in sheets if sheet.period_ending_date), key=lambda sheet: sheet.period_ending_date)
+        updated.extend(sheet for sheet in chain(dated) if not sheet._state.adding)
+        ratios.invalidate(business_id)
+
+    BalanceSheet.objects.bulk_create(balance_sheets, batch_size=BULK_BATCH_SIZE)
+    BalanceSheet.objects.bulk_update(updated, CHAIN_FIELDS, batch_size=BULK_BATCH_SIZE)
+    balance_check.invalidate(sheet.pk for sheet in updated)
+    cash_flow.rebuild(list(by_business))
+    return balance_sheets
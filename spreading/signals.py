@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from .models import IncomeStatement, BalanceSheet
+from . import balance_check, cash_flow, ratios, retained_earnings
+
+# Cached ratios cover every period of a business (growth compares neighbouring periods), so any
+# statement change drops the business's cached ratios.
+@receiver(post_save, sender=IncomeStatement)
+@receiver(post_delete, sender=IncomeStatement)
+@receiver(post_save, sender=BalanceSheet)
+@receiver(post_delete, sender=BalanceSheet)
+def invalidate_statement_ratios(sender, instance, **kwargs):
+    ratios.invalidate(instance.business_name_id)
+
+# Working copies kept by the live balance check start from the saved values, so they are dropped
+# when those change.
+@receiver(post_save, sender=BalanceSheet)
+@receiver(post_delete, sender=BalanceSheet)
+def drop_balance_check_copies(sender, instance, **kwargs):
+    balance_check.invalidate([instance.pk])
+
+# An income statement edit changes its balance sheet's current period retained earnings, and
+# through them the beginning retained earnings of later periods.
+@receiver(post_save, sender=IncomeStatement)
+def resave_balance_sheets(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    for sheet in BalanceSheet.objects.filter(income_statement=instance):
+        sheet.income_statement = instance
+        sheet.save()
+
+# Later periods carried their beginning retained earnings from a deleted balance sheet (or past
+# it), so they are re-chained from the day before it.
+@receiver(post_delete, sender=BalanceSheet)
+def rechain_after_delete(sender, instance, **kwargs):
+    if instance.period_ending_date and instance.business_name_id:
+        retained_earnings.rechain(instance.business_name_id, after=instance.period_ending_date - timedelta(days=1))
+
+# A balance sheet's UCA cash flow, and the next period's that starts from it, are rebuilt when it
+# is saved or deleted: every cash flow ending on or after the earlier of its old and new period
+# ending dates.
+@receiver(post_init, sender=BalanceSheet)
+def snapshot_period_ending_date(sender, instance, **kwargs):
+    instance._saved_period_ending_date = instance.__dict__.get('period_ending_date')
+
+@receiver(post_save, sender=BalanceSheet)
+def rebuild_cash_flows(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dates = [date for date in (instance._saved_period_ending_date, instance.period_ending_date) if date]
+    if dates:
+        cash_flow.rebuild([instance.business_name_id], since=min(dates))
+    instance._saved_period_ending_date = instance.period_ending_date
+
+@receiver(post_delete, sender=BalanceSheet)
+def remove_cash_flows(sender, instance, **kwargs):
+    if instance.period_ending_date:
+        cash_flow.rebuild([instance.business_name_id], since=instance.period_ending_date)
+
+# Deleting an income statement detaches its balance sheet, which no longer has a cash flow.
+@receiver(post_delete, sender=IncomeStatement)
+def remove_income_statement_cash_flows(sender, instance, **kwargs):
+    cash_flow.rebuild([instance.business_name_id], since=instance.period_ending_date)
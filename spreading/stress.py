@@ -0,0 +1,216 @@
+import os
+import uuid
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+from django.db.models import Sum
+
+from loans.debt_service import debt_service as loan_debt_service
+from loans.models import Loan
+from relationships.models import Business
+from .models import BalanceSheet
+from .ratios import MATRIX_FIELDS, StatementMatrix, compute_ratios
+
+# Monte Carlo stress test of borrower DSCR. A borrower's base case is its latest spread (its
+# latest projection when it has one), annualized. Every simulated path draws three independent
+# standard normal shocks:
+#   revenue     lognormal, with `revenue_volatility` as the standard deviation of log revenue;
+#   margin      gross margin moved by `margin_volatility` (absolute, 0.03 = 3 points), with the
+#               base case's other operating costs held fixed;
+#   rate        base rates moved by `rate_drift` + `rate_volatility` percentage points, repricing
+#               the borrower's variable-rate loans (interest never falls below zero).
+# Debt service is the spread's debt service (as in spreading.ratios) plus the borrower's proposed
+# loans (loans.debt_service). Paths are simulated for a chunk of borrowers at once as NumPy
+# arrays; portfolio runs send chunks to worker processes, which never touch the database. Each
+# borrower's draws come from its own seed (the run's seed and the borrower's id), so results are
+# reproducible whatever the chunking or the number of workers.
+
+Scenario = namedtuple('Scenario', 'paths revenue_volatility margin_volatility rate_volatility rate_drift covenant_dscr')
+
+DEFAULT_SCENARIO = Scenario(
+    paths=10000,
+    revenue_volatility=0.15,
+    margin_volatility=0.03,
+    rate_volatility=1.5,
+    rate_drift=0.0,
+    covenant_dscr=1.25,
+)
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Loan programs whose borrowers are stressed in portfolio runs.
+COMMERCIAL_LOAN_PROGRAMS = ('COMMERCIAL', 'SBA', 'USDA')
+
+# Borrowers loaded and simulated per task.
+BORROWER_CHUNK_SIZE = 100
+
+RESULT_FIELDS = (
+    'business_id',
+    'period_ending_date',
+    'financial_statement_quality',
+    'base_dscr',
+    *(f'dscr_p{percentile}' for percentile in PERCENTILES),
+    'breach_probability',
+)
+
+
+def commercial_borrowers():
+    # Businesses of every borrower with a proposed or existing commercial loan.
+    borrowers = Loan.objects.filter(loan_program__in=COMMERCIAL_LOAN_PROGRAMS, loan_status__in=('EXISTING', 'PROPOSED'))
+    return list(Business.objects.filter(affiliate_id__in=borrowers.values('borrower_id')).order_by('pk').values_list('pk', flat=True))
+
+
+def seed_key(business_id):
+    # A business's uuid as 32-bit words, to spawn its own SeedSequence from the run's seed.
+    value = uuid.UUID(str(business_id)).int
+    return tuple((value >> shift) & 0xFFFFFFFF for shift in (96, 64, 32, 0))
+
+
+def latest_spreads(business_ids):
+    # Each business's latest statement period, preferring projections: a StatementMatrix with one
+    # row per business, and the rows' statement quality.
+    latest = {}
+    rows = (
+        BalanceSheet.objects
+        .filter(business_name_id__in=business_ids, income_statement__isnull=False, period_ending_date__isnull=False)
+        .order_by('business_name_id', 'period_ending_date')
+        .values_list('uuid', 'business_name_id', 'period_ending_date', *MATRIX_FIELDS, 'income_statement__financial_statement_quality')
+    )
+    for row in rows:
+        current = latest.get(row[1])
+        if current is None or row[-1] == 'PR' or current[-1] != 'PR':
+            latest[row[1]] = row
+    rows = list(latest.values())
+    return StatementMatrix.from_rows(row[:-1] for row in rows), [row[-1] for row in rows]
+
+
+def load_base(business_ids):
+    # Base case of each business with statements: (matrix, qualities, {field: array}).
+    matrix, qualities = latest_spreads(business_ids)
+    ratios = compute_ratios(matrix)
+    annualize = np.nan_to_num(12 / matrix.column('months_in_period'))
+
+    affiliates = dict(Business.objects.filter(pk__in=matrix.business_ids).values_list('pk', 'affiliate_id'))
+    loans = loan_debt_service(set(affiliates.values()))
+    variable = dict(
+        Loan.objects
+        .filter(borrower_id__in=set(affiliates.values()), loan_status__in=('EXISTING', 'PROPOSED'), period_1_interest_rate_type='VARIABLE')
+        .values('borrower_id')
+        .annotate(balance=Sum('loan_amount'))
+        .values_list('borrower_id', 'balance')
+    )
+    borrowers = [affiliates[business_id] for business_id in matrix.business_ids]
+    base = {
+        'revenue': np.nan_to_num(matrix.column('net_revenue')) * annualize,
+        'gross_profit': np.nan_to_num(matrix.column('total_gross_profit')) * annualize,
+        'ebitda': np.nan_to_num(ratios['annual_ebitda']),
+        'interest': np.abs(np.nan_to_num(matrix.column('interest_expense'))) * annualize,
+        'debt_service': np.nan_to_num(ratios['debt_service']) + np.array([float(loans[borrower]['proposed']) for borrower in borrowers]),
+        'variable_balance': np.array([float(variable.get(borrower) or 0) for borrower in borrowers]),
+    }
+    return matrix, qualities, base
+
+
+def _dscr(ebitda, debt_service):
+    # Infinite where there is no debt service to cover.
+    dscr = np.full(np.broadcast(ebitda, debt_service).shape, np.inf)
+    np.divide(ebitda, debt_service, out=dscr, where=debt_service > 0)
+    return dscr
+
+
+def simulate(base, seed_keys, scenario=DEFAULT_SCENARIO, seed=0):
+    # DSCR of every path for every borrower in `base` ({field: array of borrowers}), as an array of
+    # shape (borrowers, paths).
+    draws = np.stack([
+        np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key)).standard_normal((3, scenario.paths))
+        for key in seed_keys
+    ], axis=1)
+    revenue_shock, margin_shock, rate_shock = draws
+
+    def column(name):
+        return base[name][:, np.newaxis]
+
+    revenue = column('revenue') * np.exp(scenario.revenue_volatility * revenue_shock - scenario.revenue_volatility ** 2 / 2)
+    base_margin = np.divide(column('gross_profit'), column('revenue'), out=np.zeros_like(column('revenue')), where=column('revenue') != 0)
+    margin = np.clip(base_margin + scenario.margin_volatility * margin_shock, -1, 1)
+    ebitda = revenue * margin - (column('gross_profit') - column('ebitda'))
+
+    rate_change = (scenario.rate_drift + scenario.rate_volatility * rate_shock) / 100
+    interest_change = np.maximum(column('variable_balance') * rate_change, -column('interest'))
+    return _dscr(ebitda, column('debt_service') + interest_change)
+
+
+def summarize(dscr, covenant_dscr):
+    # (percentiles of shape (borrowers, len(PERCENTILES)), breach probability per borrower).
+    percentiles = np.percentile(dscr, PERCENTILES, axis=1, method='nearest').T
+    return percentiles, (dscr < covenant_dscr).mean(axis=1)
+
+
+def _simulate_chunk(args):
+    base, seed_keys, scenario, seed = args
+    return summarize(simulate(base, seed_keys, scenario, seed), scenario.covenant_dscr)
+
+
+def _float(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def _results(chunks, summaries):
+    for (matrix, qualities, base), (percentiles, breach_probability) in zip(chunks, summaries):
+        base_dscr = _dscr(base['ebitda'], base['debt_service'])
+        for row, business_id in enumerate(matrix.business_ids):
+            yield {
+                'business_id': business_id,
+                'period_ending_date': matrix.period_ending_dates[row],
+                'financial_statement_quality': qualities[row],
+                'base_dscr': _float(base_dscr[row]),
+                **{f'dscr_p{percentile}': _float(value) for percentile, value in zip(PERCENTILES, percentiles[row])},
+                'breach_probability': float(breach_probability[row]),
+            }
+
+
+def stress_test(business_ids=None, scenario=DEFAULT_SCENARIO, seed=0, workers=None, chunk_size=BORROWER_CHUNK_SIZE):
+    # Stress tests the given businesses (every commercial borrower by default), yielding one dict
+    # of RESULT_FIELDS per business with statements. Base cases are small and are loaded here,
+    # `chunk_size` businesses per query; the simulations, which hold paths x borrowers arrays,
+    # run a chunk at a time in `workers` processes.
+    business_ids = commercial_borrowers() if business_ids is None else list(business_ids)
+    chunks = [load_base(business_ids[start:start + chunk_size]) for start in range(0, len(business_ids), chunk_size)]
+    chunks = [chunk for chunk in chunks if len(chunk[0])]
+    tasks = [(base, [seed_key(business_id) for business_id in matrix.business_ids], scenario, seed) for matrix, _, base in chunks]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        yield from _results(chunks, map(_simulate_chunk, tasks))
+        return
+    with Pool(workers) as pool:
+        yield from _results(chunks, pool.imap(_simulate_chunk, tasks))
+
+
+def rate_shock_dscr(debt_service_changes, chunk_size=BORROWER_CHUNK_SIZE):
+    # Base and shocked DSCR of borrowers' businesses under loans.rate_shock scenarios, from
+    # {borrower affiliate id: {shock name: change in annual debt service}}: each business's base
+    # case debt service (see load_base) moved by its borrower's change. Yields one dict per business
+    # with statements, its shocked DSCR under 'dscr' by shock name.
+    businesses = dict(
+        Business.objects.filter(affiliate_id__in=list(debt_service_changes)).order_by('pk').values_list('pk', 'affiliate_id')
+    )
+    business_ids = list(businesses)
+    for start in range(0, len(business_ids), chunk_size):
+        matrix, qualities, base = load_base(business_ids[start:start + chunk_size])
+        base_dscr = _dscr(base['ebitda'], base['debt_service'])
+        for row, business_id in enumerate(matrix.business_ids):
+            changes = debt_service_changes[businesses[business_id]]
+            yield {
+                'business_id': business_id,
+                'borrower_id': businesses[business_id],
+                'period_ending_date': matrix.period_ending_dates[row],
+                'financial_statement_quality': qualities[row],
+                'base_dscr': _float(base_dscr[row]),
+                'dscr': {
+                    name: _float(_dscr(base['ebitda'][row], base['debt_service'][row] + float(change)))
+                    for name, change in changes.items()
+                },
+            }
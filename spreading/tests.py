@@ -1,3 +1,233 @@
-from django.test import TestCase
+import random
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from relationships.models import Affiliate, Business, Individual
+from users.models import User
+from . import annualization, cash_flow, retained_earnings
+from .chart_of_accounts import BALANCE_SHEET_CHART, INCOME_STATEMENT_CHART
+from .models import GlobalStatement, IncomeStatement, BalanceSheet
+from .portfolio import borrowers_below_current_ratio
+from .querysets import COMPUTED_PREFIX
 
 # Create your tests here.
+
+def random_amounts(model, chart, rng):
+    values = {}
+    for name in chart.inputs:
+        field = model._meta.get_field(name)
+        if field.null and rng.random() < 0.2:
+            values[name] = None
+        else:
+            values[name] = Decimal(rng.randint(-10 ** 9, 10 ** 9)) / 100
+    return values
+
+
+class SpreadTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='analyst')
+        cls.businesses = []
+        for code in ('ALPHA', 'BETA'):
+            affiliate = Affiliate.objects.create(affiliate_code=code, affiliate_type='BUSINESS')
+            cls.businesses.append(Business.objects.create(
+                affiliate=affiliate, entity_name=code, business_type='LLC', ein='123456789', state_of_formation='TX',
+                date_of_formation=date(2010, 1, 1), address_1='1 Main', city='Austin', state='TX', zip_code='78701',
+                county='Travis', country='US',
+            ))
+        owner = Affiliate.objects.create(affiliate_code='OWNER', affiliate_type='INDIVIDUAL')
+        cls.individual = Individual.objects.create(
+            affiliate=owner, first_name='Pat', last_name='Owner', ssn='123456789', dob=date(1970, 1, 1), address_1='1 Main',
+            city='Austin', state='TX', zip_code='78701', county='Travis', country='US', email='pat@example.com',
+            jointly_reported='SOLE',
+        )
+
+    def create_statements(self, business, period_ending_date, income_values, balance_values):
+        global_statement = GlobalStatement.objects.create(affiliate=business.affiliate, entity=business, individual=self.individual)
+        income_statement = IncomeStatement.objects.create(
+            global_statement=global_statement, user=self.user, business_name=business,
+            legal_entity_fiscal_year_end=date(2020, 12, 31), period_ending_date=period_ending_date,
+            financial_statement_quality='TR', **income_values,
+        )
+        balance_sheet = BalanceSheet.objects.create(
+            income_statement=income_statement, global_statement=global_statement, business_name=business, **balance_values,
+        )
+        return income_statement, balance_sheet
+
+    def test_database_totals_match_python(self):
+        rng = random.Random(14)
+        for year in range(2018, 2023):
+            self.create_statements(
+                self.businesses[year % 2], date(year, 12, 31),
+                random_amounts(IncomeStatement, INCOME_STATEMENT_CHART, rng),
+                random_amounts(BalanceSheet, BALANCE_SHEET_CHART, rng),
+            )
+
+        for model, chart in ((IncomeStatement, INCOME_STATEMENT_CHART), (BalanceSheet, BALANCE_SHEET_CHART)):
+            statements = model.objects.with_totals()
+            self.assertEqual(len(statements), 5)
+            for statement in statements:
+                expected = chart.evaluate(chart.values(statement))
+                for total in chart.totals:
+                    with self.subTest(model=model.__name__, total=total):
+                        self.assertEqual(getattr(statement, COMPUTED_PREFIX + total), expected[total])
+                        self.assertEqual(getattr(statement, total), expected[total])
+
+    def test_borrowers_below_current_ratio_on_latest_fiscal_year_end(self):
+        def balance_values(current_assets, current_liabilities):
+            values = dict.fromkeys(BALANCE_SHEET_CHART.inputs, Decimal(0))
+            values.update(cash_at_financial_institution=current_assets, trade_accounts_payable=current_liabilities)
+            return values
+
+        income_values = dict.fromkeys(INCOME_STATEMENT_CHART.inputs, Decimal(0))
+        alpha, beta = self.businesses
+        # Alpha was illiquid last year but not on its latest fiscal year end; an interim
+        # statement after that year end does not count.
+        self.create_statements(alpha, date(2021, 12, 31), income_values, balance_values(Decimal(50), Decimal(100)))
+        self.create_statements(alpha, date(2022, 12, 31), income_values, balance_values(Decimal(150), Decimal(100)))
+        self.create_statements(alpha, date(2023, 6, 30), income_values, balance_values(Decimal(10), Decimal(100)))
+        self.create_statements(beta, date(2022, 12, 31), income_values, balance_values(Decimal(99), Decimal(100)))
+
+        self.assertEqual(list(borrowers_below_current_ratio()), [beta])
+        self.assertEqual(set(borrowers_below_current_ratio(Decimal('1.6'))), {alpha, beta})
+
+
+class AnnualizationTests(SimpleTestCase):
+    def source(self, pk, period_ending_date, months_in_period, business_id=1):
+        return annualization.Source(pk, business_id, period_ending_date, months_in_period, 1)
+
+    def test_ttm_is_interim_plus_prior_year_end_less_prior_interim(self):
+        prior_interim = self.source(1, date(2021, 6, 30), 6)
+        year_end = self.source(2, date(2021, 12, 31), 12)
+        interim = self.source(3, date(2022, 6, 30), 6)
+        derived = annualization.derivations([prior_interim, year_end, interim])
+
+        self.assertEqual(derived[1, 'TTM', date(2022, 6, 30)], (interim, year_end, prior_interim))
+        self.assertEqual(derived[1, 'TTM', date(2021, 12, 31)], (year_end,))
+        self.assertEqual(derived[1, 'ANNUALIZED', date(2022, 6, 30)], (interim,))
+        # The first interim has no prior interim, so no TTM.
+        self.assertNotIn((1, 'TTM', date(2021, 6, 30)), derived)
+
+    def test_no_ttm_when_interims_cover_different_months(self):
+        sources = [
+            self.source(1, date(2021, 6, 30), 6),
+            self.source(2, date(2021, 12, 31), 12),
+            self.source(3, date(2022, 6, 30), 9),
+        ]
+        derived = annualization.derivations(sources)
+        self.assertNotIn((1, 'TTM', date(2022, 6, 30)), derived)
+        self.assertIn((1, 'ANNUALIZED', date(2022, 6, 30)), derived)
+
+    def test_no_ttm_without_a_year_end_between_the_interims(self):
+        # The only fiscal year end precedes the prior interim, and another business's year end
+        # does not count.
+        sources = [
+            self.source(1, date(2019, 12, 31), 12),
+            self.source(2, date(2020, 6, 30), 6),
+            self.source(3, date(2021, 6, 30), 6),
+            self.source(4, date(2020, 12, 31), 12, business_id=2),
+        ]
+        derived = annualization.derivations(sources)
+        self.assertNotIn((1, 'TTM', date(2021, 6, 30)), derived)
+
+    def test_compute(self):
+        prior_interim = self.source(10, date(2021, 6, 30), 6)
+        year_end = self.source(11, date(2021, 12, 31), 12)
+        interim = self.source(12, date(2022, 3, 31), 3)
+        derived = {
+            (1, 'ANNUALIZED', interim.period_ending_date): (interim,),
+            (1, 'TTM', year_end.period_ending_date): (year_end,),
+            (1, 'TTM', date(2022, 6, 30)): (prior_interim, year_end, prior_interim),
+            (1, 'TTM', interim.period_ending_date): (interim, year_end, prior_interim),
+        }
+        index = {10: 0, 11: 1, 12: 2}
+        values = np.array([[50.0], [120.0], [40.5]]) * np.ones(len(annualization.FLOW_FIELDS))
+        computed = annualization.compute(derived, index, values)
+
+        self.assertEqual(set(computed), set(derived))
+        self.assertEqual(set(computed[1, 'ANNUALIZED', interim.period_ending_date].values()), {Decimal('162.00')})
+        self.assertEqual(set(computed[1, 'TTM', year_end.period_ending_date].values()), {Decimal('120.00')})
+        self.assertEqual(set(computed[1, 'TTM', date(2022, 6, 30)].values()), {Decimal('120.00')})
+        self.assertEqual(set(computed[1, 'TTM', interim.period_ending_date].values()), {Decimal('110.50')})
+
+    def test_compute_nothing(self):
+        self.assertEqual(annualization.compute({}, {}, np.zeros((0, len(annualization.FLOW_FIELDS)))), {})
+
+
+class RetainedEarningsChainTests(SimpleTestCase):
+    def sheet(self, months, beginning, current):
+        sheet = BalanceSheet(**dict.fromkeys(BALANCE_SHEET_CHART.inputs, Decimal(0)))
+        sheet.beginning_retained_earnings = Decimal(beginning)
+        sheet.current_period_retained_earnings = Decimal(current)
+        sheet.income_statement_months = months
+        BALANCE_SHEET_CHART.apply(sheet)
+        return sheet
+
+    def test_chain_rolls_forward_from_fiscal_year_ends(self):
+        first_year = self.sheet(12, 100, 30)
+        interim = self.sheet(6, 0, 10)
+        second_year = self.sheet(12, 0, 50)
+        following_interim = self.sheet(3, 0, 5)
+
+        changed = retained_earnings.chain([first_year, interim, second_year, following_interim])
+
+        self.assertEqual(changed, [interim, second_year, following_interim])
+        # The first sheet has no earlier fiscal year end and keeps what was entered.
+        self.assertEqual(first_year.beginning_retained_earnings, Decimal(100))
+        # Interim periods start from the prior year end without carrying each other forward.
+        self.assertEqual(interim.beginning_retained_earnings, Decimal(130))
+        self.assertEqual(second_year.beginning_retained_earnings, Decimal(130))
+        self.assertEqual(following_interim.beginning_retained_earnings, Decimal(180))
+        self.assertEqual(following_interim.total_shareholders_equity, Decimal(185))
+
+    def test_chain_from_an_opening_balance(self):
+        year_end = self.sheet(12, 20, 5)
+        current = self.sheet(12, 25, 1)
+        self.assertEqual(retained_earnings.chain([year_end, current], opening=Decimal(20)), [])
+        self.assertEqual(retained_earnings.chain([year_end, current], opening=Decimal(40)), [year_end, current])
+        self.assertEqual(current.beginning_retained_earnings, Decimal(45))
+
+
+class CashFlowTests(SimpleTestCase):
+    def values(self, **amounts):
+        row = np.zeros(len(cash_flow.SOURCE_FIELDS))
+        for name, amount in amounts.items():
+            row[cash_flow.SOURCE_FIELDS.index(name)] = amount
+        return row
+
+    def test_pairs_bridge_each_income_statement_period(self):
+        rows = [
+            ('a', 1, date(2020, 12, 31), 12),
+            ('b', 1, date(2021, 6, 30), 6),
+            ('c', 1, date(2021, 12, 31), 12),
+            ('d', 2, date(2022, 12, 31), 12),
+            ('e', 1, date(2022, 12, 31), None),
+        ]
+        ending, beginning = cash_flow.pairs(rows)
+        # The 2021 year end bridges from the 2020 year end, not from the interim; business 2 has
+        # no earlier sheet and a period without months is never paired.
+        self.assertEqual(list(zip(ending, beginning)), [(1, 0), (2, 0)])
+        ending, beginning = cash_flow.pairs(rows, since=date(2021, 7, 1))
+        self.assertEqual(list(zip(ending, beginning)), [(2, 0)])
+
+    def test_compute(self):
+        values = np.array([
+            self.values(accounts_receivable_net=100, cash_subtotal=50),
+            self.values(accounts_receivable_net=130, cash_subtotal=90, net_revenue=1000, cogs_subtotal=-600),
+        ])
+        lines = cash_flow.compute(values, np.array([1]), np.array([0]))
+
+        self.assertEqual(set(lines), set(cash_flow.UCA_LINES))
+        self.assertEqual(lines['net_sales'][0], 1000)
+        self.assertEqual(lines['change_in_trade_receivables'][0], -30)
+        self.assertEqual(lines['cash_collected_from_sales'][0], 970)
+        self.assertEqual(lines['gross_cash_profit'][0], 370)
+        self.assertEqual(lines['actual_change_in_cash'][0], 40)
+        self.assertEqual(lines['unexplained_change_in_cash'][0], lines['actual_change_in_cash'][0] - lines['cash_after_financing'][0])
+
+    def test_compute_nothing(self):
+        lines = cash_flow.compute(np.zeros((0, len(cash_flow.SOURCE_FIELDS))), np.array([], dtype=int), np.array([], dtype=int))
+        self.assertEqual(len(lines['net_sales']), 0)
@@ -0,0 +1,74 @@
+from django.db import models
+from relationships.models import Business
+from spreading.balance_sheet.models import BalanceSheet
+
+
+# UCA (Uniform Credit Analysis) cash flow for one balance sheet period, derived from it, the
+# balance sheet it follows and the income statement bridging the two (see spreading.cash_flow,
+# which defines every line). Rows are rebuilt whenever one of those statements changes.
+class UCACashFlow(models.Model):
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='uca_cash_flows')
+    balance_sheet = models.OneToOneField(BalanceSheet, on_delete=models.CASCADE, related_name='uca_cash_flow')
+    prior_balance_sheet = models.ForeignKey(BalanceSheet, on_delete=models.CASCADE, related_name='+')
+    period_ending_date = models.DateField()
+    months_in_period = models.IntegerField()
+
+    # Operating cash flow
+    net_sales = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_trade_receivables = models.DecimalField(max_digits=15, decimal_places=2)
+    cash_collected_from_sales = models.DecimalField(max_digits=15, decimal_places=2)
+    cost_of_goods_sold = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_inventory = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_trade_payables = models.DecimalField(max_digits=15, decimal_places=2)
+    cash_paid_to_suppliers = models.DecimalField(max_digits=15, decimal_places=2)
+    gross_cash_profit = models.DecimalField(max_digits=15, decimal_places=2)
+    operating_expenses = models.DecimalField(max_digits=15, decimal_places=2)
+    depreciation_and_amortization = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_prepaid_expenses = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_accruals = models.DecimalField(max_digits=15, decimal_places=2)
+    cash_paid_for_operating_costs = models.DecimalField(max_digits=15, decimal_places=2)
+    cash_after_operations = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_other_payables = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_revolving_lines = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_other_current_liabilities = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_other_current_assets = models.DecimalField(max_digits=15, decimal_places=2)
+    income_taxes = models.DecimalField(max_digits=15, decimal_places=2)
+    other_income_and_expenses = models.DecimalField(max_digits=15, decimal_places=2)
+    net_cash_after_operations = models.DecimalField(max_digits=15, decimal_places=2)
+
+    # Debt service
+    interest_paid = models.DecimalField(max_digits=15, decimal_places=2)
+    dividends_paid = models.DecimalField(max_digits=15, decimal_places=2)
+    cash_paid_for_interest_and_dividends = models.DecimalField(max_digits=15, decimal_places=2)
+    net_cash_income = models.DecimalField(max_digits=15, decimal_places=2)
+    prior_current_maturities = models.DecimalField(max_digits=15, decimal_places=2)
+    cash_after_debt_amortization = models.DecimalField(max_digits=15, decimal_places=2)
+
+    # Capital expenditures
+    intangible_asset_expenditures = models.DecimalField(max_digits=15, decimal_places=2)
+    fixed_asset_expenditures = models.DecimalField(max_digits=15, decimal_places=2)
+    financing_surplus = models.DecimalField(max_digits=15, decimal_places=2)
+
+    # External financing
+    change_in_long_term_debt = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_due_to_related_parties = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_due_from_related_parties = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_due_to_shareholders = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_due_from_shareholders = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_other_long_term_assets = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_other_long_term_liabilities = models.DecimalField(max_digits=15, decimal_places=2)
+    change_in_equity = models.DecimalField(max_digits=15, decimal_places=2)
+    total_external_financing = models.DecimalField(max_digits=15, decimal_places=2)
+    cash_after_financing = models.DecimalField(max_digits=15, decimal_places=2)
+
+    # Reconciliation
+    actual_change_in_cash = models.DecimalField(max_digits=15, decimal_places=2)
+    unexplained_change_in_cash = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'period_ending_date'], name='uca_business_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"UCA cash flow for {self.business} ending {self.period_ending_date}"
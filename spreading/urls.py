@@ -0,0 +1,10 @@
+from django.urls import path
+from .views import check_balance_sheet, export_spreads
+
+app_name = 'spreading'
+
+urlpatterns = [
+    path('export/<str:export_format>/', export_spreads, name='export'),
+    path('balance-sheets/balance-check/', check_balance_sheet, name='balance_check'),
+    path('balance-sheets/<uuid:balance_sheet_id>/balance-check/', check_balance_sheet, name='balance_check'),
+]
@@ -1,3 +1,71 @@
+import json
+
 from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import BadRequest, ValidationError
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from opnlend.exports import csv_lines
+from . import balance_check
+from .workbook_export import CSV_HEADERS, LAYOUTS, SPREAD_EXPORT_FORMATS, csv_rows, workbook_file
 
 # Create your views here.
+
+# Multi-period spreads (line items, totals and ratios) for one affiliate's businesses, or the whole
+# portfolio without ?affiliate=. Workbooks follow the Financial Spreading Model layout unless
+# ?layout=compact.
+@staff_member_required
+def export_spreads(request, export_format):
+    if export_format not in SPREAD_EXPORT_FORMATS:
+        raise BadRequest(f'Unknown export format {export_format!r}.')
+    layout = LAYOUTS.get(request.GET.get('layout', 'spreading_model'))
+    if layout is None:
+        raise BadRequest(f"Unknown layout {request.GET['layout']!r}.")
+    affiliate_id = request.GET.get('affiliate')
+    if affiliate_id is not None and not affiliate_id.isdigit():
+        raise BadRequest('affiliate must be an affiliate id.')
+
+    filename = f'spreads-{affiliate_id}' if affiliate_id else 'spreads'
+    if export_format == 'csv':
+        response = StreamingHttpResponse(csv_lines(CSV_HEADERS, csv_rows(affiliate_id)), content_type=SPREAD_EXPORT_FORMATS['csv'])
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+    return FileResponse(
+        workbook_file(affiliate_id, layout), as_attachment=True, filename=f'{filename}.xlsx',
+        content_type=SPREAD_EXPORT_FORMATS['xlsx'],
+    )
+
+
+def _amount(value):
+    return None if value is None else str(value)
+
+
+# Live balance check while a balance sheet is keyed. The client posts only the cells changed since
+# its last request, as JSON {"changes": {field: amount}}, and gets back the current unbalanced
+# amount, the totals those cells changed and hints for slide and transposition errors. Nothing is
+# saved; without a balance sheet id the check runs against a new, empty spread named by the
+# client's {"draft": id}. {"reset": true} starts the working copy over from the saved values.
+@staff_member_required
+@require_POST
+def check_balance_sheet(request, balance_sheet_id=None):
+    try:
+        body = json.loads(request.body or '{}')
+        changes = balance_check.clean_changes(body.get('changes', {}))
+        draft = None if balance_sheet_id else balance_check.clean_draft(body.get('draft'))
+    except (ValueError, AttributeError):
+        raise BadRequest('Expected a JSON object with "changes".')
+    except ValidationError as exc:
+        raise BadRequest(' '.join(exc.messages))
+    result = balance_check.check(request.user.pk, changes, balance_sheet_id, draft, body.get('reset') is True)
+    if result is None:
+        raise Http404('No such balance sheet.')
+    unbalanced, totals, hints, reset = result
+    return JsonResponse({
+        'unbalanced_amount': str(unbalanced),
+        'totals': {name: str(value) for name, value in totals.items()},
+        'hints': [
+            {**hint, 'entered': _amount(hint['entered']), 'suggested': _amount(hint['suggested'])}
+            for hint in hints
+        ],
+        'reset': reset,
+    })
@@ -0,0 +1,460 @@
+import tempfile
+from decimal import Decimal
+from itertools import groupby
+
+from opnlend.exports import EXPORT_CHUNK_SIZE
+from .chart_of_accounts import BALANCE_SHEET_CHART, INCOME_STATEMENT_CHART
+from .models import IncomeStatement, BalanceSheet
+from .ratios import COLUMNS, RATIOS, StatementMatrix, compute_ratios, row_ratios
+
+SPREAD_EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+# Statement columns exported for every period: each statement's line items and the stored totals
+# computed from them.
+INCOME_STATEMENT_FIELDS = ('months_in_period', *INCOME_STATEMENT_CHART.inputs, *INCOME_STATEMENT_CHART.totals)
+BALANCE_SHEET_FIELDS = (*BALANCE_SHEET_CHART.inputs, *BALANCE_SHEET_CHART.totals)
+PERIOD_FIELDS = ('business_id', 'entity_name', 'balance_sheet', 'period_ending_date', 'legal_entity_fiscal_year_end', 'financial_statement_quality')
+CSV_HEADERS = (*PERIOD_FIELDS, *INCOME_STATEMENT_FIELDS, *BALANCE_SHEET_FIELDS, *RATIOS)
+
+QUALITY_LABELS = dict(IncomeStatement.FINANCIAL_STATEMENT_QUALITY_CHOICES)
+
+AMOUNT_FORMAT = '#,##0.00;(#,##0.00)'
+PERCENT_FORMAT = '0.0%'
+RATIO_FORMAT = '0.00'
+DATE_FORMAT = 'mm/dd/yyyy'
+
+# Sheet layouts. Each sheet lists its rows from the top: (label, value), where the value is a
+# period field, a tuple of fields added together (a leading '-' subtracts, as in
+# spreading.chart_of_accounts), or None for headings and rows the models do not carry. The rows
+# follow `Financial Spreading Model.xlsx` row for row, so a relationship's export lines up with
+# the workbook analysts use (and with spreading.workbook_import's mapping). Every period takes
+# `period_step` columns from `first_column`: the amount, then (with a step of 2) its share of
+# the sheet's `percent_of` field.
+def header_rows(title):
+    return [
+        ('Financial Spreading Model', None),
+        (title, None),
+        ('Legal Entity Name:', 'entity_name'),
+        ("Legal Entity's Fiscal Year-End:", 'legal_entity_fiscal_year_end'),
+        ('Period Ending Date:', 'period_ending_date'),
+        ('Financial Statement Quality:', 'financial_statement_quality'),
+    ]
+
+
+INCOME_STATEMENT_ROWS = [
+    *header_rows('Income Statement'),
+    ('Months in Period:', 'months_in_period'),
+    ('Gross Profit', None),
+    ('Revenue (subtotal)', 'revenue_subtotal'),
+    ('Revenue', 'revenue_generic'),
+    ('User Defined Field', 'revenue_udf1'),
+    ('User Defined Field', 'revenue_udf2'),
+    ('User Defined Field', 'revenue_udf3'),
+    ('User Defined Field', 'revenue_udf4'),
+    ('Returns and Allowances (-)', 'returns_and_allowances'),
+    ('Net Revenue', 'net_revenue'),
+    ('Cost of Goods Sold (subtotal)', 'cogs_subtotal'),
+    ('Cost of Goods Sold: General', ('cost_of_goods_sold_generic', 'cost_of_goods_sold_udf1')),
+    ('Cost of Goods Sold: Depreciation', 'cost_of_goods_sold_depreciation'),
+    ('Total Gross Profit', 'total_gross_profit'),
+    ('Operating Expenses', None),
+    ('Salaries and Wages', 'salaries_and_wages'),
+    ("Officers' Compensation", 'officers_compensation'),
+    ('Repairs and Maintenance', 'repairs_and_maintenance'),
+    ('Bad Debt', 'bad_debt'),
+    ('Rent and Lease Expenses (subtotal)', 'rent_lease_expenses_subtotal'),
+    ('Real Estate Rent (Effects EBITDAR)', 'real_estate_rent'),
+    ('Real Estate Rent (No R.E. Refinance Scenario)', 'rent_and_lease_expense_udf1'),
+    ('Operating Leases', 'operating_leases'),
+    ('Taxes, Licenses, and Insurance (subtotal)', 'taxes_and_licenses_subtotal'),
+    ('   Real Estate Taxes', 'real_estate_taxes'),
+    ('   Payroll Taxes', 'payroll_taxes'),
+    ('Liability Insurance', None),
+    ('   Other Taxes and Licenses', 'other_taxes_and_licenses'),
+    ('Depreciation and Depletion', 'depreciation_and_depletion'),
+    ('Amortization', 'amortization'),
+    ('Legal and Professional Expenses', 'legal_and_professional_expenses'),
+    ('Employee Benefit Programs', 'employee_benefit_programs'),
+    ('Advertising', 'advertising'),
+    ('Other Operating Expenses (subtotal)', 'other_operating_expenses_subtotal'),
+    ('Other Operating Expenses (General)', 'other_operating_expenses_generic'),
+    ('User Defined Field', 'other_operating_expenses_udf1'),
+    ('User Defined Field', 'other_operating_expenses_udf2'),
+    ('User Defined Field', 'other_operating_expenses_udf3'),
+    ('User Defined Field', (
+        'other_operating_expenses_udf4', 'other_operating_expenses_udf5', 'other_operating_expenses_udf6',
+        'other_operating_expenses_udf7',
+    )),
+    ('Total Operating Expenses', 'total_operating_expenses'),
+    ('Net Operating Income', 'net_operating_income'),
+    ('Other Income and Expenses', None),
+    ('Gain on Sale of Asset (+)', 'gain_on_sale_of_asset'),
+    ('Loss on Sale of Asset (-)', 'loss_on_sale_of_asset'),
+    ('Interest Income (+)', 'interest_income'),
+    ('Interest Expense (-)', 'interest_expense'),
+    ('Other Income or Expenses (+ / -) (subtotal)', 'other_income_and_expenses_subtotal'),
+    ('Other Income or Expense (General)', 'other_income_or_expense_generic'),
+    ('User Defined Field', 'other_income_or_expense_udf1'),
+    ('User Defined Field', 'other_income_or_expense_udf2'),
+    ('User Defined Field', None),
+    ('User Defined Field', None),
+    ('Total Other Income and Expenses', 'total_other_income_and_expenses'),
+    ('Net Profit (Loss)', 'net_profit_loss'),
+    ('Taxes', None),
+    ('C-Corporation Taxes (-)', 'c_corporation_taxes'),
+    ('C-Corporation Tax Refund (Sch. M-1 Adjustment) (+)', 'c_corporation_tax_refund'),
+    ('Net Profit (Loss) After Taxes', 'net_profit_loss_after_taxes'),
+    ('Distributions to Shareholder(s) (-)', 'distributions_to_shareholders'),
+    ('Current Period Retained Earnings', 'current_period_retained_earnings'),
+]
+
+BALANCE_SHEET_ROWS = [
+    *header_rows('Balance Sheet'),
+    ('Months in Period:', 'months_in_period'),
+    ('Current Assets', None),
+    ('Cash (subtotal)', 'cash_subtotal'),
+    ('Cash at Financial Institution', 'cash_at_financial_institution'),
+    ('Cash at Other Financial Institution(s)', 'cash_at_other_financial_institution'),
+    ('Unclassified Cash Account(s)', 'unclassified_cash_account'),
+    ('Net Accounts Receivable (subtotal)', 'accounts_receivable_net'),
+    ('Accounts Receivable', 'accounts_receivable'),
+    ('Bad Debt Allowance (-)', 'bad_debt_allowance'),
+    ('Inventory (subtotal)', 'inventory_subtotal'),
+    ('Raw Material', 'raw_material'),
+    ('Work in Progress', 'work_in_progress'),
+    ('Finished Goods', 'finished_goods'),
+    ('Unclassified Inventory', 'inventory_generic'),
+    ('Prepaid Expenses', 'prepaid_expenses_generic'),
+    ('Prepaid Expenses (General)', 'prepaid_expenses_generic'),
+    ('User Defined Field', None),
+    ('User Defined Field', None),
+    ('Other Current Assets (subtotal)', 'other_current_assets_subtotal'),
+    ('Other Current Assets (General)', 'other_current_assets_generic'),
+    ('User Defined Field', 'other_current_assets_udf1'),
+    ('User Defined Field', 'other_current_assets_udf2'),
+    ('User Defined Field', 'other_current_assets_udf3'),
+    ('User Defined Field', None),
+    ('Total Current Assets', 'total_current_assets'),
+    ('Fixed Assets', None),
+    ('Gross Fixed Assets (subtotal)', 'gross_plant_and_equipment'),
+    ('Machinery and Equipment', 'machinery_and_equipment'),
+    ('Computers and Office Equipment', 'computers_and_office_equipment'),
+    ('Furniture and Fixtures', 'furniture_and_fixtures'),
+    ('Leasehold Improvements', 'leasehold_improvements'),
+    ('Construction in Progress', 'construction_in_progress'),
+    ('Building', 'building'),
+    ('Other Fixed Asset', 'other_gross_plant_and_equipment_subtotal'),
+    ('Accumulated Depreciation (-)', 'accumulated_depreciation'),
+    ('Net Fixed Assets', 'net_plant_and_equipment'),
+    ('Land', 'land'),
+    ('Total Fixed Assets', 'net_fixed_assets'),
+    ('Other Long-Term Assets', None),
+    ('Gross Intangible Assets (subtotal)', ('net_intangible_assets', '-accumulated_amortization')),
+    ('Goodwill', 'goodwill'),
+    ('Trademarks and Licenses', 'trademarks_and_licenses'),
+    ('Financing Costs', 'financing_costs'),
+    ('Other Intangible Assets', ('other_intangible_assets_udf1', 'other_intangible_assets_udf2', 'other_intangible_assets_udf3')),
+    ('Accumulated Amortization (-)', 'accumulated_amortization'),
+    ('Net Intangible Assets', 'net_intangible_assets'),
+    ('Due from Related Parties (subtotal)', 'due_from_related_parties_generic'),
+    ('Due from Related Parties (General)', 'due_from_related_parties_generic'),
+    ('User Defined Field', None),
+    ('User Defined Field', None),
+    ('User Defined Field', None),
+    ('User Defined Field', None),
+    ('Due from Shareholder(s)', 'due_from_shareholders_generic'),
+    ('Due from Shareholder(s) (General)', 'due_from_shareholders_generic'),
+    ('User Defined Field', None),
+    ('User Defined Field', None),
+    ('Other Long-Term Assets (subtotal)', 'other_long_term_assets_subtotal'),
+    ('Other Long-Term Assets (General)', 'other_long_term_assets_generic'),
+    ('User Defined Field', 'other_long_term_assets_udf1'),
+    ('User Defined Field', 'other_long_term_assets_udf2'),
+    ('User Defined Field', 'other_long_term_assets_udf3'),
+    ('User Defined Field', 'other_long_term_assets_udf4'),
+    ('Total Other Long-Term Assets', ('total_long_term_assets', '-net_fixed_assets')),
+    ('Total Assets', 'total_assets'),
+    ('Current Liabilities', None),
+    ('Accounts Payable (subtotal)', 'accounts_payable_subtotal'),
+    ('Trade Accounts', 'trade_accounts_payable'),
+    ('Other Accounts', 'other_accounts_payable'),
+    ('Current Portion of Long-Term Debt (subtotal)', 'current_portion_of_long_term_debt_subtotal'),
+    ('Current Portion of Long-Term Debt (General)', 'current_portion_of_long_term_debt_generic'),
+    ('User Defined Field', 'current_portion_of_long_term_debt_udf1'),
+    ('User Defined Field', ('current_portion_of_long_term_debt_udf2', 'current_portion_of_long_term_debt_udf3')),
+    ('Credit Cards and Other Lines of Credit (subtotal)', 'revolving_lines_subtotal'),
+    ('Revolving Line(s) of Credit (General)', ('revolving_lines_of_credit_generic', 'revolving_lines_generic', 'credit_cards_payable')),
+    ('User Defined Field', 'other_revolving_line_udf1'),
+    ('User Defined Field', 'other_revolving_line_udf2'),
+    ('User Defined Field', 'other_revolving_line_udf3'),
+    ('User Defined Field', 'other_revolving_line_udf4'),
+    ('Accruals (subtotal)', ('accruals_subtotal', 'customer_advances')),
+    ('Customer Advances', 'customer_advances'),
+    ('Other Accruals', 'accruals_subtotal'),
+    ('Other Current Liabilities (subtotal)', ('payroll_liabilities', 'taxes_payable', 'other_current_liabilities_subtotal')),
+    ('Payroll Liabilities', 'payroll_liabilities'),
+    ('Taxes Payable', 'taxes_payable'),
+    ('Other Current Liabilities (General)', 'other_current_liabilities_generic'),
+    ('User Defined Field', 'other_current_liabilities_udf1'),
+    ('User Defined Field', ('other_current_liabilities_udf2', 'other_current_liabilities_udf3')),
+    ('Total Current Liabilities', 'total_current_liabilities'),
+    ('Long-Term Liabilities', None),
+    ('Notes to be Refinanced (subtotal)', 'refinanced_long_term_debt_subtotal'),
+    ('User Defined Field', 'refianced_long_term_debt_generic'),
+    ('User Defined Field', 'refianced_long_term_debt_udf1'),
+    ('User Defined Field', 'refianced_long_term_debt_udf2'),
+    ('User Defined Field', 'refianced_long_term_debt_udf3'),
+    ('User Defined Field', (
+        'refianced_long_term_debt_udf4', 'refianced_long_term_debt_udf5', 'refianced_long_term_debt_udf6',
+        'refianced_long_term_debt_udf7',
+    )),
+    ('Other Long-Term Notes Payable (subtotal)', 'long_term_notes_payable_subtotal'),
+    ('Long-Term Notes Payable (General)', 'long_term_notes_payable_generic'),
+    ('User Defined Field', 'long_term_notes_payable_udf1'),
+    ('User Defined Field', 'long_term_notes_payable_udf2'),
+    ('User Defined Field', 'long_term_notes_payable_udf3'),
+    ('User Defined Field', 'long_term_notes_payable_udf4'),
+    ('Due to Related Party', 'due_to_others_subtotal'),
+    ('Due to Related Parties (General)', 'due_to_related_parties_generic'),
+    ('User Defined Field', 'due_to_related_parties_udf1'),
+    ('User Defined Field', ('due_to_related_parties_udf2', 'due_to_related_parties_udf3')),
+    ('Due to Shareholder(s)', 'due_to_shareholders_subtotal'),
+    ('Due to Shareholder(s) (General)', 'due_to_shareholders_generic'),
+    ('User Defined Field', 'due_to_shareholders_udf1'),
+    ('User Defined Field', ('due_to_shareholders_udf2', 'due_to_shareholders_udf3')),
+    ('Other Long-Term Liabilities (subtotal)', 'other_long_term_liabilities_subtotal'),
+    ('Other Long-Term Liabilities (General)', 'other_long_term_liabilities_generic'),
+    ('User Defined Field', 'other_long_term_liabilities_udf1'),
+    ('User Defined Field', 'other_long_term_liabilities_udf2'),
+    ('User Defined Field', 'other_long_term_liabilities_udf3'),
+    ('User Defined Field', 'other_long_term_liabilities_udf4'),
+    ('Total Long-Term Liabilities', 'total_long_term_liabilities'),
+    ('Total Liabilities', 'total_liabilities'),
+    ("Shareholders' Equity", None),
+    ('Paid in Capital', 'paid_in_capital'),
+    ('Retained Earnings (subtotal)', ('beginning_retained_earnings', 'current_period_retained_earnings')),
+    ("Beginning Retained Earning's", 'beginning_retained_earnings'),
+    ("Current Period's Net Income After Tax", 'net_profit_loss_after_taxes'),
+    ("Current Period's Distributions", 'distributions_to_shareholders'),
+    ('Other Adjustments to Equity (subtotal)', 'other_equity_subtotal'),
+    ('Projection Period Adjustment', 'other_equity_generic'),
+    ('User Defined Field', 'other_equity_udf1'),
+    ('User Defined Field', ('other_equity_udf2', 'other_equity_udf3', 'other_equity_udf4')),
+    ("Total Shareholders' Equity", 'total_shareholders_equity'),
+    ("Total Shareholders' Equity and Liabilities", 'total_shareholders_equity_and_total_liabilities'),
+    (None, None),
+    ('Current Unbalanced Amount', 'unbalanced_amount'),
+]
+
+FINANCIAL_RATIO_ROWS = [
+    *header_rows('Financial Ratio Analysis')[:5],
+    ('Liquidity', None),
+    ('Current Ratio', 'current_ratio'),
+    ('Quick Ratio', 'quick_ratio'),
+    ('Working Capital', ('total_current_assets', '-total_current_liabilities')),
+    ('Net Sales / Working Capital', None),
+    ('Leverage', None),
+    ('Net Worth', 'total_shareholders_equity'),
+    ('Tangible Net Worth', ('total_shareholders_equity', '-net_intangible_assets')),
+    ('Debt to Worth', 'debt_to_worth'),
+    ('Debt to Tangible Net Worth', None),
+    ('Coverage', None),
+    ('Interest Coverage', 'interest_coverage'),
+    ('EBIT', 'ebit'),
+    ('EBITDA', 'ebitda'),
+    ('Fixed Charge Coverage', None),
+    ('EBITDA / Debt Service', 'dscr'),
+    ('Profitability', None),
+    ('Return on Assets', 'return_on_assets'),
+    ('Return on Equity', 'return_on_equity'),
+    ('Gross Profit Margin', 'gross_margin'),
+    ('Operating Profit Margin', None),
+    ('Net Profit Margin', 'net_profit_margin'),
+    ('Activity', None),
+    ('Net Accounts Receivable Days', 'days_receivable'),
+    ('Account Payable Days', 'days_payable'),
+    ('Account Payable Days (Excluding Depreciation)', 'days_payable_excluding_depreciation'),
+    ('Net Sales / Net Fixed Assets', 'net_sales_to_net_fixed_assets'),
+    ('Growth', None),
+    ('Total Asset Growth', None),
+    ('Total Liabilities Growth', None),
+    ('Net Worth Growth', None),
+    ('Net Sales Growth', 'revenue_growth'),
+    ('Net Income Growth', 'net_profit_growth'),
+    ('Operating Profit Growth', 'operating_profit_growth'),
+    ('Cash Flow Metrics', None),
+    ('Net Sales Growth', None),
+    ('Gross Margin (Includes Depreciation) %', 'gross_margin'),
+    ('Operating Expenses (Excludes Depreciation)', 'total_operating_expenses'),
+    ('Accounts Receivable Days', 'days_receivable'),
+    ('Accounts Payable Days (Excludes Depreciation)', 'days_payable_excluding_depreciation'),
+    ('Accrued Expenses Days', None),
+]
+
+SPREADING_MODEL_LAYOUT = {
+    'first_column': 2,
+    'sheets': [
+        {
+            'title': 'Income Statement', 'rows': INCOME_STATEMENT_ROWS, 'period_step': 2,
+            'percent_of': 'revenue_subtotal', 'percent_label': '% of Revenue',
+        },
+        {
+            'title': 'Balance Sheet', 'rows': BALANCE_SHEET_ROWS, 'period_step': 2,
+            'percent_of': 'total_assets', 'percent_label': '% of Total',
+        },
+        {'title': 'Financial Ratio Analysis', 'rows': FINANCIAL_RATIO_ROWS, 'period_step': 1},
+    ],
+}
+
+# The same rows with one column per period and no percentages.
+COMPACT_LAYOUT = dict(SPREADING_MODEL_LAYOUT, sheets=[
+    dict(sheet, period_step=1) for sheet in SPREADING_MODEL_LAYOUT['sheets']
+])
+
+LAYOUTS = {
+    'spreading_model': SPREADING_MODEL_LAYOUT,
+    'compact': COMPACT_LAYOUT,
+}
+
+
+def spread_rows(affiliate_id=None):
+    # Every paired income statement and balance sheet period (of one affiliate's businesses, or
+    # of the whole portfolio) as a dict, through a server-side cursor. Ordered by business and
+    # period ending date, so each business's periods arrive together.
+    queryset = BalanceSheet.objects.filter(income_statement__isnull=False)
+    if affiliate_id is not None:
+        queryset = queryset.filter(business_name__affiliate_id=affiliate_id)
+    fields = (
+        'business_name_id', 'business_name__entity_name', 'uuid', 'period_ending_date',
+        'income_statement__legal_entity_fiscal_year_end', 'income_statement__financial_statement_quality',
+        *(f'income_statement__{name}' for name in INCOME_STATEMENT_FIELDS), *BALANCE_SHEET_FIELDS,
+    )
+    names = (*PERIOD_FIELDS, *INCOME_STATEMENT_FIELDS, *BALANCE_SHEET_FIELDS)
+    rows = (
+        queryset
+        .order_by('business_name__entity_name', 'business_name_id', 'period_ending_date')
+        .values_list(*fields)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for row in rows:
+        yield dict(zip(names, row))
+
+
+def _with_ratios(periods):
+    matrix = StatementMatrix.from_rows(
+        (period['balance_sheet'], period['business_id'], period['period_ending_date'], *(period[name] for name in COLUMNS))
+        for period in periods
+    )
+    ratios = compute_ratios(matrix)
+    for row, period in enumerate(periods):
+        period.update(row_ratios(ratios, row))
+
+
+def business_spreads(periods, batch_size=EXPORT_CHUNK_SIZE):
+    # Groups periods by business and adds each period's ratios, yielding one business's periods
+    # at a time. Ratios are computed for about `batch_size` periods per vectorized pass, and no
+    # more than that (or one business's periods) is held in memory.
+    batch, size = [], 0
+    for _, group in groupby(periods, key=lambda period: period['business_id']):
+        group = list(group)
+        batch.append(group)
+        size += len(group)
+        if size >= batch_size:
+            _with_ratios([period for group in batch for period in group])
+            yield from batch
+            batch, size = [], 0
+    if batch:
+        _with_ratios([period for group in batch for period in group])
+        yield from batch
+
+
+def _value(period, value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return period.get(value)
+    total = None
+    for term in value:
+        amount = period.get(term.lstrip('-'))
+        if amount is not None:
+            total = (total or 0) + (-amount if term.startswith('-') else amount)
+    return total
+
+
+def _cell(sheet, value, number_format=None):
+    from openpyxl.cell import WriteOnlyCell
+
+    cell = WriteOnlyCell(sheet, value=value)
+    if number_format:
+        cell.number_format = number_format
+    return cell
+
+
+def _number_format(value):
+    if isinstance(value, Decimal):
+        return AMOUNT_FORMAT
+    if isinstance(value, float):
+        return RATIO_FORMAT
+    if hasattr(value, 'isoformat'):
+        return DATE_FORMAT
+    return None
+
+
+def _sheet_rows(sheet, config, layout, periods):
+    # The rows of one business's block on one sheet.
+    step = config['period_step']
+    percent_of = config.get('percent_of')
+    for label, value in config['rows']:
+        cells = [label] + [None] * (layout['first_column'] - 2)
+        for period in periods:
+            amount = _value(period, value)
+            if value == 'financial_statement_quality':
+                amount = QUALITY_LABELS.get(amount, amount)
+            cells.append(_cell(sheet, amount, _number_format(amount)))
+            if step == 1:
+                continue
+            base = period.get(percent_of) if percent_of else None
+            if value == 'months_in_period' and percent_of:
+                cells.append(config['percent_label'])
+            elif isinstance(amount, Decimal) and base:
+                cells.append(_cell(sheet, float(amount / base), PERCENT_FORMAT))
+            else:
+                cells.append(None)
+            cells.extend([None] * (step - 2))
+        yield cells
+
+
+def write_workbook(file, affiliate_id=None, layout=SPREADING_MODEL_LAYOUT):
+    # Writes spreads to `file` as an .xlsx workbook with openpyxl's write-only (streaming) writer:
+    # one sheet per layout sheet, with each business's periods as a block of columns and the
+    # blocks one under another, separated by a blank row. Rows are written as the server-side
+    # cursor delivers them, so memory does not grow with the size of the portfolio.
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheets = [(workbook.create_sheet(config['title']), config) for config in layout['sheets']]
+    for number, periods in enumerate(business_spreads(spread_rows(affiliate_id))):
+        for sheet, config in sheets:
+            if number:
+                sheet.append([])
+            for cells in _sheet_rows(sheet, config, layout, periods):
+                sheet.append(cells)
+    workbook.save(file)
+
+
+def csv_rows(affiliate_id=None):
+    # One row per period in CSV_HEADERS order, for the CSV export.
+    for periods in business_spreads(spread_rows(affiliate_id)):
+        for period in periods:
+            yield [period.get(name) for name in CSV_HEADERS]
+
+
+def workbook_file(affiliate_id=None, layout=SPREADING_MODEL_LAYOUT):
+    # The workbook in a temporary file on disk, positioned at the start; closing it deletes it.
+    file = tempfile.TemporaryFile()
+    write_workbook(file, affiliate_id, layout)
+    file.seek(0)
+    return file
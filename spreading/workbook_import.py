@@ -0,0 +1,423 @@
+import copy
+import json
+import os
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from multiprocessing import Pool
+
+from django.db import transaction
+
+from relationships.models import Business, PartySearchIndex
+from relationships.search import normalize
+from .chart_of_accounts import BALANCE_SHEET_CHART, INCOME_STATEMENT_CHART
+from .models import GlobalStatement, IncomeStatement, BalanceSheet
+from . import retained_earnings
+
+# Workbooks parsed and loaded per bulk_load; the parent process holds at most this many parsed
+# workbooks at a time.
+LOAD_BATCH_SIZE = 50
+
+# Where things live in `Financial Spreading Model.xlsx`. Each period is a column pair (amount,
+# percentage) from B through AB; the header rows above the line items name the entity and date
+# each period. Line items are mapped by row number, since the labels repeat ('User Defined
+# Field'); rows mapped to the same field are added together. Rows not listed (subtotals, totals
+# and the workbook's own analysis blocks) are ignored, because the models compute those.
+WORKBOOK_MAPPING = {
+    'header_sheet': 'Income Statement',
+    'entity_name_cell': (3, 2),
+    'fiscal_year_end_cell': (4, 2),
+    'period_ending_date_row': 5,
+    'financial_statement_quality_row': 6,
+    'period_columns': list(range(2, 29, 2)),
+    'income_statement': {
+        'sheet': 'Income Statement',
+        'rows': {
+            10: 'revenue_generic',
+            11: 'revenue_udf1',
+            12: 'revenue_udf2',
+            13: 'revenue_udf3',
+            14: 'revenue_udf4',
+            15: 'returns_and_allowances',
+            18: 'cost_of_goods_sold_generic',
+            19: 'cost_of_goods_sold_depreciation',
+            22: 'salaries_and_wages',
+            23: 'officers_compensation',
+            24: 'repairs_and_maintenance',
+            25: 'bad_debt',
+            27: 'real_estate_rent',
+            28: 'rent_and_lease_expense_udf1',
+            29: 'operating_leases',
+            31: 'real_estate_taxes',
+            32: 'payroll_taxes',
+            33: 'other_taxes_and_licenses',
+            34: 'other_taxes_and_licenses',
+            35: 'depreciation_and_depletion',
+            36: 'amortization',
+            37: 'legal_and_professional_expenses',
+            38: 'employee_benefit_programs',
+            39: 'advertising',
+            41: 'other_operating_expenses_generic',
+            42: 'other_operating_expenses_udf1',
+            43: 'other_operating_expenses_udf2',
+            44: 'other_operating_expenses_udf3',
+            45: 'other_operating_expenses_udf4',
+            49: 'gain_on_sale_of_asset',
+            50: 'loss_on_sale_of_asset',
+            51: 'interest_income',
+            52: 'interest_expense',
+            54: 'other_income_or_expense_generic',
+            55: 'other_income_or_expense_udf1',
+            56: 'other_income_or_expense_udf2',
+            57: 'other_income_or_expense_generic',
+            58: 'other_income_or_expense_generic',
+            62: 'c_corporation_taxes',
+            63: 'c_corporation_tax_refund',
+            91: 'distributions_to_shareholders',
+        },
+    },
+    'balance_sheet': {
+        'sheet': 'Balance Sheet',
+        'rows': {
+            10: 'cash_at_financial_institution',
+            11: 'cash_at_other_financial_institution',
+            12: 'unclassified_cash_account',
+            14: 'accounts_receivable',
+            15: 'bad_debt_allowance',
+            17: 'raw_material',
+            18: 'work_in_progress',
+            19: 'finished_goods',
+            20: 'inventory_generic',
+            22: 'prepaid_expenses_generic',
+            23: 'prepaid_expenses_generic',
+            24: 'prepaid_expenses_generic',
+            26: 'other_current_assets_generic',
+            27: 'other_current_assets_udf1',
+            28: 'other_current_assets_udf2',
+            29: 'other_current_assets_udf3',
+            30: 'other_current_assets_generic',
+            34: 'machinery_and_equipment',
+            35: 'computers_and_office_equipment',
+            36: 'furniture_and_fixtures',
+            37: 'leasehold_improvements',
+            38: 'construction_in_progress',
+            39: 'building',
+            40: 'other_gross_plant_and_equipment_generic',
+            41: 'accumulated_depreciation',
+            43: 'land',
+            47: 'goodwill',
+            48: 'trademarks_and_licenses',
+            49: 'financing_costs',
+            50: 'other_intangible_assets_udf1',
+            51: 'accumulated_amortization',
+            54: 'due_from_related_parties_generic',
+            55: 'due_from_related_parties_generic',
+            56: 'due_from_related_parties_generic',
+            57: 'due_from_related_parties_generic',
+            58: 'due_from_related_parties_generic',
+            60: 'due_from_shareholders_generic',
+            61: 'due_from_shareholders_generic',
+            62: 'due_from_shareholders_generic',
+            64: 'other_long_term_assets_generic',
+            65: 'other_long_term_assets_udf1',
+            66: 'other_long_term_assets_udf2',
+            67: 'other_long_term_assets_udf3',
+            68: 'other_long_term_assets_udf4',
+            73: 'trade_accounts_payable',
+            74: 'other_accounts_payable',
+            76: 'current_portion_of_long_term_debt_generic',
+            77: 'current_portion_of_long_term_debt_udf1',
+            78: 'current_portion_of_long_term_debt_udf2',
+            80: 'revolving_lines_of_credit_generic',
+            81: 'other_revolving_line_udf1',
+            82: 'other_revolving_line_udf2',
+            83: 'other_revolving_line_udf3',
+            84: 'other_revolving_line_udf4',
+            86: 'customer_advances',
+            87: 'other_accruals_generic',
+            89: 'payroll_liabilities',
+            90: 'taxes_payable',
+            91: 'other_current_liabilities_generic',
+            92: 'other_current_liabilities_udf1',
+            93: 'other_current_liabilities_udf2',
+            97: 'refianced_long_term_debt_generic',
+            98: 'refianced_long_term_debt_udf1',
+            99: 'refianced_long_term_debt_udf2',
+            100: 'refianced_long_term_debt_udf3',
+            101: 'refianced_long_term_debt_udf4',
+            103: 'long_term_notes_payable_generic',
+            104: 'long_term_notes_payable_udf1',
+            105: 'long_term_notes_payable_udf2',
+            106: 'long_term_notes_payable_udf3',
+            107: 'long_term_notes_payable_udf4',
+            109: 'due_to_related_parties_generic',
+            110: 'due_to_related_parties_udf1',
+            111: 'due_to_related_parties_udf2',
+            113: 'due_to_shareholders_generic',
+            114: 'due_to_shareholders_udf1',
+            115: 'due_to_shareholders_udf2',
+            117: 'other_long_term_liabilities_generic',
+            118: 'other_long_term_liabilities_udf1',
+            119: 'other_long_term_liabilities_udf2',
+            120: 'other_long_term_liabilities_udf3',
+            121: 'other_long_term_liabilities_udf4',
+            125: 'paid_in_capital',
+            127: 'beginning_retained_earnings',
+            131: 'other_equity_generic',
+            132: 'other_equity_udf1',
+            133: 'other_equity_udf2',
+        },
+    },
+}
+
+STATEMENTS = (('income_statement', INCOME_STATEMENT_CHART), ('balance_sheet', BALANCE_SHEET_CHART))
+
+QUALITY_CODES = dict(IncomeStatement.FINANCIAL_STATEMENT_QUALITY_CHOICES)
+
+WorkbookResult = namedtuple('WorkbookResult', 'workbooks created errors')
+
+
+def _line_items(model, chart, amounts):
+    # A blank cell is a zero, except in the columns that allow an amount to be missing.
+    values = {name: Decimal(0) for name in chart.inputs if not model._meta.get_field(name).null}
+    values.update(amounts)
+    return values
+
+
+def load_mapping(path=None):
+    # The default mapping, with any keys in the JSON file at `path` replacing it. Row numbers in
+    # the file are JSON object keys, so they arrive as strings.
+    mapping = copy.deepcopy(WORKBOOK_MAPPING)
+    if path:
+        with open(path) as file:
+            overrides = json.load(file)
+        for key, value in overrides.items():
+            if key in dict(STATEMENTS):
+                value = dict(value, rows={int(row): field for row, field in value.get('rows', {}).items()})
+            mapping[key] = value
+    check_mapping(mapping)
+    return mapping
+
+
+def check_mapping(mapping):
+    for statement, chart in STATEMENTS:
+        unknown = set(mapping[statement]['rows'].values()) - set(chart.inputs)
+        if unknown:
+            raise ValueError(f"{statement} mapping names fields that are not line items: {', '.join(sorted(unknown))}")
+
+
+def _amount(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f'{value!r} is not an amount')
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'{value!r} is not an amount')
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str) and value.strip():
+        return date.fromisoformat(value.strip()[:10])
+    return None
+
+
+def _quality(value):
+    # Accepts a quality code ('TR') or its label ('Tax Returns').
+    value = str(value or '').strip()
+    if value.upper() in QUALITY_CODES:
+        return value.upper()
+    for code, label in QUALITY_CODES.items():
+        if normalize(label) == normalize(value):
+            return code
+    return None
+
+
+def _read_rows(sheet, last_row):
+    # Streams rows 1..last_row of a read-only worksheet as tuples of cell values.
+    return list(sheet.iter_rows(min_row=1, max_row=last_row, values_only=True))
+
+
+def _cell(rows, row, column):
+    values = rows[row - 1] if row <= len(rows) else ()
+    return values[column - 1] if column <= len(values) else None
+
+
+def parse_workbook(path, mapping=WORKBOOK_MAPPING):
+    # Reads one spreading workbook with openpyxl's read-only (streaming) parser, using the cached
+    # cell values rather than the formulas. Returns plain data, so it can cross a process
+    # boundary: {'path', 'entity_name', 'periods': [{'column', 'period_ending_date',
+    # 'financial_statement_quality', 'legal_entity_fiscal_year_end', 'income_statement':
+    # {field: amount}, 'balance_sheet': {field: amount}}], 'errors': [...]}. Period columns with
+    # no period ending date are empty and skipped.
+    from openpyxl import load_workbook
+
+    parsed = {'path': path, 'entity_name': None, 'periods': [], 'errors': []}
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header_rows = _read_rows(workbook[mapping['header_sheet']], max(
+            mapping['entity_name_cell'][0], mapping['fiscal_year_end_cell'][0],
+            mapping['period_ending_date_row'], mapping['financial_statement_quality_row'],
+        ))
+        parsed['entity_name'] = str(_cell(header_rows, *mapping['entity_name_cell']) or '').strip()
+        fiscal_year_end = _date(_cell(header_rows, *mapping['fiscal_year_end_cell']))
+
+        periods = {}
+        for column in mapping['period_columns']:
+            period_ending_date = _date(_cell(header_rows, mapping['period_ending_date_row'], column))
+            if period_ending_date:
+                periods[column] = {
+                    'column': column,
+                    'period_ending_date': period_ending_date,
+                    'legal_entity_fiscal_year_end': fiscal_year_end,
+                    'financial_statement_quality': _quality(_cell(header_rows, mapping['financial_statement_quality_row'], column)),
+                    'income_statement': {},
+                    'balance_sheet': {},
+                }
+
+        for statement, chart in STATEMENTS:
+            rows = mapping[statement]['rows']
+            sheet_rows = _read_rows(workbook[mapping[statement]['sheet']], max(rows))
+            for row, field in rows.items():
+                for column, period in periods.items():
+                    try:
+                        amount = _amount(_cell(sheet_rows, row, column))
+                    except ValueError as error:
+                        parsed['errors'].append(f"{mapping[statement]['sheet']} row {row}, period {period['period_ending_date']}: {error}")
+                        continue
+                    if amount is not None:
+                        values = period[statement]
+                        values[field] = values.get(field, 0) + amount
+    finally:
+        workbook.close()
+
+    if not parsed['entity_name']:
+        parsed['errors'].append('The workbook does not name its legal entity.')
+    if fiscal_year_end is None:
+        parsed['errors'].append("The workbook does not give the legal entity's fiscal year end.")
+    for period in periods.values():
+        if period['financial_statement_quality'] is None:
+            parsed['errors'].append(f"Period {period['period_ending_date']} has no recognized financial statement quality.")
+    parsed['periods'] = list(periods.values())
+    return parsed
+
+
+def _parse(args):
+    path, mapping = args
+    try:
+        return parse_workbook(path, mapping)
+    except Exception as error:
+        return {'path': path, 'entity_name': None, 'periods': [], 'errors': [f'Could not read the workbook: {error}']}
+
+
+def parse_workbooks(paths, mapping=WORKBOOK_MAPPING, workers=None):
+    # Parses workbooks in worker processes, yielding each one as it finishes. Workers hold one
+    # workbook at a time, so memory stays bounded however many paths are given.
+    workers = workers or os.cpu_count() or 1
+    tasks = [(path, mapping) for path in paths]
+    if workers == 1 or len(tasks) <= 1:
+        yield from map(_parse, tasks)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(_parse, tasks)
+
+
+def _businesses(entity_names):
+    # Businesses keyed by normalized entity name, found through the party search index. Names
+    # shared by more than one business are left out, since a workbook naming one of them cannot
+    # be placed.
+    names = {normalize(name) for name in entity_names}
+    documents = PartySearchIndex.objects.filter(party_type='BUSINESS', search_name__in=names).values_list('party_uuid', 'search_name')
+    keys = dict(documents)
+    matches = {}
+    for business in Business.objects.filter(uuid__in=keys).select_related('affiliate'):
+        key = keys[business.uuid]
+        matches[key] = None if key in matches else business
+    return matches
+
+
+@transaction.atomic
+def load_workbooks(parsed, user):
+    # Creates the statements for a batch of parsed workbooks: one global statement, income
+    # statement and balance sheet per period, all written through retained_earnings.bulk_load.
+    # Each period gets a new global statement for the business's affiliate and the individual on
+    # its most recent existing one. Periods the business already has are skipped, so re-running
+    # an import is harmless. Returns (periods created, errors).
+    errors = []
+    businesses = _businesses(workbook['entity_name'] for workbook in parsed if workbook['entity_name'])
+    individuals = dict(
+        GlobalStatement.objects
+        .filter(entity__in=[business for business in businesses.values() if business])
+        .order_by('entity_id', 'pk')
+        .values_list('entity_id', 'individual_id')
+    )
+    existing = set(
+        IncomeStatement.objects
+        .filter(business_name__in=[business for business in businesses.values() if business])
+        .values_list('business_name_id', 'period_ending_date')
+    )
+
+    global_statements, income_statements, balance_sheets = [], [], []
+    for workbook in parsed:
+        if workbook['errors']:
+            errors.extend(f"{workbook['path']}: {error}" for error in workbook['errors'])
+            continue
+        business = businesses.get(normalize(workbook['entity_name']))
+        if business is None:
+            errors.append(f"{workbook['path']}: no single business is named {workbook['entity_name']!r}.")
+            continue
+        if business.pk not in individuals:
+            errors.append(f"{workbook['path']}: {business.entity_name} has no global statement to take an individual from.")
+            continue
+        for period in workbook['periods']:
+            if (business.pk, period['period_ending_date']) in existing:
+                errors.append(f"{workbook['path']}: {business.entity_name} already has a spread for {period['period_ending_date']}.")
+                continue
+            existing.add((business.pk, period['period_ending_date']))
+            global_statement = GlobalStatement(affiliate=business.affiliate, entity=business, individual_id=individuals[business.pk])
+            income_statement = IncomeStatement(
+                global_statement=global_statement,
+                user=user,
+                business_name=business,
+                legal_entity_fiscal_year_end=period['legal_entity_fiscal_year_end'],
+                period_ending_date=period['period_ending_date'],
+                financial_statement_quality=period['financial_statement_quality'],
+                **_line_items(IncomeStatement, INCOME_STATEMENT_CHART, period['income_statement']),
+            )
+            balance_sheet = BalanceSheet(
+                income_statement=income_statement,
+                global_statement=global_statement,
+                business_name=business,
+                **_line_items(BalanceSheet, BALANCE_SHEET_CHART, period['balance_sheet']),
+            )
+            global_statements.append(global_statement)
+            income_statements.append(income_statement)
+            balance_sheets.append(balance_sheet)
+
+    GlobalStatement.objects.bulk_create(global_statements, batch_size=retained_earnings.BULK_BATCH_SIZE)
+    retained_earnings.bulk_load(income_statements, balance_sheets)
+    return len(income_statements), errors
+
+
+def import_workbooks(paths, user, mapping=WORKBOOK_MAPPING, workers=None, batch_size=LOAD_BATCH_SIZE):
+    # Imports legacy spreading workbooks: parses them in parallel and loads them in batches of
+    # `batch_size` workbooks as the parsed results arrive.
+    created, errors, batch = 0, [], []
+    paths = list(paths)
+    for workbook in parse_workbooks(paths, mapping, workers):
+        batch.append(workbook)
+        if len(batch) >= batch_size:
+            batch_created, batch_errors = load_workbooks(batch, user)
+            created += batch_created
+            errors.extend(batch_errors)
+            batch = []
+    if batch:
+        batch_created, batch_errors = load_workbooks(batch, user)
+        created += batch_created
+        errors.extend(batch_errors)
+    return WorkbookResult(len(paths), created, errors)